@@ -0,0 +1,185 @@
+"""Microbenchmark for number_to_numerology.
+
+Run with ``python -m benchmarks.numerology``.
+"""
+
+import os
+import random
+import re
+import tempfile
+import timeit
+
+from src import numerology
+from src.numerology import COUNTDOWN, COUNTUP, PI, number_to_numerology
+
+PI_REGEX_PATTERN = "|".join(PI[:x] for x in range(len(PI) + 1, 3 - 1, -1))
+COUNTDOWN_REGEX_PATTEN = "|".join(
+    COUNTDOWN[-n:] for n in range(len(COUNTDOWN), 3 - 1, -1)
+)
+COUNTUP_REGEX_PATTEN = "|".join(
+    reversed(list(COUNTUP[:n] for n in range(3, len(COUNTDOWN) + 1)))
+)
+
+LEGACY_REGEX = re.compile(
+    "|".join(
+        (
+            COUNTDOWN_REGEX_PATTEN,
+            COUNTUP_REGEX_PATTEN,
+            r"(?:10)+|11|21|33|69|73|88|420|666|777|1776|1867|30057|9653|[68]00[68]",
+            PI_REGEX_PATTERN,
+        )
+    )
+)
+
+AMOUNTS = [
+    1,
+    2,
+    21,
+    69,
+    100,
+    420,
+    1000,
+    1234,
+    2222,
+    5000,
+    6969,
+    10000,
+    21000,
+    31415,
+    33333,
+    54321,
+    101010,
+    250000,
+    696969,
+    1000000,
+]
+
+
+def legacy_number_to_numerology(number: int) -> str:
+    # The if-chain implementation this module is benchmarked against.
+    results = []
+
+    number_str = str(number)
+
+    matches = LEGACY_REGEX.findall(number_str)
+
+    if re.match(r"^1+$", number_str):
+        for _ in range(len(number_str)):
+            results.append("🍆")
+
+    elif re.search(r"^2+$", number_str):
+        for _ in range(len(number_str)):
+            results.append("🦆")
+
+    else:
+        for match in matches:
+            if re.search(r"(?:10)+", match):
+                for _ in range(len(match) // 2):
+                    results.append("🎳")
+                for _ in range(len(match) // 2 - 3 + 1):
+                    results.append("🦃")
+            for fixed, emoji in (
+                ("11", "🎲"),
+                ("21", "🪙"),
+                ("33", "✨"),
+                ("69", "💋"),
+                ("73", "👋"),
+                ("88", "🥰"),
+                ("420", "✌👽💨"),
+                ("666", "😈"),
+                ("777", "😇"),
+                ("1776", "🇺🇸"),
+                ("1867", "🇨🇦"),
+                ("9653", "🐺"),
+                ("30057", "🔁"),
+            ):
+                if match == fixed:
+                    results.append(emoji)
+            if re.search(r"[68]00[68]", match):
+                results.append("🎱")
+                results.append("🎱")
+            if re.search(PI_REGEX_PATTERN, match):
+                for _ in range(len(match) - 2):
+                    results.append("🥧")
+            if re.search(COUNTDOWN_REGEX_PATTEN, match):
+                for _ in range(len(match) - 2):
+                    results.append("💥")
+            if re.search(COUNTUP_REGEX_PATTEN, match):
+                for _ in range(len(match) - 2):
+                    results.append("🧛")
+
+    if number >= 100000:
+        results.append("🔥")
+    if number >= 50000:
+        results.append("🔥")
+    if number >= 10000:
+        results.append("🔥")
+    if number < 10:
+        results.append("💩")
+
+    return "".join(results)
+
+
+def bench(func, number=2000, setup=None):
+    # setup runs before every pass, so a cache it clears is always cold.
+    seconds = sum(
+        timeit.repeat(
+            lambda: [func(x) for x in AMOUNTS],
+            setup=setup or (lambda: None),
+            repeat=number,
+            number=1,
+        )
+    )
+    return seconds / (number * len(AMOUNTS)) * 1e6
+
+
+def main():
+    for amount in range(0, 200000):
+        assert number_to_numerology(amount) == legacy_number_to_numerology(amount)
+
+    # The same 20 amounts every pass would otherwise be measuring lru_cache
+    # hits rather than matching.
+    cache_clear = numerology.load_rules(None)._digits.cache_clear
+    legacy = bench(legacy_number_to_numerology)
+    current = bench(number_to_numerology, setup=cache_clear)
+    print(f"legacy:  {legacy:.2f} us/call")
+    print(f"current: {current:.2f} us/call")
+    print(f"speedup: {legacy / current:.1f}x")
+
+    week = AMOUNTS * 500
+    seconds = sum(
+        timeit.repeat(
+            lambda: numerology.number_to_numerology_many(week),
+            setup=cache_clear,
+            repeat=10,
+            number=1,
+        )
+    )
+    print(f"many:    {seconds / (10 * len(week)) * 1e6:.2f} us/amount")
+
+    # Uncached matching cost should stay flat as the rule set grows.
+    generator = random.Random(0)
+    for extra in (0, 100, 1000):
+        config = dict(numerology.DEFAULT_RULES)
+        config["rules"] = numerology.DEFAULT_RULES["rules"] + [
+            {"patterns": [str(generator.randrange(1000, 10**8))], "emoji": "🤡"}
+            for _ in range(extra)
+        ]
+        start = timeit.default_timer()
+        rules = numerology.RuleSet(config)
+        compiled = timeit.default_timer() - start
+        match = bench(lambda x: rules._digits_to_numerology(str(x)))
+        print(
+            f"rules+{extra}: compile {compiled * 1e3:.1f} ms, match {match:.2f} us/call"
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "numerology.table")
+        numerology.build_table(path, max(AMOUNTS) + 1)
+        table = numerology.NumerologyTable(path)
+        print(f"table:   {bench(table.get):.2f} us/call")
+        table.close()
+
+
+if __name__ == "__main__":
+    main()
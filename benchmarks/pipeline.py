@@ -0,0 +1,55 @@
+"""Throughput of the shared ingestion pipeline over a replayed invoice stream.
+
+Run with ``python -m benchmarks.pipeline [count]``.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from src.boosts import dispatch, subscribe_boosts
+from src.replay import ReplayLNDClient, boost_invoice
+
+
+def write_invoices(path, count):
+    with open(path, "w") as f:
+        for n in range(count):
+            data = dict(
+                action="boost",
+                app_name="Fountain",
+                sender_name=f"sender{n % 50}",
+                podcast="Boost Bots",
+                message="Great show!",
+                value_msat_total=(n % 5000 + 1) * 1000,
+            )
+            f.write(json.dumps(boost_invoice(data, n % 5000 + 1)) + "\n")
+
+
+async def run(lnd, sinks):
+    start = time.perf_counter()
+    await dispatch(subscribe_boosts(lnd), sinks)
+    return time.perf_counter() - start
+
+
+def main(count=20000):
+    received = []
+
+    async def sink(boost):
+        received.append(boost.value)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "invoices.jsonl")
+        write_invoices(path, count)
+        lnd = ReplayLNDClient(path)
+        seconds = asyncio.run(run(lnd, [sink, sink, sink, sink]))
+
+    assert len(received) == 4 * count
+    print(f"{count} boosts x 4 sinks in {seconds:.2f}s")
+    print(f"{count / seconds:.0f} boosts/s")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,143 @@
+"""Microbenchmark for rendering a boost for every bot.
+
+Run with ``python -m benchmarks.rendering``.
+"""
+
+import datetime
+import timeit
+
+from src.boosts import Boost
+from src.numerology import number_to_numerology
+from src.rendering import Renderer, _get
+from tests.test_rendering import ALL, PARTS
+
+AMOUNTS = [21, 1234, 6969, 33333]
+
+
+def _sanitize(message):
+    if isinstance(message, str):
+        if r"\\u" in repr(message):
+            message = (
+                message.encode("ascii")
+                .decode("unicode-escape")
+                .encode("utf-16", "surrogatepass")
+                .decode("utf-16")
+            )
+        return message.replace("\n", "")
+    return message
+
+
+def _one_line(numerology, podcast, episode, sender, amount, message, ts, app):
+    data = ""
+    if numerology:
+        data += numerology + " "
+    if podcast:
+        data += podcast + " "
+    if episode:
+        data += episode + " "
+    if sender:
+        data += sender + " "
+    data += f"boosted {amount}"
+    if message:
+        data += " " + message
+    if ts:
+        data += " " + ts
+    if app:
+        data += " " + app
+    return data
+
+
+def legacy_irc(data, value):
+    return _one_line(
+        number_to_numerology(value),
+        _sanitize(_get(data, "podcast", "\x02[{podcast}]\x02")),
+        _sanitize(_get(data, "episode", "\x02[{episode}]\x02")),
+        _sanitize(_get(data, "sender_name", default="Anonymous")),
+        f"\x02\u200b{value}\x02 sats",
+        _sanitize(_get(data, "message", 'saying "\x02{message}\x02"')),
+        _get(data, "ts", lambda _, v: "@{}".format(datetime.timedelta(seconds=int(v)))),
+        _sanitize(_get(data, "app_name", "via {app_name}")),
+    )
+
+
+def legacy_matrix(data, value):
+    return _one_line(
+        number_to_numerology(value),
+        _get(data, "podcast", "[{podcast}]"),
+        _get(data, "episode", "[{episode}]"),
+        _get(data, "sender_name", default="Anonymous"),
+        f"{value} sats",
+        _get(data, "message", 'saying "{message}"'),
+        _get(data, "ts", lambda _, v: "@{}".format(datetime.timedelta(seconds=int(v)))),
+        _get(data, "app_name", "via {app_name}"),
+    )
+
+
+def legacy_status(data, value):
+    # Built the same way by the Mastodon and Nostr bots.
+    sender = data.get("sender_name", "Anonymous")
+    numerology = number_to_numerology(value)
+    message = ""
+    if "podcast" in data and data["podcast"]:
+        message += data["podcast"]
+    if "episode" in data and data["episode"]:
+        message += f" {data['episode']}"
+    if "ts" in data and data["ts"]:
+        message += "@ {}".format(datetime.timedelta(seconds=int(data["ts"])))
+    message += "\n\n"
+    message += f"{numerology} {sender} boosted {value} sats"
+    message += "\n\n"
+    if "message" in data and data["message"]:
+        message += f"\"{data['message'].strip()}\""
+        message += "\n\n"
+    message += "via {}".format(data.get("app_name", "Unknown"))
+    return message
+
+
+def legacy(boost):
+    # Each of the four bots rendered its own message.
+    legacy_irc(boost.data, boost.value)
+    legacy_matrix(boost.data, boost.value)
+    legacy_status(boost.data, boost.value)
+    legacy_status(boost.data, boost.value)
+
+
+def bench(func, boosts, number=2000, repeat=5):
+    # The best of a few passes, so a busy machine doesn't skew either side.
+    seconds = min(
+        timeit.repeat(
+            lambda: [func(boost) for boost in boosts], number=number, repeat=repeat
+        )
+    )
+    return seconds / (number * len(boosts)) * 1e6
+
+
+def main():
+    # The boosts the rendering tests check, at a few amounts.
+    boosts = [Boost(data, value, None) for data in [ALL, *PARTS] for value in AMOUNTS]
+
+    renderer = Renderer()
+    for boost in boosts:
+        rendered = renderer.render(boost)
+        assert rendered.irc == legacy_irc(boost.data, boost.value)
+        assert rendered.matrix == legacy_matrix(boost.data, boost.value)
+        assert rendered.status == legacy_status(boost.data, boost.value)
+
+    renderer = Renderer(cache_size=1)
+
+    def current(boost):
+        # Every bot is handed the same boost; the first renders it, Matrix
+        # HTML and the digest line included, which the legacy bots never
+        # did.
+        for _ in range(4):
+            renderer.render(boost)
+
+    before = bench(legacy, boosts)
+    after = bench(current, boosts)
+    print(f"legacy:  {before:.2f} us/boost for 4 bots")
+    print(f"current: {after:.2f} us/boost for 4 bots")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import asyncio
+import functools
+import importlib
+import logging
+
+import click
+
+from ..boosts import Overflow, dispatch, subscribe_boosts
+from ..checkpoint import Checkpoint
+from ..leaderboard import LeaderboardStore
+from ..numerology import load_rules, load_table
+from ..replay import lnd_client
+
+SINKS = ("irc", "mastodon", "matrix", "nostr")
+
+
+def async_cmd(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return asyncio.run(func(*args, **kwargs))
+
+    return wrapper
+
+
+@click.command()
+@click.option("--lnd-host", default="127.0.0.1")
+@click.option("--lnd-port", type=click.IntRange(0), default=10009)
+@click.option(
+    "--lnd-macaroon", type=click.Path(exists=True), default="readonly.macaroon"
+)
+@click.option("--lnd-tlscert", type=click.Path(exists=True), default="tls.cert")
+@click.option("--lnd-replay", type=click.Path(exists=True, dir_okay=False))
+@click.option("--lnd-replay-rate", type=click.FloatRange(0), default=0)
+@click.option("--lnd-replay-burst", type=click.IntRange(1), default=1)
+@click.option("--lnd-checkpoint", type=click.Path(dir_okay=False))
+@click.option("--sink", type=click.Choice(SINKS), multiple=True, required=True)
+@click.option("--irc-host", default="irc.zeronode.net")
+@click.option("--irc-port", type=int, default=6697)
+@click.option("--irc-ssl", type=bool, default=True)
+@click.option("--irc-password")
+@click.option("--irc-nick", default="boostirc")
+@click.option("--irc-channel", default=["#boostirc"], multiple=True)
+@click.option(
+    "--irc-channel-map",
+    type=(str, click.Choice(["podcast", "feedId", "url", "guid"]), str),
+    multiple=True,
+)
+@click.option("--irc-realname", default="Boost IRC Bot")
+@click.option("--irc-nick-password")
+@click.option("--irc-rate", type=click.FloatRange(0, min_open=True), default=1)
+@click.option("--irc-burst", type=click.IntRange(1), default=5)
+@click.option("--irc-target-rate", type=click.FloatRange(0, min_open=True), default=0.5)
+@click.option("--irc-target-burst", type=click.IntRange(1), default=3)
+@click.option("--irc-buffer-size", type=click.IntRange(1), default=1000)
+@click.option("--irc-networks", type=click.Path(exists=True, dir_okay=False))
+@click.option("--mastodon-instance")
+@click.option("--mastodon-access-token")
+@click.option("--mastodon-reserve", type=click.IntRange(0), default=30)
+@click.option("--mastodon-digest-below", type=click.IntRange(0), default=1000)
+@click.option("--mastodon-digest-delay", type=click.FloatRange(0), default=300)
+@click.option("--matrix-server", default="https://matrix.example.org")
+@click.option("--matrix-user")
+@click.option("--matrix-password")
+@click.option("--matrix-room-id", multiple=True)
+@click.option("--matrix-session", type=click.Path(dir_okay=False))
+@click.option("--nostr-private-key")
+@click.option("--nostr-relay", multiple=True)
+@click.option("--nostr-quorum", type=click.IntRange(1), default=2)
+@click.option("--leaderboard-db", type=click.Path(dir_okay=False))
+@click.option("--minimum-donation", type=int)
+@click.option("--queue-size", type=click.IntRange(1), default=100)
+@click.option(
+    "--queue-overflow", type=click.Choice([x.value for x in Overflow]), default="block"
+)
+@click.option("--numerology-rules", type=click.Path(exists=True, dir_okay=False))
+@click.option("--numerology-table", type=click.Path(exists=True, dir_okay=False))
+@click.option("--allowed-name", multiple=True)
+@click.option("-v", "--verbose", is_flag=True, help="Enables verbose mode")
+@click.pass_context
+@async_cmd
+async def cli(
+    ctx,
+    lnd_host,
+    lnd_port,
+    lnd_macaroon,
+    lnd_tlscert,
+    lnd_replay,
+    lnd_replay_rate,
+    lnd_replay_burst,
+    lnd_checkpoint,
+    sink,
+    leaderboard_db,
+    minimum_donation,
+    queue_size,
+    queue_overflow,
+    numerology_rules,
+    numerology_table,
+    allowed_name,
+    verbose,
+    **options,
+):
+    ctx.ensure_object(dict)
+
+    logging.getLogger().setLevel(logging.DEBUG if verbose else logging.INFO)
+
+    load_rules(numerology_rules)
+    load_table(numerology_table)
+
+    if "matrix" in sink:
+        for option in ("matrix_user", "matrix_password", "matrix_room_id"):
+            if not options[option]:
+                raise click.UsageError(
+                    f"--{option.replace('_', '-')} is required for the matrix sink"
+                )
+
+    sinks = []
+    for name in SINKS:
+        if name not in sink:
+            continue
+        # Sink packages pull in their optional dependencies on import.
+        module = importlib.import_module(f"..{name}", __name__)
+        sinks.append(
+            await module.create_sink(
+                **{k: v for k, v in options.items() if k.startswith(f"{name}_")}
+            )
+        )
+        logging.info(f"Started {name} sink")
+
+    if leaderboard_db:
+        sinks.append(LeaderboardStore(leaderboard_db))
+
+    async_lnd = lnd_client(
+        lnd_host,
+        lnd_port,
+        lnd_macaroon,
+        lnd_tlscert,
+        lnd_replay,
+        lnd_replay_rate,
+        lnd_replay_burst,
+    )
+
+    checkpoint = Checkpoint(lnd_checkpoint) if lnd_checkpoint else None
+    boosts = subscribe_boosts(async_lnd, allowed_name, minimum_donation, checkpoint)
+    await dispatch(boosts, sinks, queue_size, Overflow(queue_overflow), checkpoint)
@@ -0,0 +1,359 @@
+import asyncio
+import collections
+import json
+import logging
+import typing
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+import grpc
+from lndgrpc.aio.async_client import ln
+
+from .checkpoint import Checkpoint
+
+# TLV record type carrying podcast boostagram metadata (bLIP-10).
+PODCAST_TLV = 7629169
+
+INVOICE_SETTLED = ln.Invoice.InvoiceState.Value("SETTLED")
+HTLC_SETTLED = ln.InvoiceHTLCState.Value("SETTLED")
+
+
+class Boost(typing.NamedTuple):
+    data: dict
+    value: int
+    invoice: Any
+
+
+# A sink that finishes delivering a boost later, as the Mastodon digest
+# does, returns a future that is resolved once it has.
+Sink = Callable[[Boost], Awaitable[Optional[asyncio.Future]]]
+
+
+def _decode(record, invoice) -> Optional[Boost]:
+    data = json.loads(record)
+
+    if "action" not in data or str(data["action"]).lower() != "boost":
+        return None
+
+    value = int(data.get("value_msat_total", 0)) // 1000
+    if not value:
+        value = invoice.value
+
+    return Boost(data, value, invoice)
+
+
+def decode_boosts(
+    invoice,
+    allowed_name: Iterable[str] = (),
+    minimum_donation: Optional[int] = None,
+) -> Iterable[Boost]:
+    if invoice.state != INVOICE_SETTLED:
+        return
+
+    allowed_name = {x.lower() for x in allowed_name}
+
+    # The shards of a multi-part payment each carry the same record, so
+    # they are decoded and yielded once.
+    records = []
+    for htlc in invoice.htlcs:
+        if htlc.state != HTLC_SETTLED:
+            continue
+        record = htlc.custom_records.get(PODCAST_TLV)
+        if record is not None and record not in records:
+            records.append(record)
+
+    for record in records:
+        try:
+            boost = _decode(record, invoice)
+        except Exception as exception:
+            logging.exception(exception)
+            continue
+
+        if boost is None:
+            continue
+
+        if allowed_name:
+            name = boost.data.get("name")
+            if not name or name.lower() not in allowed_name:
+                continue
+
+        if minimum_donation is not None and boost.value < minimum_donation:
+            logging.debug("Donation too low, skipping %s", boost.data)
+            continue
+
+        yield boost
+
+
+async def subscribe_boosts(
+    async_lnd,
+    allowed_name: Iterable[str] = (),
+    minimum_donation: Optional[int] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    max_retry_delay: float = 60,
+) -> AsyncIterator[Boost]:
+    retry_delay = 1
+    last_settle_index = checkpoint.settle_index if checkpoint else 0
+    while True:
+        settle_index = checkpoint.settle_index if checkpoint else last_settle_index
+        try:
+            async for invoice in async_lnd.subscribe_invoices(
+                settle_index=settle_index or None
+            ):
+                retry_delay = 1
+                # Only act on settlement, and only once per invoice even if
+                # LND emits it again (settle indexes only ever increase).
+                if invoice.state != INVOICE_SETTLED:
+                    continue
+                if invoice.settle_index <= last_settle_index:
+                    continue
+                last_settle_index = invoice.settle_index
+                for boost in decode_boosts(invoice, allowed_name, minimum_donation):
+                    yield boost
+                if checkpoint is not None:
+                    checkpoint.received(invoice.settle_index)
+            return
+        except grpc.RpcError as exception:
+            logging.warning(
+                f"Invoice subscription dropped ({exception}), "
+                f"resubscribing from settle index {settle_index} in {retry_delay}s"
+            )
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, max_retry_delay)
+
+
+async def list_invoices(
+    async_lnd,
+    creation_date_start: int = 0,
+    creation_date_end: int = 0,
+    index_offset: int = 0,
+    page_size: int = 100,
+    concurrency: int = 4,
+    prefetch: int = 2,
+) -> AsyncIterator[Any]:
+    """Every invoice created in the given window (unix seconds, inclusive)
+    after ``index_offset``.
+
+    With both bounds the window is split into ``concurrency`` slices that
+    are paged at the same time, each keeping up to ``prefetch`` pages ahead
+    of the caller. Slices are yielded oldest first. The node filters by
+    creation date, so nothing outside the window is sent.
+    """
+    bounds = [(creation_date_start, creation_date_end)]
+    if creation_date_start and creation_date_end > creation_date_start:
+        step = -(-(creation_date_end - creation_date_start + 1) // concurrency)
+        bounds = [
+            (start, min(start + step - 1, creation_date_end))
+            for start in range(creation_date_start, creation_date_end + 1, step)
+        ]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(pages: asyncio.Queue, start: int, end: int) -> None:
+        offset = index_offset
+        try:
+            while True:
+                async with semaphore:
+                    response = await async_lnd._ln_stub.ListInvoices(
+                        ln.ListInvoiceRequest(
+                            index_offset=offset,
+                            num_max_invoices=page_size,
+                            creation_date_start=start,
+                            creation_date_end=end,
+                        )
+                    )
+                await pages.put(response.invoices)
+                # The node only returns a short page once it has run out.
+                if len(response.invoices) < page_size:
+                    break
+                offset = response.last_index_offset
+            await pages.put(None)
+        except Exception as exception:
+            await pages.put(exception)
+
+    slices = [asyncio.Queue(max(1, prefetch)) for _ in bounds]
+    tasks = [
+        asyncio.ensure_future(fetch(pages, start, end))
+        for pages, (start, end) in zip(slices, bounds)
+    ]
+    try:
+        for pages in slices:
+            while True:
+                invoices = await pages.get()
+                if invoices is None:
+                    break
+                if isinstance(invoices, Exception):
+                    raise invoices
+                for invoice in invoices:
+                    yield invoice
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _deliver(sink: Sink, boost: Boost) -> Optional[asyncio.Future]:
+    try:
+        return await sink(boost)
+    except Exception as exception:
+        logging.exception(exception)
+        return None
+
+
+class Overflow(Enum):
+    Block = "block"
+    DropOldest = "drop-oldest"
+    Coalesce = "coalesce"
+
+
+class SinkQueue:
+    """A bounded queue of boosts drained by one worker task for one sink.
+
+    When the queue is full, ``put`` waits (block), discards the oldest
+    entry (drop-oldest), or appends to the newest entry (coalesce). Coalesced
+    entries go to ``sink.send_many`` when the sink has one, or are sent one
+    by one otherwise.
+
+    A batch is released from the checkpoint once the sink is done with it,
+    or once the futures the sink returned for it are resolved.
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        maxsize: int = 100,
+        overflow=Overflow.Block,
+        checkpoint: Optional[Checkpoint] = None,
+    ):
+        self.sink = sink
+        self.name = getattr(sink, "__module__", None) or repr(sink)
+        self.maxsize = max(1, maxsize)
+        self.overflow = Overflow(overflow)
+        self.checkpoint = checkpoint
+        self.dropped = 0
+        self.coalesced = 0
+        self._batches = collections.deque()
+        self._busy = False
+        self._delivering = []  # type: typing.List[typing.Tuple[list, list]]
+        self._condition = asyncio.Condition()
+        self._worker = None
+
+    @property
+    def depth(self) -> int:
+        return sum(len(batch) for batch in self._batches)
+
+    async def put(self, boost: Boost) -> None:
+        async with self._condition:
+            if len(self._batches) >= self.maxsize:
+                if self.overflow is Overflow.Block:
+                    await self._condition.wait_for(
+                        lambda: len(self._batches) < self.maxsize
+                    )
+                elif self.overflow is Overflow.DropOldest:
+                    dropped = self._batches.popleft()
+                    self.dropped += len(dropped)
+                    self._done(dropped)
+                    logging.warning(f"{self.name} queue full, dropped oldest boost")
+                elif self.overflow is Overflow.Coalesce:
+                    self._batches[-1].append(boost)
+                    self.coalesced += 1
+                    return
+            self._batches.append([boost])
+            self._condition.notify_all()
+
+    def start(self) -> None:
+        self._worker = asyncio.ensure_future(self._work())
+
+    async def join(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._batches and not self._busy)
+
+    def cancel(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+
+    async def drain(self) -> None:
+        """Let the sink finish what it is still holding, if it has a
+        ``drain``, and release whatever that delivered."""
+        drain = getattr(self.sink, "drain", None)
+        if drain is not None:
+            try:
+                await drain()
+            except Exception as exception:
+                logging.exception(exception)
+        self._delivered()
+
+    async def _work(self) -> None:
+        send_many = getattr(self.sink, "send_many", None)
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: self._batches)
+                batch = self._batches.popleft()
+                self._busy = True
+                self._condition.notify_all()
+            pending = []
+            try:
+                if send_many is not None and len(batch) > 1:
+                    try:
+                        pending.append(await send_many(batch))
+                    except Exception as exception:
+                        logging.exception(exception)
+                else:
+                    for boost in batch:
+                        pending.append(await _deliver(self.sink, boost))
+            finally:
+                pending = [future for future in pending if future is not None]
+                if pending:
+                    self._delivering.append((batch, pending))
+                    for future in pending:
+                        future.add_done_callback(lambda _: self._delivered())
+                else:
+                    self._done(batch)
+                async with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _delivered(self) -> None:
+        still_delivering = []
+        for batch, pending in self._delivering:
+            if all(future.done() for future in pending):
+                self._done(batch)
+            else:
+                still_delivering.append((batch, pending))
+        self._delivering = still_delivering
+
+    def _done(self, batch) -> None:
+        if self.checkpoint is not None:
+            for boost in batch:
+                self.checkpoint.release(boost.invoice.settle_index)
+
+
+async def dispatch(
+    boosts: AsyncIterator[Boost],
+    sinks: Iterable[Sink],
+    queue_size: int = 100,
+    overflow=Overflow.Block,
+    checkpoint: Optional[Checkpoint] = None,
+) -> None:
+    """Hand every boost to every sink's queue.
+
+    Pass the ``checkpoint`` given to ``subscribe_boosts`` so it only moves
+    past a boost once every sink is done with it. However dispatch ends,
+    each sink's ``drain`` is then awaited, if it has one.
+    """
+    queues = [SinkQueue(sink, queue_size, overflow, checkpoint) for sink in sinks]
+    for queue in queues:
+        queue.start()
+
+    try:
+        async for boost in boosts:
+            logging.debug(boost.data)
+            if checkpoint is not None and queues:
+                checkpoint.hold(boost.invoice.settle_index, len(queues))
+            for queue in queues:
+                await queue.put(boost)
+        for queue in queues:
+            await queue.join()
+    finally:
+        for queue in queues:
+            queue.cancel()
+        for queue in queues:
+            await queue.drain()
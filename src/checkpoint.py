@@ -0,0 +1,55 @@
+import collections
+import json
+import os
+import typing
+
+
+class Checkpoint:
+    """The settle index up to which every sink is done with every boost,
+    persisted to a JSON file.
+
+    ``dispatch`` holds each boost's settle index until every sink has
+    returned from it or dropped it, or resolved the future it returned for
+    it, so boosts still in a sink's queue when the process dies are picked
+    up again on restart. A sink that returns once a message is buffered
+    rather than sent, as IRC and Matrix do, loses that buffer.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.settle_index = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                self.settle_index = int(json.load(f).get("settle_index", 0))
+        self._received = self.settle_index
+        self._pending = collections.Counter()  # type: typing.Counter[int]
+
+    def hold(self, settle_index: int, count: int = 1) -> None:
+        self._pending[settle_index] += count
+
+    def release(self, settle_index: int) -> None:
+        self._pending[settle_index] -= 1
+        if self._pending[settle_index] <= 0:
+            del self._pending[settle_index]
+        self._advance()
+
+    def received(self, settle_index: int) -> None:
+        """Every boost of the invoice at ``settle_index`` has been handed on."""
+        self._received = max(self._received, settle_index)
+        self._advance()
+
+    def _advance(self) -> None:
+        if self._pending:
+            self.save(min(min(self._pending) - 1, self._received))
+        else:
+            self.save(self._received)
+
+    def save(self, settle_index: int) -> None:
+        if settle_index <= self.settle_index:
+            return
+        # Write then rename so a crash never leaves a truncated file behind.
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"settle_index": settle_index}, f)
+        os.replace(tmp_path, self.path)
+        self.settle_index = settle_index
@@ -1,26 +1,32 @@
 import asyncio
-import itertools
+import functools
 import json
 import logging
-from collections import defaultdict
-from datetime import datetime, timedelta
-from enum import Enum
-from typing import List
+from datetime import datetime
+from typing import Any, Callable, Dict, List
 
 import bottom
 import click
-from lndgrpc import AsyncLNDClient
 
-from ..numerology import number_to_numerology
+from ..boosts import Boost, Overflow, Sink, dispatch, subscribe_boosts
+from ..checkpoint import Checkpoint
+from ..numerology import load_rules, load_table
+from ..rendering import render
+from ..replay import lnd_client
+from . import flood
+from .flood import FloodScheduler, prefix_bytes, split_message
+from .routing import ChannelMapType, ChannelRouter
+from .supervisor import Supervisor
 
 logging.getLogger().setLevel(logging.INFO)
 
 
-class ChannelMapType(Enum):
-    Podcast = "podcast"
-    FeedId = "feedId"
-    Url = "url"
-    Guid = "guid"
+def async_cmd(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return asyncio.run(func(*args, **kwargs))
+
+    return wrapper
 
 
 @click.command()
@@ -30,6 +36,10 @@ class ChannelMapType(Enum):
     "--lnd-macaroon", type=click.Path(exists=True), default="readonly.macaroon"
 )
 @click.option("--lnd-tlscert", type=click.Path(exists=True), default="tls.cert")
+@click.option("--lnd-replay", type=click.Path(exists=True, dir_okay=False))
+@click.option("--lnd-replay-rate", type=click.FloatRange(0), default=0)
+@click.option("--lnd-replay-burst", type=click.IntRange(1), default=1)
+@click.option("--lnd-checkpoint", type=click.Path(dir_okay=False))
 @click.option("--irc-host", default="irc.zeronode.net")
 @click.option("--irc-port", type=int, default=6697)
 @click.option("--irc-ssl", type=bool, default=True)
@@ -39,16 +49,33 @@ class ChannelMapType(Enum):
 @click.option("--irc-channel-map", type=(str, ChannelMapType, str), multiple=True)
 @click.option("--irc-realname", default="Boost IRC Bot")
 @click.option("--irc-nick-password")
+@click.option("--irc-rate", type=click.FloatRange(0, min_open=True), default=1)
+@click.option("--irc-burst", type=click.IntRange(1), default=5)
+@click.option("--irc-target-rate", type=click.FloatRange(0, min_open=True), default=0.5)
+@click.option("--irc-target-burst", type=click.IntRange(1), default=3)
+@click.option("--irc-buffer-size", type=click.IntRange(1), default=1000)
+@click.option("--irc-networks", type=click.Path(exists=True, dir_okay=False))
 @click.option("--minimum-donation", type=int)
+@click.option("--queue-size", type=click.IntRange(1), default=100)
+@click.option(
+    "--queue-overflow", type=click.Choice([x.value for x in Overflow]), default="block"
+)
+@click.option("--numerology-rules", type=click.Path(exists=True, dir_okay=False))
+@click.option("--numerology-table", type=click.Path(exists=True, dir_okay=False))
 @click.option("--allowed-name", multiple=True)
 @click.option("--verbose/--no-verbose", default=False)
 @click.pass_context
-def cli(
+@async_cmd
+async def cli(
     ctx,
     lnd_host,
     lnd_port,
     lnd_macaroon,
     lnd_tlscert,
+    lnd_replay,
+    lnd_replay_rate,
+    lnd_replay_burst,
+    lnd_checkpoint,
     irc_host,
     irc_port,
     irc_ssl,
@@ -58,34 +85,190 @@ def cli(
     irc_channel,
     irc_channel_map,
     irc_realname,
+    irc_rate,
+    irc_burst,
+    irc_target_rate,
+    irc_target_burst,
+    irc_buffer_size,
+    irc_networks,
     minimum_donation,
+    queue_size,
+    queue_overflow,
+    numerology_rules,
+    numerology_table,
     allowed_name,
     verbose,
 ):
     ctx.ensure_object(dict)
 
+    load_rules(numerology_rules)
+    load_table(numerology_table)
+
     if verbose:
         logging.getLogger().setLevel(logging.DEBUG)
 
-    channel_map = None
-    if irc_channel_map:
-        channel_map = defaultdict(lambda: defaultdict(set))
-        for channel, channel_map_type, value in irc_channel_map:
-            channel_map[channel_map_type][value.lower().strip()].add(
-                channel.lower().strip()
-            )
-        logging.debug(channel_map)
+    async_lnd = lnd_client(
+        lnd_host,
+        lnd_port,
+        lnd_macaroon,
+        lnd_tlscert,
+        lnd_replay,
+        lnd_replay_rate,
+        lnd_replay_burst,
+    )
+
+    sink = await create_sink(
+        irc_host=irc_host,
+        irc_port=irc_port,
+        irc_ssl=irc_ssl,
+        irc_password=irc_password,
+        irc_nick=irc_nick,
+        irc_nick_password=irc_nick_password,
+        irc_channel=irc_channel,
+        irc_channel_map=irc_channel_map,
+        irc_realname=irc_realname,
+        irc_rate=irc_rate,
+        irc_burst=irc_burst,
+        irc_target_rate=irc_target_rate,
+        irc_target_burst=irc_target_burst,
+        irc_buffer_size=irc_buffer_size,
+        irc_networks=irc_networks,
+    )
+
+    checkpoint = Checkpoint(lnd_checkpoint) if lnd_checkpoint else None
+    boosts = subscribe_boosts(async_lnd, allowed_name, minimum_donation, checkpoint)
+    await dispatch(boosts, [sink], queue_size, Overflow(queue_overflow), checkpoint)
+
+
+# Keys of an --irc-networks entry; any left out take the command-line value.
+NETWORK_KEYS = (
+    "host",
+    "port",
+    "ssl",
+    "password",
+    "nick",
+    "nick_password",
+    "channel",
+    "channel_map",
+    "realname",
+    "rate",
+    "burst",
+    "target_rate",
+    "target_burst",
+    "buffer_size",
+)
+
 
-    async_lnd = AsyncLNDClient(
-        f"{lnd_host}:{lnd_port}",
-        macaroon_filepath=lnd_macaroon,
-        cert_filepath=lnd_tlscert,
+def load_networks(path: str, defaults: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Read a JSON list of networks, returned as ``irc_``-prefixed options."""
+    with open(path) as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path}: expected a non-empty list of networks")
+
+    networks = []
+    for entry in entries:
+        unknown = set(entry) - set(NETWORK_KEYS)
+        if unknown:
+            raise ValueError(f"{path}: unknown network keys {sorted(unknown)}")
+        if "host" not in entry:
+            raise ValueError(f"{path}: every network needs a host")
+        network = dict(defaults)
+        network.update({f"irc_{key}": value for key, value in entry.items()})
+        if isinstance(network["irc_channel"], str):
+            network["irc_channel"] = [network["irc_channel"]]
+        networks.append(network)
+    return networks
+
+
+async def create_sink(
+    irc_host,
+    irc_port,
+    irc_ssl,
+    irc_password,
+    irc_nick,
+    irc_nick_password,
+    irc_channel,
+    irc_channel_map,
+    irc_realname,
+    irc_rate=1,
+    irc_burst=5,
+    irc_target_rate=0.5,
+    irc_target_burst=3,
+    irc_buffer_size=1000,
+    irc_networks=None,
+) -> Sink:
+    options = dict(
+        irc_host=irc_host,
+        irc_port=irc_port,
+        irc_ssl=irc_ssl,
+        irc_password=irc_password,
+        irc_nick=irc_nick,
+        irc_nick_password=irc_nick_password,
+        irc_channel=irc_channel,
+        irc_channel_map=irc_channel_map,
+        irc_realname=irc_realname,
+        irc_rate=irc_rate,
+        irc_burst=irc_burst,
+        irc_target_rate=irc_target_rate,
+        irc_target_burst=irc_target_burst,
+        irc_buffer_size=irc_buffer_size,
     )
+    if irc_networks:
+        networks = load_networks(irc_networks, options)
+    else:
+        networks = [options]
+
+    # One client per network on this loop, all fed from the same boosts.
+    posts = await asyncio.gather(*(_connect(**network) for network in networks))
+
+    async def send_boost(boost: Boost):
+        fullmessage = render(boost).irc
+        logging.debug(fullmessage)
+        for post in posts:
+            post(boost.data, fullmessage)
+
+    return send_boost
+
+
+async def _connect(
+    irc_host,
+    irc_port,
+    irc_ssl,
+    irc_password,
+    irc_nick,
+    irc_nick_password,
+    irc_channel,
+    irc_channel_map,
+    irc_realname,
+    irc_rate,
+    irc_burst,
+    irc_target_rate,
+    irc_target_burst,
+    irc_buffer_size,
+) -> Callable[[dict, str], None]:
+    router = ChannelRouter(irc_channel_map, irc_channel)
+    logging.debug(router.channels)
 
     bot = bottom.Client(host=irc_host, port=irc_port, ssl=irc_ssl)
+    scheduler = FloodScheduler(
+        bot,
+        rate=irc_rate,
+        burst=irc_burst,
+        target_rate=irc_target_rate,
+        target_burst=irc_target_burst,
+        maxsize=irc_buffer_size,
+    )
+    # Hold boosts until the first connection has joined its channels.
+    scheduler.pause()
+    supervisor = Supervisor(bot, scheduler, router.channels)
 
     @bot.on("CLIENT_CONNECT")
     async def connect(**kwargs):
+        # Until this server's RPL_ISUPPORT says otherwise, one target per line.
+        scheduler.max_targets = 1
+        scheduler.prefix_bytes = prefix_bytes(irc_nick)
+
         bot.send("NICK", nick=irc_nick)
         bot.send("USER", user=irc_nick, realname=irc_realname)
         if irc_password is not None:
@@ -106,166 +289,55 @@ def cli(
             future.cancel()
 
         if irc_nick_password:
-            bot.send(
+            scheduler.send(
                 "PRIVMSG", target="NickServ", message=f"IDENTIFY {irc_nick_password}"
             )
             logging.debug(f"Identified with NickServ at {datetime.now().isoformat()}")
 
-        for channel in irc_channel:
-            bot.send("JOIN", channel=channel)
-            logging.debug(f"Joined channel {channel} at {datetime.now().isoformat()}")
-
-        for channel, _, _ in irc_channel_map:
-            bot.send("JOIN", channel=channel)
-            logging.debug(
-                f"Joined mapped channel {channel} at {datetime.now().isoformat()}"
-            )
+        await supervisor.join()
+        logging.debug(f"Joined channels at {datetime.now().isoformat()}")
 
     @bot.on("CLIENT_DISCONNECT")
     async def reconnect(**kwargs):
-        await asyncio.sleep(2, loop=bot.loop)
-        bot.loop.create_task(bot.connect())
+        await supervisor.reconnect()
         logging.info(f"Reconnected at {datetime.now().isoformat()}")
 
+    @bot.on("RPL_BOUNCE")
+    def isupport(info, **kwargs):
+        # bottom names numeric 005 after RFC 2812, but servers send ISUPPORT.
+        max_targets = flood.parse_max_targets(info)
+        if max_targets is not None:
+            scheduler.max_targets = max_targets
+            logging.debug(f"Server accepts {max_targets} PRIVMSG targets")
+
+    @bot.on("JOIN")
+    def joined(nick, user, host, channel, **kwargs):
+        # Our own JOIN echo carries the hostmask the server relays us with.
+        if nick.lower() == irc_nick.lower():
+            scheduler.prefix_bytes = prefix_bytes(nick, f"{nick}!{user}@{host}")
+            supervisor.joined(channel)
+
     @bot.on("PING")
     def keepalive(message, **kwargs):
         logging.debug(f"ping at {datetime.now().isoformat()}")
-        bot.send("PONG", message=message)
+        scheduler.send("PONG", message=message)
         logging.debug(f"pong at {datetime.now().isoformat()}")
 
-    async def subscribe_invoices():
-        invoices = async_lnd.subscribe_invoices()
-        async for invoice in invoices:
-            for tlv in invoice.htlcs:
-                try:
-                    data = tlv.custom_records.get(7629169)
-                    if data is None:
-                        continue
-
-                    data = json.loads(data)
-
-                    if allowed_name:
-                        name = data.get("name")
-                        if not name:
-                            continue
-
-                        if name.lower() not in [x.lower() for x in allowed_name]:
-                            continue
-
-                    if "action" not in data or str(data["action"]).lower() != "boost":
-                        continue
-
-                    value = int(data.get("value_msat_total", 0)) // 1000
-                    if not value:
-                        value = invoice.value
-
-                    if minimum_donation is not None and value < minimum_donation:
-                        logging.debug("Donation too low, skipping", data)
-                        continue
-
-                    fullmessage = _new_message(data, value)
-                    logging.debug(fullmessage)
-
-                    # arbitrarily slice to chunks of 250 in an attempt
-                    # to accomodate long bot nicks/hostmasks, or channels
-                    message = _chunks(fullmessage, 250)
-
-                    for chunk in message:
-                        channels = (
-                            set(
-                                itertools.chain(
-                                    channel_map[ChannelMapType.Podcast].get(
-                                        str(data.get("podcast", "")).lower().strip(), []
-                                    ),
-                                    channel_map[ChannelMapType.FeedId].get(
-                                        str(data.get("feedID", "")).lower().strip(), []
-                                    ),
-                                    channel_map[ChannelMapType.Url].get(
-                                        str(data.get("url", "")).lower().strip(), []
-                                    ),
-                                    channel_map[ChannelMapType.Guid].get(
-                                        str(data.get("guid", "")).lower().strip(), []
-                                    ),
-                                )
-                            )
-                            if channel_map is not None
-                            else set()
-                        )
-                        # Always post to all channels in irc_channel
-                        channels.update(irc_channel)
-
-                        for channel in channels:
-                            bot.send("PRIVMSG", target=channel, message=chunk)
-
-                except Exception as exception:
-                    logging.exception(exception)
-
-    bot.loop.run_until_complete(bot.connect())
-
-    bot.loop.run_until_complete(subscribe_invoices())
-
-    bot.loop.run_forever()
-
-
-def _get(data, key, format_found=None, default=None):
-    if key in data:
-        value = data[key]
-        if value:
-            if format_found is None:
-                return value
-            if callable(format_found):
-                return format_found(key, value)
-            return format_found.format(**{key: value})
-    return default
-
-
-def _sanitize(message):
-    # for IRC TODO: check for and replace more than just newlines
-    if isinstance(message, str):
-        if r"\\u" in repr(message):
-            message = (
-                message.encode("ascii")
-                .decode("unicode-escape")
-                .encode("utf-16", "surrogatepass")
-                .decode("utf-16")
-            )
-        return message.replace("\n", "")
-    return message
-
-
-def _new_message(data, value, numerology_func=number_to_numerology):
-
-    amount = f"\x02\u200b{value}\x02 sats"
-    app = _sanitize(_get(data, "app_name", "via {app_name}"))
-    sender = _sanitize(_get(data, "sender_name", default="Anonymous"))
-    podcast = _sanitize(_get(data, "podcast", "\x02[{podcast}]\x02"))
-    episode = _sanitize(_get(data, "episode", "\x02[{episode}]\x02"))
-    message = _sanitize(_get(data, "message", 'saying "\x02{message}\x02"'))
-    timestamp = _get(data, "ts", lambda _, v: "@{}".format(timedelta(seconds=int(v))))
-    numerology = numerology_func(value)
-
-    # Build the data to send to Matrix
-    data = ""
-    if numerology:
-        data += numerology + " "
-    if podcast:
-        data += podcast + " "
-    if episode:
-        data += episode + " "
-    if sender:
-        data += sender + " "
-    data += f"boosted {amount}"
-    if message:
-        data += " " + message
-    if timestamp:
-        data += " " + timestamp
-    if app:
-        data += " " + app
-
-    return data
-
-
-def _chunks(message: str, n: int) -> List[str]:
-    n = max(1, n)
-    for i in range(0, len(message), n):
-        yield message[i : i + n]
+    def post(data: dict, fullmessage: str):
+        channels = router.resolve(data)
+        if not channels:
+            return
+
+        # Split once for the longest target so every channel gets the same
+        # lines and the scheduler can batch them.
+        limit = min(scheduler.budget(channel) for channel in channels)
+        for chunk in split_message(fullmessage, limit):
+            for channel in channels:
+                scheduler.privmsg(channel, chunk)
+
+        logging.debug(f"{irc_host} queue depth {scheduler.depth}: {scheduler.depths()}")
+
+    await supervisor.connect()
+    scheduler.start()
+
+    return post
@@ -0,0 +1,301 @@
+import asyncio
+import collections
+import logging
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+LINE_BYTES = 512
+
+# Common maximums, for sizing the ":nick!user@host " prefix the server puts
+# on our lines as it relays them to other clients.
+NICKLEN = 30
+USERLEN = 10
+HOSTLEN = 63
+MAX_PREFIX_BYTES = 1 + NICKLEN + 1 + USERLEN + 1 + HOSTLEN + 1
+
+# Used when the server advertises PRIVMSG targets without a limit; the line
+# length still bounds how many fit.
+UNLIMITED_TARGETS = LINE_BYTES
+
+
+def parse_max_targets(tokens: Iterable[str]) -> Optional[int]:
+    """PRIVMSG target limit from RPL_ISUPPORT tokens, if advertised."""
+    max_targets = None
+    for token in tokens:
+        name, _, value = token.partition("=")
+        if name == "TARGMAX":
+            for limit in value.split(","):
+                command, _, count = limit.partition(":")
+                if command.upper() == "PRIVMSG":
+                    return int(count) if count else UNLIMITED_TARGETS
+        elif name == "MAXTARGETS" and value:
+            max_targets = int(value)
+    return max_targets
+
+
+# Only spaces: str.isspace() and \s also match the \x1d-\x1f formatting codes.
+_WORDS = re.compile(r"[^ ]+| +")
+_FORMAT_CODES = r"\x03(?:\d{1,2}(?:,\d{1,2})?)?|[\x02\x0f\x11\x16\x1d\x1e\x1f]"
+_FORMATTING = re.compile(_FORMAT_CODES)
+_UNITS = re.compile(_FORMAT_CODES + "|.", re.DOTALL)
+
+
+def prefix_bytes(nick: str, hostmask: Optional[str] = None) -> int:
+    """Bytes of the ``:nick!user@host `` prefix on our relayed lines.
+
+    Without the hostmask, assumes the longest user and host names.
+    """
+    if hostmask:
+        return len(f":{hostmask} ".encode())
+    return len(f":{nick}!".encode()) + USERLEN + 1 + HOSTLEN + 1
+
+
+def _format_state(text: str, toggles: str, color: str):
+    for code in _FORMATTING.findall(text):
+        if code == "\x0f":
+            toggles, color = "", ""
+        elif code.startswith("\x03"):
+            color = code if len(code) > 1 else ""
+        elif code in toggles:
+            toggles = toggles.replace(code, "")
+        else:
+            toggles += code
+    return toggles, color
+
+
+def split_message(message: str, limit: int) -> List[str]:
+    """Split a message into lines of at most ``limit`` UTF-8 bytes.
+
+    Lines break between words where possible. Formatting still open at a
+    break (bold, colour, ...) is re-opened at the start of the next line,
+    since clients reset it at the end of every line.
+    """
+
+    def size(text):
+        return len(text.encode())
+
+    lines = []
+    toggles, color = "", ""
+    prefix, line, space = "", "", ""
+    for token in _WORDS.findall(message):
+        if token.startswith(" "):
+            space = token if line else ""
+            continue
+
+        if line and size(prefix + line + space + token) > limit:
+            lines.append(prefix + line)
+            prefix, line, space = color + toggles, "", ""
+
+        if size(prefix + line + space + token) <= limit:
+            line += space + token
+            toggles, color = _format_state(token, toggles, color)
+        else:
+            # A single word longer than a line; break it between characters.
+            for unit in _UNITS.findall(token):
+                if line and size(prefix + line + unit) > limit:
+                    lines.append(prefix + line)
+                    prefix, line = color + toggles, ""
+                line += unit
+                toggles, color = _format_state(unit, toggles, color)
+        space = ""
+
+    if line:
+        lines.append(prefix + line)
+    return lines
+
+
+class TokenBucket:
+    def __init__(
+        self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available."""
+        self._refill()
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def take(self, tokens: int = 1) -> None:
+        # May go negative: unthrottled commands still count against the budget.
+        self._refill()
+        self._tokens -= tokens
+
+
+class FloodScheduler:
+    """Paces PRIVMSGs to stay under ircd flood limits.
+
+    Every line spends a token from a global bucket and one from its target's
+    bucket. Targets with pending lines are served round-robin, so a busy
+    channel cannot starve the others. When the server allows it
+    (``max_targets``), targets whose next line is the same text share one
+    ``PRIVMSG #a,#b,#c`` line.
+
+    While paused (disconnected, or not yet joined) lines are held, up to
+    ``maxsize`` of them; beyond that the deepest target loses its oldest line.
+    """
+
+    def __init__(
+        self,
+        bot,
+        rate: float = 1,
+        burst: int = 5,
+        target_rate: float = 0.5,
+        target_burst: int = 3,
+        maxsize: int = 1000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.bot = bot
+        self.clock = clock
+        self.maxsize = max(1, maxsize)
+        self.paused = False
+        self.dropped = 0
+        self.bucket = TokenBucket(rate, burst, clock)
+        self.target_rate = target_rate
+        self.target_burst = target_burst
+        self.max_targets = 1
+        self.prefix_bytes = MAX_PREFIX_BYTES
+        self._buckets = {}  # type: Dict[str, TokenBucket]
+        self._queues = {}  # type: Dict[str, collections.deque]
+        self._ready = collections.deque()
+        self._depth = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def depth(self) -> int:
+        return self._depth
+
+    def depths(self) -> Dict[str, int]:
+        return {target: len(queue) for target, queue in self._queues.items() if queue}
+
+    def _bucket(self, target: str) -> TokenBucket:
+        bucket = self._buckets.get(target)
+        if bucket is None:
+            bucket = TokenBucket(self.target_rate, self.target_burst, self.clock)
+            self._buckets[target] = bucket
+        return bucket
+
+    def budget(self, target: str) -> int:
+        """Bytes of message text that fit in one PRIVMSG line to ``target``."""
+        line = f"PRIVMSG {target} :\r\n"
+        return LINE_BYTES - self.prefix_bytes - len(line.encode())
+
+    def send(self, command: str, **kwargs) -> None:
+        """Send a command immediately, charging it to the global bucket."""
+        self.bucket.take()
+        self.bot.send(command, **kwargs)
+
+    def privmsg(self, target: str, message: str) -> None:
+        if self._depth >= self.maxsize:
+            self._drop()
+        queue = self._queues.setdefault(target, collections.deque())
+        if not queue:
+            self._ready.append(target)
+        queue.append(message)
+        self._depth += 1
+        self._wakeup.set()
+
+    def _drop(self) -> None:
+        target = max(self._queues, key=lambda target: len(self._queues[target]))
+        queue = self._queues[target]
+        queue.popleft()
+        if not queue:
+            self._ready.remove(target)
+        self._depth -= 1
+        self.dropped += 1
+        logging.warning(f"IRC buffer full, dropped oldest line to {target}")
+
+    def pause(self) -> None:
+        self.paused = True
+
+    def resume(self) -> None:
+        self.paused = False
+        self._wakeup.set()
+
+    def poll(self) -> Optional[float]:
+        """Send every line the buckets allow right now.
+
+        Returns the seconds until the next line could go out, or None when
+        nothing is queued or the scheduler is paused.
+        """
+        while self._ready and not self.paused:
+            delay = self.bucket.delay()
+            if delay:
+                return delay
+
+            for _ in range(len(self._ready)):
+                delay = self._bucket(self._ready[0]).delay()
+                if not delay:
+                    break
+                self._ready.rotate(-1)
+            else:
+                return min(self._bucket(target).delay() for target in self._ready)
+
+            targets = self._take()
+            message = self._queues[targets[0]].popleft()
+            for target in targets[1:]:
+                self._queues[target].popleft()
+            self._depth -= len(targets)
+            for target in targets:
+                if self._queues[target]:
+                    self._ready.append(target)
+
+            self.bucket.take()
+            for target in targets:
+                self._bucket(target).take()
+            try:
+                self.bot.send("PRIVMSG", target=",".join(targets), message=message)
+            except Exception as exception:
+                logging.exception(exception)
+        return None
+
+    def _take(self) -> List[str]:
+        # The head of _ready is ready to send; claim any other ready targets
+        # waiting on the same text while the line still fits.
+        targets = [self._ready.popleft()]
+        if self.max_targets <= 1:
+            return targets
+
+        message = self._queues[targets[0]][0]
+        length = self.prefix_bytes + len(
+            f"PRIVMSG {targets[0]} :{message}\r\n".encode()
+        )
+        for target in list(self._ready):
+            if len(targets) >= self.max_targets:
+                break
+            if self._queues[target][0] != message or self._bucket(target).delay():
+                continue
+            if length + 1 + len(target.encode()) > LINE_BYTES:
+                continue
+            length += 1 + len(target.encode())
+            targets.append(target)
+            self._ready.remove(target)
+        return targets
+
+    async def _run(self) -> None:
+        while True:
+            delay = self.poll()
+            if delay is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            else:
+                await asyncio.sleep(delay)
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
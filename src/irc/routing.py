@@ -0,0 +1,137 @@
+import functools
+from collections import defaultdict
+from enum import Enum
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+class ChannelMapType(Enum):
+    Podcast = "podcast"
+    FeedId = "feedId"
+    Url = "url"
+    Guid = "guid"
+
+
+# The boost field each map type is matched against.
+FIELDS = (
+    (ChannelMapType.Podcast, "podcast"),
+    (ChannelMapType.FeedId, "feedID"),
+    (ChannelMapType.Url, "url"),
+    (ChannelMapType.Guid, "guid"),
+)
+
+# A map value ending in this matches every value starting with the rest.
+WILDCARD = "*"
+
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+
+def normalize_url(url: str) -> str:
+    """Compare feed URLs without scheme, "www.", default port or trailing slash."""
+    url = url.lower().strip()
+    parts = urlsplit(url)
+    if not parts.netloc:
+        return url.rstrip("/")
+
+    host = parts.netloc
+    port = DEFAULT_PORTS.get(parts.scheme)
+    if port and host.endswith(port):
+        host = host[: -len(port)]
+    if host.startswith("www."):
+        host = host[len("www.") :]
+
+    url = host + parts.path.rstrip("/")
+    if parts.query:
+        url += "?" + parts.query
+    return url
+
+
+def normalize(channel_map_type: ChannelMapType, value) -> str:
+    value = str(value).lower().strip()
+    if channel_map_type is ChannelMapType.Url:
+        return normalize_url(value)
+    return value
+
+
+class ChannelRouter:
+    """Resolves the channels a boost is posted to.
+
+    Built once from the ``--irc-channel-map`` entries: exact values go into a
+    dict of frozen channel sets, values ending in ``*`` match by prefix. Every
+    boost also goes to the ``default`` channels.
+    """
+
+    def __init__(
+        self,
+        channel_map: Iterable[Tuple[str, ChannelMapType, str]] = (),
+        default: Iterable[str] = (),
+        cache_size: int = 4096,
+    ):
+        exact = defaultdict(set)
+        prefixes = defaultdict(set)
+        mapped = []
+        for channel, channel_map_type, value in channel_map:
+            channel_map_type = ChannelMapType(channel_map_type)
+            channel = channel.lower().strip()
+            if channel not in mapped:
+                mapped.append(channel)
+
+            value = value.strip()
+            if value.endswith(WILDCARD):
+                prefix = value[: -len(WILDCARD)]
+                value = normalize(channel_map_type, prefix)
+                # Keep the slash, or example.com/* would match example.community.
+                if channel_map_type is ChannelMapType.Url and prefix.endswith("/"):
+                    value += "/"
+                prefixes[channel_map_type, value].add(channel)
+            else:
+                exact[channel_map_type, normalize(channel_map_type, value)].add(channel)
+
+        self.default = frozenset(default)
+        self.channels = tuple(default) + tuple(
+            channel for channel in mapped if channel not in self.default
+        )
+        self._exact = {
+            key: frozenset(channels) for key, channels in exact.items()
+        }  # type: Dict[Tuple[ChannelMapType, str], FrozenSet[str]]
+        self._prefixes = {
+            key: frozenset(channels) for key, channels in prefixes.items()
+        }  # type: Dict[Tuple[ChannelMapType, str], FrozenSet[str]]
+        # Per map type, the prefix lengths worth trying, shortest first.
+        self._prefix_lengths = {
+            channel_map_type: sorted(
+                {len(value) for t, value in self._prefixes if t is channel_map_type}
+            )
+            for channel_map_type in ChannelMapType
+        }
+        self._types = {channel_map_type for channel_map_type, _ in self._exact}
+        self._types.update(channel_map_type for channel_map_type, _ in self._prefixes)
+        self._resolve = functools.lru_cache(maxsize=cache_size)(self._lookup)
+
+    def resolve(self, data: dict) -> FrozenSet[str]:
+        key = tuple(
+            self._key(channel_map_type, data.get(field))
+            for channel_map_type, field in FIELDS
+        )
+        return self._resolve(key)
+
+    def _key(self, channel_map_type: ChannelMapType, value) -> Optional[str]:
+        if channel_map_type not in self._types or not value:
+            return None
+        return normalize(channel_map_type, value)
+
+    def _lookup(self, key: Tuple[Optional[str], ...]) -> FrozenSet[str]:
+        channels = self.default
+        for (channel_map_type, _), value in zip(FIELDS, key):
+            if value is None:
+                continue
+            matched = self._exact.get((channel_map_type, value))
+            if matched:
+                channels = channels | matched
+            for length in self._prefix_lengths[channel_map_type]:
+                if length > len(value):
+                    break
+                matched = self._prefixes.get((channel_map_type, value[:length]))
+                if matched:
+                    channels = channels | matched
+        return channels
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Callable, Iterable, List, Optional
+
+from .flood import LINE_BYTES, FloodScheduler
+
+
+class Backoff:
+    """Exponential backoff with full jitter, so a netsplit's worth of bots
+    don't all reconnect in the same second."""
+
+    def __init__(
+        self,
+        base: float = 1,
+        cap: float = 300,
+        random: Callable[[], float] = random.random,
+    ):
+        self.base = base
+        self.cap = cap
+        self.random = random
+        self.attempts = 0
+
+    def delay(self) -> float:
+        delay = min(self.cap, self.base * 2**self.attempts) * self.random()
+        self.attempts += 1
+        return delay
+
+    def reset(self) -> None:
+        self.attempts = 0
+
+
+class Supervisor:
+    """Keeps a bottom client connected and joined.
+
+    The scheduler stays paused from a disconnect until the channels are
+    joined again, so boosts that arrive in between are buffered and then
+    replayed at the scheduler's flood-safe pace rather than written to a
+    dead transport. Counts reconnects and the time from disconnect to
+    rejoin.
+    """
+
+    def __init__(
+        self,
+        bot,
+        scheduler: FloodScheduler,
+        channels: Iterable[str],
+        backoff: Optional[Backoff] = None,
+        join_timeout: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.bot = bot
+        self.scheduler = scheduler
+        self.channels = tuple(channels)
+        self.backoff = backoff or Backoff()
+        self.join_timeout = join_timeout
+        self.clock = clock
+        self.reconnects = 0
+        self.last_rejoin = None  # type: Optional[float]
+        self._disconnected_at = None  # type: Optional[float]
+        self._reconnecting = False
+        self._retry = None  # type: Optional[asyncio.Future]
+        self._connection = 0
+        self._pending = set()
+        self._joined = asyncio.Event()
+
+    async def connect(self) -> None:
+        """Connect for the first time. A server that can't be reached is
+        retried in the background with backoff, as after a disconnect, so
+        one dead network doesn't stop the bot starting."""
+        try:
+            await self.bot.connect()
+        except OSError as exception:
+            logging.warning(f"IRC connect failed: {exception}")
+            self._retry = asyncio.ensure_future(self.reconnect())
+
+    async def reconnect(self) -> None:
+        self._connection += 1
+        self.scheduler.pause()
+        if self._disconnected_at is None:
+            self._disconnected_at = self.clock()
+        if self._reconnecting:
+            return
+
+        self._reconnecting = True
+        try:
+            while True:
+                delay = self.backoff.delay()
+                logging.info(f"IRC disconnected, reconnecting in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                try:
+                    await self.bot.connect()
+                except OSError as exception:
+                    logging.warning(f"IRC reconnect failed: {exception}")
+                    continue
+                self.reconnects += 1
+                return
+        finally:
+            self._reconnecting = False
+
+    async def join(self) -> None:
+        """Join every channel, then resume sending once the server has
+        echoed each JOIN back (or ``join_timeout`` passes).
+
+        Channels are joined as many to a line as fit, each line waiting for
+        the scheduler's global bucket like any other.
+        """
+        connection = self._connection
+        self._pending = {channel.lower() for channel in self.channels}
+        self._joined.clear()
+        for channels in _join_lines(self.channels):
+            delay = self.scheduler.bucket.delay()
+            if delay:
+                await asyncio.sleep(delay)
+            self.scheduler.send("JOIN", channel=channels)
+        if not self._pending:
+            self._joined.set()
+
+        try:
+            await asyncio.wait_for(self._joined.wait(), self.join_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"No JOIN from {sorted(self._pending)}, sending anyway")
+        if connection == self._connection:
+            self.ready()
+
+    def joined(self, channel: str) -> None:
+        self._pending.discard(channel.lower())
+        if not self._pending:
+            self._joined.set()
+
+    def ready(self) -> None:
+        self.backoff.reset()
+        if self._disconnected_at is not None:
+            self.last_rejoin = self.clock() - self._disconnected_at
+            self._disconnected_at = None
+            logging.info(
+                f"IRC rejoined {self.last_rejoin:.1f}s after disconnect "
+                f"(reconnect {self.reconnects}), "
+                f"replaying {self.scheduler.depth} buffered lines"
+            )
+        self.scheduler.resume()
+
+
+def _join_lines(channels: Iterable[str]) -> List[str]:
+    # Comma-separated channel lists for "JOIN <channels>\r\n" lines.
+    room = LINE_BYTES - len("JOIN \r\n")
+    lines = []  # type: List[str]
+    for channel in channels:
+        if lines and len(f"{lines[-1]},{channel}".encode()) <= room:
+            lines[-1] += f",{channel}"
+        else:
+            lines.append(channel)
+    return lines
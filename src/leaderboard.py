@@ -0,0 +1,273 @@
+import hashlib
+import heapq
+import json
+import sqlite3
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from lndgrpc.aio.async_client import ln
+
+from .boosts import Boost, decode_boosts, list_invoices
+
+BUCKET_SECONDS = 3600
+
+DAY = 24 * 60 * 60
+
+# How far back each leaderboard window reaches; None is all time.
+WINDOWS = {"day": DAY, "week": 7 * DAY, "month": 30 * DAY, "all": None}
+
+# The columns each leaderboard groups boosts by.
+GROUP_BY = {
+    "sender": ("app_name", "sender"),
+    "app": ("app_name",),
+    "podcast": ("podcast",),
+    "episode": ("podcast", "episode"),
+}
+
+METRICS = ("count", "total", "biggest")
+
+# Invoice states that may still settle.
+UNSETTLED = frozenset(map(ln.Invoice.InvoiceState.Value, ("OPEN", "ACCEPTED")))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boosts (
+    settle_index INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    add_index INTEGER NOT NULL,
+    settle_date INTEGER NOT NULL,
+    PRIMARY KEY (settle_index, digest)
+);
+CREATE TABLE IF NOT EXISTS totals (
+    bucket INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    app_name TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    podcast TEXT NOT NULL,
+    episode TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    biggest INTEGER NOT NULL,
+    PRIMARY KEY (bucket, name, app_name, sender, podcast, episode)
+);
+CREATE TABLE IF NOT EXISTS crawl (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    since INTEGER NOT NULL,
+    add_index INTEGER NOT NULL
+);
+"""
+
+
+class Standing(NamedTuple):
+    group: Tuple[str, ...]
+    count: int
+    total: int
+    biggest: int
+
+
+Board = Dict[str, List[Standing]]
+
+
+class LeaderboardStore:
+    """Boost totals per (name, app, sender, podcast, episode) and hour, in SQLite.
+
+    Used as a sink, it is updated as boosts settle, so a leaderboard is one
+    indexed query over the buckets in its window instead of a ListInvoices
+    crawl. Each boost is counted once however often it is added.
+    """
+
+    def __init__(self, path: str, bucket_seconds: int = BUCKET_SECONDS):
+        self.path = path
+        self.bucket_seconds = bucket_seconds
+        self._db = sqlite3.connect(path)
+        # WAL lets the leaderboard command read while the bot is writing.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def crawled(self, since: int) -> int:
+        """The add index a ListInvoices crawl from ``since`` can resume after.
+
+        Only ``crawl`` moves this; the boosts the live bot adds don't, or
+        older invoices in the window would never be read.
+        """
+        row = self._db.execute("SELECT since, add_index FROM crawl").fetchone()
+        if row is None or row[0] > since:
+            return 0
+        return row[1]
+
+    def save_crawl(self, since: int, add_index: int) -> None:
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO crawl VALUES (0, ?, ?)", (since, add_index)
+            )
+
+    def add(self, boost: Boost) -> bool:
+        return self.add_many([boost]) > 0
+
+    def add_many(self, boosts: Iterable[Boost]) -> int:
+        added = 0
+        with self._db:
+            for boost in boosts:
+                added += self._add(boost)
+        return added
+
+    def _add(self, boost: Boost) -> bool:
+        data, value, invoice = boost
+        sender = data.get("sender_name")
+        app_name = data.get("app_name")
+        if not sender or not app_name:
+            return False
+
+        digest = hashlib.sha1(
+            json.dumps(data, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO boosts VALUES (?, ?, ?, ?)",
+            (invoice.settle_index, digest, invoice.add_index, invoice.settle_date),
+        )
+        if not cursor.rowcount:
+            return False
+
+        bucket = self._bucket(invoice.settle_date)
+        self._db.execute(
+            """
+            INSERT INTO totals VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
+            ON CONFLICT (bucket, name, app_name, sender, podcast, episode)
+            DO UPDATE SET
+                count = count + 1,
+                total = total + excluded.total,
+                biggest = MAX(biggest, excluded.biggest)
+            """,
+            (
+                bucket,
+                str(data.get("name") or "").lower(),
+                app_name,
+                sender,
+                str(data.get("podcast") or ""),
+                str(data.get("episode") or ""),
+                value,
+                value,
+            ),
+        )
+        return True
+
+    def boards(
+        self,
+        windows: Dict[str, Optional[int]],
+        group_by: str = "sender",
+        names: Iterable[str] = (),
+        limit: int = 10,
+    ) -> Dict[str, Board]:
+        """The top ``limit`` groups by each metric, for every window at once.
+
+        ``windows`` maps a name to the unix time the window starts (None for
+        all time). One grouped query sums every window side by side, then a
+        heap picks each board's top entries.
+        """
+        columns = GROUP_BY[group_by]
+        starts = [self._bucket(since or 0) for since in windows.values()]
+        names = [name.lower() for name in names]
+
+        sums = []
+        for _ in starts:
+            sums += [
+                "SUM(CASE WHEN bucket >= ? THEN count ELSE 0 END)",
+                "SUM(CASE WHEN bucket >= ? THEN total ELSE 0 END)",
+                "MAX(CASE WHEN bucket >= ? THEN biggest ELSE 0 END)",
+            ]
+        where = "bucket >= ?"
+        if names:
+            where += f" AND name IN ({', '.join('?' * len(names))})"
+        query = f"""
+            SELECT {', '.join(columns)}, {', '.join(sums)}
+            FROM totals
+            WHERE {where}
+            GROUP BY {', '.join(columns)}
+        """
+        parameters = [start for start in starts for _ in METRICS]
+        rows = self._db.execute(query, [*parameters, min(starts), *names]).fetchall()
+
+        boards = {}
+        for index, window in enumerate(windows):
+            offset = len(columns) + index * len(METRICS)
+            standings = [
+                Standing(row[: len(columns)], *row[offset : offset + len(METRICS)])
+                for row in rows
+            ]
+            standings = [standing for standing in standings if standing.count]
+            boards[window] = {
+                metric: heapq.nlargest(
+                    limit,
+                    standings,
+                    key=lambda standing, metric=metric: getattr(standing, metric),
+                )
+                for metric in METRICS
+            }
+        return boards
+
+    def standings(
+        self,
+        since: int,
+        names: Iterable[str] = (),
+        order_by: str = "total",
+        limit: int = 10,
+        group_by: str = "sender",
+    ) -> List[Standing]:
+        """The top groups of boosts settled since ``since`` (unix seconds)."""
+        return self.boards({"": since}, group_by, names, limit)[""][order_by]
+
+    def _bucket(self, timestamp: int) -> int:
+        return timestamp - timestamp % self.bucket_seconds
+
+    async def __call__(self, boost: Boost) -> None:
+        # A WAL commit with synchronous=NORMAL takes well under a
+        # millisecond, so this stays on the event loop.
+        self.add(boost)
+
+    async def send_many(self, boosts: List[Boost]) -> None:
+        self.add_many(boosts)
+
+
+async def crawl(
+    store: LeaderboardStore,
+    async_lnd,
+    since: int,
+    until: int,
+    names: Iterable[str] = (),
+    page_size: int = 100,
+    concurrency: int = 4,
+) -> int:
+    """Add the boosts settled from ``since`` to ``until`` (unix seconds) to
+    ``store``, reading only invoices newer than its last crawl that reached
+    back that far. Returns how many boosts were added.
+
+    The next crawl resumes just before the oldest invoice that could still
+    settle, so a boost settling after this crawl isn't skipped; the boosts
+    it reads again are only counted once.
+    """
+    add_index = store.crawled(since)
+    invoices = list_invoices(
+        async_lnd,
+        creation_date_start=since,
+        creation_date_end=until,
+        index_offset=add_index,
+        page_size=page_size,
+        concurrency=concurrency,
+    )
+    added = 0
+    unsettled = None
+    async for invoice in invoices:
+        add_index = max(add_index, invoice.add_index)
+        if invoice.state in UNSETTLED:
+            if unsettled is None or invoice.add_index < unsettled:
+                unsettled = invoice.add_index
+            continue
+        if invoice.settle_date < since:
+            continue
+        added += store.add_many(decode_boosts(invoice, allowed_name=names))
+    if unsettled is not None:
+        add_index = min(add_index, unsettled - 1)
+    store.save_crawl(since, add_index)
+    return added
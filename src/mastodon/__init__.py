@@ -1,16 +1,19 @@
 import asyncio
-import collections
 import datetime
 import functools
-import json
 import logging
+from typing import List
 
 import atoot
 import click
-from lndgrpc import AsyncLNDClient
-from lndgrpc.aio.async_client import ln
 
-from ..numerology import number_to_numerology
+from ..boosts import Boost, Overflow, Sink, dispatch, subscribe_boosts
+from ..checkpoint import Checkpoint
+from ..leaderboard import GROUP_BY, WINDOWS, LeaderboardStore, crawl
+from ..numerology import load_rules, load_table
+from ..rendering import render
+from ..replay import lnd_client
+from .posting import Poster
 
 
 def async_cmd(func):
@@ -26,9 +29,23 @@ def async_cmd(func):
 @click.option("--lnd-port", type=click.IntRange(0), default=10009)
 @click.option("--lnd-macaroon", type=click.Path(exists=True), default="admin.macaroon")
 @click.option("--lnd-tlscert", type=click.Path(exists=True), default="tls.cert")
+@click.option("--lnd-replay", type=click.Path(exists=True, dir_okay=False))
+@click.option("--lnd-replay-rate", type=click.FloatRange(0), default=0)
+@click.option("--lnd-replay-burst", type=click.IntRange(1), default=1)
+@click.option("--lnd-checkpoint", type=click.Path(dir_okay=False))
 @click.option("--mastodon-instance")
 @click.option("--mastodon-access-token")
+@click.option("--mastodon-reserve", type=click.IntRange(0), default=30)
+@click.option("--mastodon-digest-below", type=click.IntRange(0), default=1000)
+@click.option("--mastodon-digest-delay", type=click.FloatRange(0), default=300)
+@click.option("--leaderboard-db", type=click.Path(dir_okay=False))
 @click.option("--minimum-donation", type=int)
+@click.option("--queue-size", type=click.IntRange(1), default=100)
+@click.option(
+    "--queue-overflow", type=click.Choice([x.value for x in Overflow]), default="block"
+)
+@click.option("--numerology-rules", type=click.Path(exists=True, dir_okay=False))
+@click.option("--numerology-table", type=click.Path(exists=True, dir_okay=False))
 @click.option("--allowed-name", multiple=True)
 @click.pass_context
 @async_cmd
@@ -38,89 +55,92 @@ async def cli(
     lnd_port,
     lnd_macaroon,
     lnd_tlscert,
+    lnd_replay,
+    lnd_replay_rate,
+    lnd_replay_burst,
+    lnd_checkpoint,
     mastodon_instance,
     mastodon_access_token,
+    mastodon_reserve,
+    mastodon_digest_below,
+    mastodon_digest_delay,
+    leaderboard_db,
     minimum_donation,
+    queue_size,
+    queue_overflow,
+    numerology_rules,
+    numerology_table,
     allowed_name,
 ):
     ctx.ensure_object(dict)
 
-    mastodon = await atoot.MastodonAPI.create(
-        mastodon_instance, access_token=mastodon_access_token
+    load_rules(numerology_rules)
+    load_table(numerology_table)
+
+    async_lnd = lnd_client(
+        lnd_host,
+        lnd_port,
+        lnd_macaroon,
+        lnd_tlscert,
+        lnd_replay,
+        lnd_replay_rate,
+        lnd_replay_burst,
     )
-    resp = await mastodon.verify_account_credentials()
-    logging.debug(resp)
-    logging.info(f"Connected to {mastodon_instance}")
 
-    async_lnd = AsyncLNDClient(
-        f"{lnd_host}:{lnd_port}",
-        macaroon_filepath=lnd_macaroon,
-        cert_filepath=lnd_tlscert,
+    sink = await create_sink(
+        mastodon_instance=mastodon_instance,
+        mastodon_access_token=mastodon_access_token,
+        mastodon_reserve=mastodon_reserve,
+        mastodon_digest_below=mastodon_digest_below,
+        mastodon_digest_delay=mastodon_digest_delay,
     )
 
-    invoices = async_lnd.subscribe_invoices()
-    async for invoice in invoices:
-        for tlv in invoice.htlcs:
-            try:
-                data = tlv.custom_records.get(7629169)
-                if data is None:
-                    continue
+    sinks = [sink]
+    if leaderboard_db:
+        sinks.append(LeaderboardStore(leaderboard_db))
 
-                data = json.loads(data)
+    checkpoint = Checkpoint(lnd_checkpoint) if lnd_checkpoint else None
+    boosts = subscribe_boosts(async_lnd, allowed_name, minimum_donation, checkpoint)
+    await dispatch(boosts, sinks, queue_size, Overflow(queue_overflow), checkpoint)
 
-                if "action" not in data or str(data["action"]).lower() != "boost":
-                    continue
 
-                if allowed_name:
-                    name = data.get("name")
-                    if not name:
-                        continue
-
-                    if name.lower() not in [x.lower() for x in allowed_name]:
-                        continue
-
-                value = int(data.get("value_msat_total", 0)) // 1000
-                if not value:
-                    value = invoice.value
-
-                if minimum_donation is not None and value < minimum_donation:
-                    logging.debug("Donation too low, skipping", data)
-                    continue
-
-                sender = data.get("sender_name", "Anonymous")
+async def create_sink(
+    mastodon_instance,
+    mastodon_access_token,
+    mastodon_reserve=30,
+    mastodon_digest_below=1000,
+    mastodon_digest_delay=300,
+) -> Sink:
+    mastodon = await atoot.MastodonAPI.create(
+        mastodon_instance, access_token=mastodon_access_token
+    )
+    resp = await mastodon.verify_account_credentials()
+    logging.debug(resp)
+    logging.info(f"Connected to {mastodon_instance}")
 
-                numerology = number_to_numerology(value)
+    poster = Poster(
+        mastodon,
+        reserve=mastodon_reserve,
+        digest_below=mastodon_digest_below,
+        digest_delay=mastodon_digest_delay,
+    )
 
-                message = ""
-                if "podcast" in data and data["podcast"]:
-                    message += data["podcast"]
-                if "episode" in data and data["episode"]:
-                    message += f" {data['episode']}"
-                if "ts" in data and data["ts"]:
-                    message += "@ {}".format(
-                        datetime.timedelta(seconds=int(data["ts"]))
-                    )
-                message += "\n\n"
-                message += f"{numerology} {sender} boosted {value} sats"
-                message += "\n\n"
-                if "message" in data and data["message"]:
-                    message += f"\"{data['message'].strip()}\""
-                    message += "\n\n"
-                message += "via {}".format(data.get("app_name", "Unknown"))
-                if "url" in data and data["url"] or "feedID" in data and data["feedID"]:
-                    message += "\n\n"
-                if "url" in data and data["url"]:
-                    message += "{}\n".format(data["url"])
-                if "feedID" in data and data["feedID"]:
-                    message += "https://podcastindex.org/podcast/{}\n".format(
-                        data["feedID"]
-                    )
+    async def send_boost(boost: Boost, behind: bool = False):
+        rendered = render(boost)
+        logging.debug(rendered.status)
+        return await poster.send(rendered.status, rendered.line, boost.value, behind)
 
-                logging.debug(message)
-                await mastodon.create_status(status=message)
+    async def send_many(boosts: List[Boost]):
+        # These piled up behind a full queue, so digest the small ones.
+        digests = set()
+        for boost in boosts:
+            digests.add(await send_boost(boost, behind=True))
+        digests.discard(None)
+        return asyncio.gather(*digests) if digests else None
 
-            except:
-                logging.exception("error")
+    send_boost.send_many = send_many
+    send_boost.drain = poster.drain
+    return send_boost
 
 
 @click.command()
@@ -128,8 +148,20 @@ async def cli(
 @click.option("--lnd-port", type=click.IntRange(0), default=10009)
 @click.option("--lnd-macaroon", type=click.Path(exists=True), default="admin.macaroon")
 @click.option("--lnd-tlscert", type=click.Path(exists=True), default="tls.cert")
+@click.option("--lnd-replay", type=click.Path(exists=True, dir_okay=False))
+@click.option("--lnd-replay-rate", type=click.FloatRange(0), default=0)
+@click.option("--lnd-replay-burst", type=click.IntRange(1), default=1)
+@click.option("--lnd-page-size", type=click.IntRange(1), default=1000)
+@click.option("--lnd-concurrency", type=click.IntRange(1), default=4)
 @click.option("--mastodon-instance")
 @click.option("--mastodon-access-token")
+@click.option("--leaderboard-db", type=click.Path(dir_okay=False))
+@click.option(
+    "--window", type=click.Choice(list(WINDOWS)), default=["week"], multiple=True
+)
+@click.option(
+    "--group-by", type=click.Choice(list(GROUP_BY)), default=["sender"], multiple=True
+)
 @click.pass_context
 @async_cmd
 async def leaderboard(
@@ -138,8 +170,16 @@ async def leaderboard(
     lnd_port,
     lnd_macaroon,
     lnd_tlscert,
+    lnd_replay,
+    lnd_replay_rate,
+    lnd_replay_burst,
+    lnd_page_size,
+    lnd_concurrency,
     mastodon_instance,
     mastodon_access_token,
+    leaderboard_db,
+    window,
+    group_by,
 ):
     ctx.ensure_object(dict)
 
@@ -150,135 +190,77 @@ async def leaderboard(
     logging.debug(resp)
     logging.info(f"Connected to {mastodon_instance}")
 
-    async_lnd = AsyncLNDClient(
-        f"{lnd_host}:{lnd_port}",
-        macaroon_filepath=lnd_macaroon,
-        cert_filepath=lnd_tlscert,
+    async_lnd = lnd_client(
+        lnd_host,
+        lnd_port,
+        lnd_macaroon,
+        lnd_tlscert,
+        lnd_replay,
+        lnd_replay_rate,
+        lnd_replay_burst,
     )
 
-    now = datetime.datetime.now()
-    end = now - datetime.timedelta(weeks=1)
-    print(end)
-
-    async def generate_invoices(end: datetime.datetime):
-        last_date = None
-        index_offset = None
-        while True:
-            response = await async_lnd._ln_stub.ListInvoices(
-                ln.ListInvoiceRequest(
-                    index_offset=index_offset,
-                    reversed=True,
-                    num_max_invoices=100,
-                )
-            )
-            if not response.invoices:
-                break
-            for index, invoice in enumerate(response.invoices):
-                if not invoice.settled:
-                    continue
-                last_date = datetime.datetime.fromtimestamp(invoice.settle_date)
-                if last_date and last_date < end:
-                    continue
-                yield invoice
-            if last_date and last_date < end:
-                break
-
-            index_offset = response.first_index_offset
-
-    leaderboard = collections.defaultdict(lambda: collections.defaultdict(float))
-
-    async for invoice in generate_invoices(end):
-        for tlv in invoice.htlcs:
-            try:
-                data = tlv.custom_records.get(7629169)
-                if data is None:
-                    continue
-
-                data = json.loads(data)
-
-                if "action" not in data or str(data["action"]).lower() != "boost":
-                    continue
-
-                name = data.get("name")
-                if not name:
-                    continue
-
-                if name.lower() != "boostbot":
-                    continue
+    now = int(datetime.datetime.now().timestamp())
+    windows = {name: now - WINDOWS[name] if WINDOWS[name] else None for name in window}
+    since = min(start or 0 for start in windows.values())
+
+    # Without a database the store only lives for this run, so every window
+    # is read from LND; with one, only invoices newer than its last crawl.
+    # Either way the invoices are read once for all the boards.
+    store = LeaderboardStore(leaderboard_db or ":memory:")
+    await crawl(
+        store,
+        async_lnd,
+        since,
+        now,
+        ["boostbot"],
+        page_size=lnd_page_size,
+        concurrency=lnd_concurrency,
+    )
 
-                value = int(data.get("value_msat_total", 0)) // 1000
-                if not value:
-                    value = invoice.value
+    for group in group_by:
+        boards = store.boards(windows, group, ["boostbot"])
+        for name in window:
+            for metric in ("total", "biggest"):
+                message = _board_message(name, metric, group, boards[name][metric])
+                try:
+                    logging.debug(message)
+                    await mastodon.create_status(status=message)
+                except:
+                    logging.exception("error")
 
-                sender = data.get("sender_name")
-                if not sender:
-                    continue
 
-                app_name = data.get("app_name")
-                if not app_name:
-                    continue
+WINDOW_TITLES = {
+    "day": "Last 24 hours",
+    "week": "Last 7 days",
+    "month": "Last 30 days",
+    "all": "All time",
+}
 
-                podcast = data.get("padcast")
+METRIC_TITLES = {
+    "total": "💰 Most Amount Boosted 💰",
+    "biggest": "🔥 Biggest Amount Boosted 🔥",
+}
 
-                leaderboard[(app_name, sender)]["count"] += 1.0
-                leaderboard[(app_name, sender)]["total"] += value
-                if leaderboard[(app_name, sender)]["biggest"] < value:
-                    leaderboard[(app_name, sender)]["biggest"] = value
+PLACES = {1: "🥇", 2: "🥈", 3: "🥉"}
 
-            except:
-                logging.exception("error")
 
+def _board_message(window, metric, group_by, standings) -> str:
     lines = [
-        " 🏆🏆🏆 Leaderboard ~ Last 7 days 🏆🏆🏆",
+        f" 🏆🏆🏆 Leaderboard ~ {WINDOW_TITLES[window]} 🏆🏆🏆",
         "",
-        "      💰 Most Amount Boosted 💰",
+        f"      {METRIC_TITLES[metric]}",
         "",
     ]
-
-    most_amount_boosted = sorted(
-        leaderboard.items(), key=lambda i: i[1]["total"], reverse=True
-    )
-    for index, ((app_name, sender), stats) in enumerate(most_amount_boosted[:10]):
-        place = index + 1
-        if place == 1:
-            place = "🥇"
-        if place == 2:
-            place = "🥈"
-        if place == 3:
-            place = "🥉"
-        lines.append(f" {place} {sender} from {app_name}: {int(stats['total'])}")
-
-    message = "\n".join(lines)
-    try:
-        logging.debug(message)
-        await mastodon.create_status(status=message)
-    except:
-        logging.exception("error")
-
-    lines = [
-        " 🏆🏆🏆 Leaderboard ~ Last 7 days 🏆🏆🏆",
-        "",
-        "      🔥 Biggest Amount Boosted 🔥",
-        "",
-    ]
-
-    biggest_amount_boosted = sorted(
-        leaderboard.items(), key=lambda i: i[1]["biggest"], reverse=True
-    )
-    for index, ((app_name, sender), stats) in enumerate(biggest_amount_boosted[:10]):
-        place = index + 1
-        if place == 1:
-            place = "🥇"
-        if place == 2:
-            place = "🥈"
-        if place == 3:
-            place = "🥉"
-        lines.append(f" {place} {sender} from {app_name}: {int(stats['biggest'])}")
-
-    message = "\n".join(lines)
-
-    try:
-        logging.debug(message)
-        await mastodon.create_status(status=message)
-    except:
-        logging.exception("error")
+    for index, standing in enumerate(standings):
+        place = PLACES.get(index + 1, index + 1)
+        if group_by == "sender":
+            app_name, sender = standing.group
+            label = f"{sender} from {app_name}"
+        elif group_by == "episode":
+            podcast, episode = standing.group
+            label = f"{episode} ({podcast})" if podcast else episode
+        else:
+            (label,) = standing.group
+        lines.append(f" {place} {label or 'Unknown'}: {getattr(standing, metric)}")
+    return "\n".join(lines)
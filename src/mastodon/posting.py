@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+import email.utils
+import logging
+from typing import Callable, List, Optional
+
+import atoot
+
+# Mastodon's default status length limit.
+STATUS_CHARS = 500
+
+DIGEST_HEADER = "⚡ Boosts ⚡"
+
+
+def reset_in(reset: Optional[str], server_date: Optional[str]) -> Optional[float]:
+    """Seconds until an X-RateLimit-Reset, measured against the server's
+    Date header so local clock skew doesn't matter."""
+    if not reset:
+        return None
+    try:
+        reset_at = datetime.datetime.fromisoformat(reset.replace("Z", "+00:00"))
+        if server_date:
+            now = email.utils.parsedate_to_datetime(server_date)
+        else:
+            now = datetime.datetime.now(datetime.timezone.utc)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (reset_at - now).total_seconds())
+
+
+def digest(lines: List[str]) -> str:
+    return "\n".join([DIGEST_HEADER, ""] + lines)
+
+
+class Poster:
+    """Posts statuses within an instance's rate limit.
+
+    atoot records the X-RateLimit-* headers of every response. While more
+    than ``reserve`` statuses remain, every boost is its own status; below
+    that, boosts under ``digest_below`` sats are collected into digest
+    statuses of up to 500 characters, posted when full or ``digest_delay``
+    seconds after the first line. A 429 is retried once the limit resets,
+    or with exponential backoff when the reset time is unknown.
+
+    ``send`` returns a future for a digested line, resolved once its digest
+    has been posted (or failed to post, like any other status), so the
+    checkpoint doesn't move past a boost still waiting in a digest.
+    """
+
+    def __init__(
+        self,
+        api,
+        reserve: int = 30,
+        digest_below: int = 1000,
+        digest_delay: float = 300,
+        max_retry_delay: float = 900,
+        sleep: Callable = asyncio.sleep,
+    ):
+        self.api = api
+        self.reserve = reserve
+        self.digest_below = digest_below
+        self.digest_delay = digest_delay
+        self.max_retry_delay = max_retry_delay
+        self.sleep = sleep
+        self.posted = 0
+        self.digested = 0
+        self._lines = []  # type: List[str]
+        self._digest = None  # type: Optional[asyncio.Future]
+        self._lock = asyncio.Lock()
+        self._flush = None
+
+    @property
+    def remaining(self) -> int:
+        try:
+            return int(self.api.ratelimit_remaining)
+        except (TypeError, ValueError):
+            return self.reserve + 1
+
+    @property
+    def low(self) -> bool:
+        return self.remaining <= self.reserve
+
+    async def send(
+        self, status: str, line: str, value: int, behind: bool = False
+    ) -> Optional[asyncio.Future]:
+        """Post ``status`` now, or ``line`` in a digest when the boost is small
+        and the budget is low (or the caller is ``behind``)."""
+        if value >= self.digest_below or not (self.low or behind):
+            async with self._lock:
+                await self._post(status)
+            return None
+
+        async with self._lock:
+            if self._lines and len(digest(self._lines + [line])) > STATUS_CHARS:
+                await self._post_digest()
+            if len(digest([line])) > STATUS_CHARS:
+                line = line[: STATUS_CHARS - len(digest([""])) - 1] + "…"
+            self._lines.append(line)
+            self.digested += 1
+            if self._digest is None:
+                self._digest = asyncio.get_event_loop().create_future()
+            if self._flush is None:
+                self._flush = asyncio.ensure_future(self._flush_later())
+            return self._digest
+
+    async def flush(self) -> None:
+        async with self._lock:
+            await self._post_digest()
+
+    async def drain(self) -> None:
+        """Post the digest still waiting, if any, without waiting out a rate
+        limit; its lines are left unresolved if it can't be posted."""
+        if self._flush is not None:
+            self._flush.cancel()
+            self._flush = None
+        async with self._lock:
+            await self._post_digest(retry=False)
+
+    async def _flush_later(self) -> None:
+        await self.sleep(self.digest_delay)
+        await self.flush()
+
+    async def _post_digest(self, retry: bool = True) -> None:
+        if self._flush is not None and self._flush is not asyncio.current_task():
+            self._flush.cancel()
+        self._flush = None
+        if not self._lines:
+            return
+        lines, self._lines = self._lines, []
+        posted, self._digest = self._digest, None
+        try:
+            await self._post(digest(lines), retry)
+        except asyncio.CancelledError:
+            raise
+        except atoot.RatelimitError:
+            logging.warning(f"Mastodon rate limited, {len(lines)} boosts not posted")
+            return
+        except Exception as exception:
+            logging.exception(exception)
+        posted.set_result(None)
+
+    async def _post(self, status: str, retry: bool = True) -> None:
+        retry_delay = 1
+        while True:
+            try:
+                await self.api.create_status(status=status)
+                self.posted += 1
+                return
+            except atoot.RatelimitError:
+                if not retry:
+                    raise
+                delay = reset_in(
+                    self.api.ratelimit_reset, self.api.ratelimit_server_date
+                )
+                if delay is None:
+                    delay = retry_delay
+                    retry_delay = min(retry_delay * 2, self.max_retry_delay)
+                delay = min(delay, self.max_retry_delay)
+                logging.warning(f"Mastodon rate limited, retrying in {delay:.0f}s")
+                await self.sleep(delay)
@@ -1,15 +1,19 @@
 import asyncio
 import functools
-import json
 import logging
-from datetime import timedelta
 
 import click
-from lndgrpc import AsyncLNDClient
 from nio import AsyncClient as AsyncMatrixClient
 from nio import LoginError as MatrixLoginError
+from nio import SyncResponse, WhoamiError
 
-from ..numerology import number_to_numerology
+from ..boosts import Boost, Overflow, Sink, dispatch, subscribe_boosts
+from ..checkpoint import Checkpoint
+from ..numerology import load_rules, load_table
+from ..rendering import render
+from ..replay import lnd_client
+from .rooms import RoomSender
+from .session import Session, sync_filter
 
 
 def async_cmd(func):
@@ -27,11 +31,22 @@ def async_cmd(func):
     "--lnd-macaroon", type=click.Path(exists=True), default="readonly.macaroon"
 )
 @click.option("--lnd-tlscert", type=click.Path(exists=True), default="tls.cert")
+@click.option("--lnd-replay", type=click.Path(exists=True, dir_okay=False))
+@click.option("--lnd-replay-rate", type=click.FloatRange(0), default=0)
+@click.option("--lnd-replay-burst", type=click.IntRange(1), default=1)
+@click.option("--lnd-checkpoint", type=click.Path(dir_okay=False))
 @click.option("--matrix-server", default="https://matrix.example.org")
 @click.option("--matrix-user", required=True)
 @click.option("--matrix-password", required=True)
 @click.option("--matrix-room-id", required=True, multiple=True)
+@click.option("--matrix-session", type=click.Path(dir_okay=False))
 @click.option("--minimum-donation", type=int)
+@click.option("--queue-size", type=click.IntRange(1), default=100)
+@click.option(
+    "--queue-overflow", type=click.Choice([x.value for x in Overflow]), default="block"
+)
+@click.option("--numerology-rules", type=click.Path(exists=True, dir_okay=False))
+@click.option("--numerology-table", type=click.Path(exists=True, dir_okay=False))
 @click.option("-v", "--verbose", is_flag=True, help="Enables verbose mode")
 @click.pass_context
 @async_cmd
@@ -41,117 +56,131 @@ async def cli(
     lnd_port,
     lnd_macaroon,
     lnd_tlscert,
+    lnd_replay,
+    lnd_replay_rate,
+    lnd_replay_burst,
+    lnd_checkpoint,
     matrix_server,
     matrix_user,
     matrix_password,
     matrix_room_id,
+    matrix_session,
     minimum_donation,
+    queue_size,
+    queue_overflow,
+    numerology_rules,
+    numerology_table,
     verbose,
 ):
     ctx.ensure_object(dict)
 
+    load_rules(numerology_rules)
+    load_table(numerology_table)
+
     logging.getLogger().setLevel(logging.DEBUG if verbose else logging.INFO)
 
+    async_lnd = lnd_client(
+        lnd_host,
+        lnd_port,
+        lnd_macaroon,
+        lnd_tlscert,
+        lnd_replay,
+        lnd_replay_rate,
+        lnd_replay_burst,
+    )
+
+    sink = await create_sink(
+        matrix_server=matrix_server,
+        matrix_user=matrix_user,
+        matrix_password=matrix_password,
+        matrix_room_id=matrix_room_id,
+        matrix_session=matrix_session,
+    )
+
+    checkpoint = Checkpoint(lnd_checkpoint) if lnd_checkpoint else None
+    boosts = subscribe_boosts(
+        async_lnd, minimum_donation=minimum_donation, checkpoint=checkpoint
+    )
+    await dispatch(boosts, [sink], queue_size, Overflow(queue_overflow), checkpoint)
+
+
+async def create_sink(
+    matrix_server,
+    matrix_user,
+    matrix_password,
+    matrix_room_id,
+    matrix_session=None,
+) -> Sink:
     matrix = AsyncMatrixClient(
         homeserver=matrix_server,
         user=matrix_user,
     )
 
-    resp = await matrix.login(password=matrix_password)
-    if isinstance(resp, MatrixLoginError):
+    session = Session(matrix_session) if matrix_session else None
+    if not (session and await _restore(matrix, session, matrix_server, matrix_user)):
+        resp = await matrix.login(password=matrix_password)
+        if isinstance(resp, MatrixLoginError):
+            logging.debug(resp)
+            raise click.ClickException(f"Matrix login failed: {resp.message}")
         logging.debug(resp)
-        return
-    logging.debug(resp)
-
-    async_lnd = AsyncLNDClient(
-        f"{lnd_host}:{lnd_port}",
-        macaroon_filepath=lnd_macaroon,
-        cert_filepath=lnd_tlscert,
+        if session is not None:
+            session.save(
+                homeserver=matrix_server,
+                user_id=resp.user_id,
+                device_id=resp.device_id,
+                access_token=resp.access_token,
+                next_batch=None,
+            )
+
+    if session is not None:
+        matrix.add_response_callback(
+            lambda response: session.save(next_batch=response.next_batch),
+            SyncResponse,
+        )
+
+    # sync_forever never returns, so it runs once, in the background, and
+    # sends never wait on it.
+    sync = asyncio.ensure_future(
+        matrix.sync_forever(
+            timeout=30000,  # milliseconds
+            sync_filter=sync_filter(matrix_room_id),
+            since=session.next_batch if session is not None else None,
+        )
     )
-
-    invoices = async_lnd.subscribe_invoices()
-    async for invoice in invoices:
-        for tlv in invoice.htlcs:
-            try:
-                data = tlv.custom_records.get(7629169)
-                if data is None:
-                    continue
-
-                data = json.loads(data)
-
-                if "action" not in data or str(data["action"]).lower() != "boost":
-                    continue
-
-                value = int(data.get("value_msat_total", 0)) // 1000
-                if not value:
-                    value = invoice.value
-
-                if minimum_donation is not None and value < minimum_donation:
-                    logging.debug("Donation too low, skipping", data)
-                    continue
-
-                message = _new_message(data, value)
-                logging.debug(message)
-
-                # Send the data to each room
-                for room_id in matrix_room_id:
-                    logging.debug(f"Sending to {room_id}")
-                    await matrix.room_send(
-                        room_id=room_id,
-                        message_type="m.room.message",
-                        content={
-                            "msgtype": "m.text",
-                            "body": message,
-                        },
-                    )
-
-                await matrix.sync_forever(timeout=30000)  # milliseconds
-
-            except:
-                logging.exception("error")
-
-
-def _get(data, key, format_found=None, default=None):
-    if key in data:
-        value = data[key]
-        if value:
-            if format_found is None:
-                return value
-            if callable(format_found):
-                return format_found(key, value)
-            return format_found.format(**{key: value})
-    return default
-
-
-def _new_message(data, value, numerology_func=number_to_numerology):
-
-    amount = f"{value} sats"
-
-    sender = _get(data, "sender_name", default="Anonymous")
-    podcast = _get(data, "podcast", "[{podcast}]")
-    episode = _get(data, "episode", "[{episode}]")
-    message = _get(data, "message", 'saying "{message}"')
-    app = _get(data, "app_name", "via {app_name}")
-    timestamp = _get(data, "ts", lambda _, v: "@{}".format(timedelta(seconds=int(v))))
-
-    numerology = numerology_func(value)
-
-    # Build the data to send to Matrix
-    data = ""
-    if numerology:
-        data += numerology + " "
-    if podcast:
-        data += podcast + " "
-    if episode:
-        data += episode + " "
-    if sender:
-        data += sender + " "
-    data += f"boosted {amount}"
-    if message:
-        data += " " + message
-    if timestamp:
-        data += " " + timestamp
-    if app:
-        data += " " + app
-
-    return data
+    sync.add_done_callback(_sync_stopped)
+
+    sender = RoomSender(matrix, matrix_room_id)
+    sender.start()
+
+    async def send_boost(boost: Boost):
+        rendered = render(boost)
+        logging.debug(rendered.matrix)
+
+        # Queue the message for every room; each room sends on its own.
+        await sender.send(
+            {
+                "msgtype": "m.text",
+                "body": rendered.matrix,
+                "format": "org.matrix.custom.html",
+                "formatted_body": rendered.matrix_html,
+            }
+        )
+
+    return send_boost
+
+
+async def _restore(matrix, session: Session, homeserver: str, user: str) -> bool:
+    if not session.matches(homeserver, user):
+        return False
+    matrix.restore_login(session.user_id, session.device_id, session.access_token)
+    resp = await matrix.whoami()
+    if isinstance(resp, WhoamiError):
+        logging.warning(f"Saved Matrix session rejected, logging in: {resp.message}")
+        return False
+    logging.info(f"Restored Matrix session for device {session.device_id}")
+    return True
+
+
+def _sync_stopped(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f"Matrix sync stopped: {task.exception()!r}")
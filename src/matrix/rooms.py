@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import uuid
+from typing import Callable, Dict, Iterable
+
+from nio import ErrorResponse
+
+LIMIT_EXCEEDED = "M_LIMIT_EXCEEDED"
+
+
+class RoomSender:
+    """Sends messages to Matrix rooms, with one queue and worker per room.
+
+    ``send`` queues a message for every room at once and returns as soon as
+    each room's queue has space, so a slow or rate-limited room holds up only
+    its own messages. Rate-limited sends wait out ``retry_after_ms`` and are
+    retried with the same transaction id, so a retry never posts twice.
+    """
+
+    def __init__(
+        self,
+        client,
+        room_ids: Iterable[str],
+        maxsize: int = 100,
+        max_attempts: int = 5,
+        sleep: Callable = asyncio.sleep,
+    ):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        self.sent = 0
+        self.failed = 0
+        self._queues = {
+            room_id: asyncio.Queue(maxsize) for room_id in room_ids
+        }  # type: Dict[str, asyncio.Queue]
+        self._workers = []
+
+    async def send(self, content: dict) -> None:
+        await asyncio.gather(*(queue.put(content) for queue in self._queues.values()))
+
+    def start(self) -> None:
+        self._workers = [
+            asyncio.ensure_future(self._work(room_id, queue))
+            for room_id, queue in self._queues.items()
+        ]
+
+    async def join(self) -> None:
+        await asyncio.gather(*(queue.join() for queue in self._queues.values()))
+
+    def cancel(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+
+    async def _work(self, room_id: str, queue: asyncio.Queue) -> None:
+        while True:
+            content = await queue.get()
+            try:
+                await self._send(room_id, content)
+            except Exception as exception:
+                self.failed += 1
+                logging.exception(exception)
+            finally:
+                queue.task_done()
+
+    async def _send(self, room_id: str, content: dict) -> None:
+        tx_id = str(uuid.uuid4())
+        retry_delay = 1
+        for _ in range(self.max_attempts):
+            logging.debug(f"Sending to {room_id}")
+            response = await self.client.room_send(
+                room_id=room_id,
+                message_type="m.room.message",
+                content=content,
+                tx_id=tx_id,
+            )
+            if not isinstance(response, ErrorResponse):
+                self.sent += 1
+                return
+            if response.status_code != LIMIT_EXCEEDED:
+                break
+
+            if response.retry_after_ms:
+                delay = response.retry_after_ms / 1000
+            else:
+                delay = retry_delay
+                retry_delay *= 2
+            logging.warning(f"Rate limited sending to {room_id}, retry in {delay}s")
+            await self.sleep(delay)
+
+        self.failed += 1
+        logging.error(f"Failed to send to {room_id}: {response}")
@@ -0,0 +1,72 @@
+import json
+import os
+from typing import Iterable, Optional
+
+
+class Session:
+    """A Matrix login and sync position, persisted to a JSON file.
+
+    Restoring it reuses the device and access token instead of logging in
+    again, and resumes syncing from ``next_batch`` instead of doing a full
+    initial sync.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.homeserver = None  # type: Optional[str]
+        self.user_id = None  # type: Optional[str]
+        self.device_id = None  # type: Optional[str]
+        self.access_token = None  # type: Optional[str]
+        self.next_batch = None  # type: Optional[str]
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            for key in (
+                "homeserver",
+                "user_id",
+                "device_id",
+                "access_token",
+                "next_batch",
+            ):
+                setattr(self, key, state.get(key))
+
+    def matches(self, homeserver: str, user: str) -> bool:
+        """Whether this was saved for ``user`` (a full ID or localpart)."""
+        if not self.access_token or self.homeserver != homeserver:
+            return False
+        return user in (self.user_id, (self.user_id or "")[1:].split(":")[0])
+
+    def save(self, **changes) -> None:
+        for key, value in changes.items():
+            setattr(self, key, value)
+        # Write then rename so a crash never leaves a truncated file behind.
+        # The file holds an access token, so only the owner may read it.
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(
+                {
+                    "homeserver": self.homeserver,
+                    "user_id": self.user_id,
+                    "device_id": self.device_id,
+                    "access_token": self.access_token,
+                    "next_batch": self.next_batch,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+
+
+def sync_filter(room_ids: Iterable[str]) -> dict:
+    """Sync only the bot's rooms, and none of their history or presence."""
+    return {
+        "presence": {"not_types": ["*"]},
+        "account_data": {"not_types": ["*"]},
+        "room": {
+            "rooms": list(room_ids),
+            "timeline": {"limit": 1},
+            "state": {"lazy_load_members": True},
+            "ephemeral": {"not_types": ["*"]},
+            "account_data": {"not_types": ["*"]},
+        },
+    }
@@ -1,23 +1,22 @@
 import asyncio
-import collections
-import datetime
 import functools
-import json
 import logging
-import ssl
-import time
+from typing import List
 
-import atoot
 import click
-from lndgrpc import AsyncLNDClient
-from lndgrpc.aio.async_client import ln
 
 from nostr.event import Event
 from nostr.key import PrivateKey
-from nostr.message_type import ClientMessageType
-from nostr.relay_manager import RelayManager
 
-from ..numerology import number_to_numerology
+from ..boosts import Boost, Overflow, Sink, dispatch, subscribe_boosts
+from ..checkpoint import Checkpoint
+from ..numerology import load_rules, load_table
+from ..rendering import render
+from ..replay import lnd_client
+from .relays import RelayPool
+from .signing import Signer
+
+RELAYS = ["wss://relay.damus.io", "wss://brb.io", "wss://relay.stoner.com"]
 
 
 def async_cmd(func):
@@ -33,8 +32,20 @@ def async_cmd(func):
 @click.option("--lnd-port", type=click.IntRange(0), default=10009)
 @click.option("--lnd-macaroon", type=click.Path(exists=True), default="admin.macaroon")
 @click.option("--lnd-tlscert", type=click.Path(exists=True), default="tls.cert")
+@click.option("--lnd-replay", type=click.Path(exists=True, dir_okay=False))
+@click.option("--lnd-replay-rate", type=click.FloatRange(0), default=0)
+@click.option("--lnd-replay-burst", type=click.IntRange(1), default=1)
+@click.option("--lnd-checkpoint", type=click.Path(dir_okay=False))
 @click.option("--nostr-private-key")
+@click.option("--nostr-relay", multiple=True)
+@click.option("--nostr-quorum", type=click.IntRange(1), default=2)
 @click.option("--minimum-donation", type=int)
+@click.option("--queue-size", type=click.IntRange(1), default=100)
+@click.option(
+    "--queue-overflow", type=click.Choice([x.value for x in Overflow]), default="block"
+)
+@click.option("--numerology-rules", type=click.Path(exists=True, dir_okay=False))
+@click.option("--numerology-table", type=click.Path(exists=True, dir_okay=False))
 @click.option("--allowed-name", multiple=True)
 @click.pass_context
 @async_cmd
@@ -44,21 +55,56 @@ async def cli(
     lnd_port,
     lnd_macaroon,
     lnd_tlscert,
+    lnd_replay,
+    lnd_replay_rate,
+    lnd_replay_burst,
+    lnd_checkpoint,
     nostr_private_key,
+    nostr_relay,
+    nostr_quorum,
     minimum_donation,
+    queue_size,
+    queue_overflow,
+    numerology_rules,
+    numerology_table,
     allowed_name,
 ):
     ctx.ensure_object(dict)
 
+    load_rules(numerology_rules)
+    load_table(numerology_table)
+
     logging.getLogger().setLevel(logging.INFO)
 
+    async_lnd = lnd_client(
+        lnd_host,
+        lnd_port,
+        lnd_macaroon,
+        lnd_tlscert,
+        lnd_replay,
+        lnd_replay_rate,
+        lnd_replay_burst,
+    )
+
+    sink = await create_sink(
+        nostr_private_key=nostr_private_key,
+        nostr_relay=nostr_relay,
+        nostr_quorum=nostr_quorum,
+    )
+
+    checkpoint = Checkpoint(lnd_checkpoint) if lnd_checkpoint else None
+    boosts = subscribe_boosts(async_lnd, allowed_name, minimum_donation, checkpoint)
+    await dispatch(boosts, [sink], queue_size, Overflow(queue_overflow), checkpoint)
+
+
+async def create_sink(nostr_private_key, nostr_relay=(), nostr_quorum=2) -> Sink:
     if nostr_private_key:
         if nostr_private_key.startswith("nsec"):
             keys = PrivateKey.from_nsec(nostr_private_key)
         else:
             keys = PrivateKey(bytes.fromhex(nostr_private_key))
     else:
-        nostr_keys = PrivateKey()
+        keys = PrivateKey()
         logging.info(
             f"Generated Nostr public/private key pair: {keys.bech32()}/{keys.raw_secret.hex()}"
         )
@@ -67,94 +113,29 @@ async def cli(
         f"Using Nostr public key: ${keys.public_key.bech32()}/{keys.public_key.raw_bytes.hex()}"
     )
 
-    relay_manager = RelayManager()
-    relay_manager.add_relay("wss://relay.damus.io")
-    relay_manager.add_relay("wss://brb.io")
-    relay_manager.add_relay("wss://relay.stoner.com")
-    relay_manager.open_connections(
-        {"cert_reqs": ssl.CERT_NONE}
-    )  # NOTE: This disables ssl certificate verification
-    time.sleep(1.25)  # allow the connections to open
-    relay_manager.close_connections()
-
-    async_lnd = AsyncLNDClient(
-        f"{lnd_host}:{lnd_port}",
-        macaroon_filepath=lnd_macaroon,
-        cert_filepath=lnd_tlscert,
-    )
+    # Derive the keys' hex forms once rather than for every event.
+    public_key = keys.public_key.hex()
+    signer = Signer(keys.hex())
+    signer.start()
+
+    # The connections stay open for the life of the bot, so a boost is
+    # published as soon as it arrives.
+    pool = RelayPool(nostr_relay or RELAYS, quorum=nostr_quorum)
+    pool.start()
+
+    async def send_boost(boost: Boost):
+        message = render(boost).status
+        logging.debug(message)
+
+        event = Event(public_key, message)
+        await signer.sign(event)
+
+        if not await pool.publish(event.to_json_object()):
+            logging.error(f"Too few relays accepted {event.id}")
+
+    async def send_many(boosts: List[Boost]):
+        # Sent together, their events are signed in one batch.
+        await asyncio.gather(*(send_boost(boost) for boost in boosts))
 
-    invoices = async_lnd.subscribe_invoices()
-    async for invoice in invoices:
-        for tlv in invoice.htlcs:
-            try:
-                data = tlv.custom_records.get(7629169)
-                if data is None:
-                    continue
-
-                data = json.loads(data)
-
-                if "action" not in data or str(data["action"]).lower() != "boost":
-                    continue
-
-                if allowed_name:
-                    name = data.get("name")
-                    if not name:
-                        continue
-
-                    if name.lower() not in [x.lower() for x in allowed_name]:
-                        continue
-
-                value = int(data.get("value_msat_total", 0)) // 1000
-                if not value:
-                    value = invoice.value
-
-                if minimum_donation is not None and value < minimum_donation:
-                    logging.debug("Donation too low, skipping", data)
-                    continue
-
-                sender = data.get("sender_name", "Anonymous")
-
-                numerology = number_to_numerology(value)
-
-                message = ""
-                if "podcast" in data and data["podcast"]:
-                    message += data["podcast"]
-                if "episode" in data and data["episode"]:
-                    message += f" {data['episode']}"
-                if "ts" in data and data["ts"]:
-                    message += "@ {}".format(
-                        datetime.timedelta(seconds=int(data["ts"]))
-                    )
-                message += "\n\n"
-                message += f"{numerology} {sender} boosted {value} sats"
-                message += "\n\n"
-                if "message" in data and data["message"]:
-                    message += f"\"{data['message'].strip()}\""
-                    message += "\n\n"
-                message += "via {}".format(data.get("app_name", "Unknown"))
-                if "url" in data and data["url"] or "feedID" in data and data["feedID"]:
-                    message += "\n\n"
-                if "url" in data and data["url"]:
-                    message += "{}\n".format(data["url"])
-                if "feedID" in data and data["feedID"]:
-                    message += "https://podcastindex.org/podcast/{}\n".format(
-                        data["feedID"]
-                    )
-
-                logging.debug(message)
-                relay_manager.open_connections(
-                    {"cert_reqs": ssl.CERT_NONE}
-                )  # NOTE: This disables ssl certificate verification
-                time.sleep(1.25)  # allow the connections to open
-
-                event = Event(keys.public_key.hex(), message)
-                event.sign(keys.hex())
-
-                message = json.dumps([ClientMessageType.EVENT, event.to_json_object()])
-                relay_manager.publish_message(message)
-                time.sleep(1)  # allow the messages to send
-
-                relay_manager.close_connections()
-
-            except:
-                logging.exception("error")
+    send_boost.send_many = send_many
+    return send_boost
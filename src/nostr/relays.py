@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+import aiohttp
+
+# Weight of the newest ack in a relay's moving average latency.
+LATENCY_WEIGHT = 0.2
+
+
+class Relay:
+    """A long-lived websocket to one relay.
+
+    ``run`` keeps it connected, reconnecting with exponential backoff, and
+    aiohttp pings it every ``heartbeat`` seconds so dead connections are
+    noticed. ``publish`` sends an event and waits for the relay's ``OK``,
+    keeping track of how long the relay takes and how often it fails.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        heartbeat: float = 30,
+        max_retry_delay: float = 60,
+    ):
+        self.url = url
+        self.heartbeat = heartbeat
+        self.max_retry_delay = max_retry_delay
+        self.connects = 0
+        self.connect_time = None  # type: Optional[float]
+        self.latency = None  # type: Optional[float]
+        self.accepted = 0
+        self.rejected = 0
+        self.failed = 0
+        self._ws = None  # type: Optional[aiohttp.ClientWebSocketResponse]
+        self._connected = asyncio.Event()
+        self._acks = {}  # type: Dict[str, asyncio.Future]
+
+    @property
+    def connected(self) -> bool:
+        return self._connected.is_set()
+
+    async def run(self, session: aiohttp.ClientSession) -> None:
+        loop = asyncio.get_event_loop()
+        retry_delay = 1
+        while True:
+            connecting_at = loop.time()
+            try:
+                async with session.ws_connect(self.url, heartbeat=self.heartbeat) as ws:
+                    self._ws = ws
+                    self.connect_time = loop.time() - connecting_at
+                    self._connected.set()
+                    self.connects += 1
+                    retry_delay = 1
+                    logging.info(f"Connected to {self.url} in {self.connect_time:.2f}s")
+                    async for message in ws:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            self._receive(message.data)
+                        elif message.type == aiohttp.WSMsgType.ERROR:
+                            break
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as exception:
+                logging.warning(f"{self.url}: {exception!r}")
+            finally:
+                self._ws = None
+                self._connected.clear()
+                self._fail(ConnectionError(f"{self.url} disconnected"))
+
+            logging.info(f"Reconnecting to {self.url} in {retry_delay}s")
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, self.max_retry_delay)
+
+    def _receive(self, data: str) -> None:
+        try:
+            message = json.loads(data)
+        except ValueError:
+            logging.warning(f"{self.url} sent invalid JSON: {data[:100]}")
+            return
+        if not isinstance(message, list) or not message:
+            return
+
+        if message[0] == "OK" and len(message) >= 3:
+            future = self._acks.pop(message[1], None)
+            if future is not None and not future.done():
+                future.set_result(bool(message[2]))
+            if not message[2]:
+                logging.warning(f"{self.url} rejected {message[1]}: {message[3:]}")
+        elif message[0] == "NOTICE":
+            logging.info(f"{self.url} notice: {message[1:]}")
+
+    def _fail(self, exception: Exception) -> None:
+        acks, self._acks = self._acks, {}
+        for future in acks.values():
+            if not future.done():
+                future.set_exception(exception)
+
+    async def publish(self, event: dict, timeout: float = 10) -> bool:
+        """Send ``event`` and return whether the relay accepted it."""
+        loop = asyncio.get_event_loop()
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout)
+            future = loop.create_future()
+            self._acks[event["id"]] = future
+            sent_at = loop.time()
+            try:
+                await self._ws.send_str(json.dumps(["EVENT", event]))
+                accepted = await asyncio.wait_for(future, timeout)
+            finally:
+                self._acks.pop(event["id"], None)
+        except (asyncio.TimeoutError, ConnectionError):
+            self.failed += 1
+            raise
+
+        latency = loop.time() - sent_at
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_WEIGHT * (latency - self.latency)
+        if accepted:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+        return accepted
+
+    @property
+    def attempts(self) -> int:
+        return self.accepted + self.rejected + self.failed
+
+    @property
+    def failure_rate(self) -> float:
+        """The share of events this relay rejected or never acked."""
+        if not self.attempts:
+            return 0.0
+        return (self.rejected + self.failed) / self.attempts
+
+
+class RelayPool:
+    """Relays kept connected for the life of the bot.
+
+    Every event goes to every relay at once, and counts as delivered once
+    ``quorum`` of the fast relays accept it. A relay that fails or rejects
+    more than ``max_failure_rate`` of its events, or whose latency is over
+    ``slow_factor`` times the fastest relay's, is demoted: it still gets
+    every event, but its acks are only waited for when the fast relays
+    can't make a quorum. It is promoted again once its numbers recover.
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str],
+        quorum: int = 2,
+        slow_factor: float = 3,
+        max_failure_rate: float = 0.5,
+        min_attempts: int = 5,
+        heartbeat: float = 30,
+    ):
+        self.relays = [Relay(url, heartbeat) for url in urls]
+        self.quorum = quorum
+        self.slow_factor = slow_factor
+        self.max_failure_rate = max_failure_rate
+        self.min_attempts = min_attempts
+        self.demoted = set()  # type: Set[str]
+        self._session = None  # type: Optional[aiohttp.ClientSession]
+        self._tasks = []
+        self._stragglers = set()  # type: Set[asyncio.Future]
+
+    def start(self) -> None:
+        self._session = aiohttp.ClientSession()
+        self._tasks = [
+            asyncio.ensure_future(relay.run(self._session)) for relay in self.relays
+        ]
+
+    async def close(self) -> None:
+        for task in self._tasks + list(self._stragglers):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._stragglers, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+    def fast(self) -> List[Relay]:
+        """The relays that aren't demoted, logging any change."""
+        failing = {
+            relay
+            for relay in self.relays
+            if relay.attempts >= self.min_attempts
+            and relay.failure_rate > self.max_failure_rate
+        }
+        # A relay that rejects everything is quick about it; don't let it
+        # set the pace for the others.
+        fastest = min(
+            (r.latency for r in self.relays if r.latency and r not in failing),
+            default=None,
+        )
+        fast = []
+        for relay in self.relays:
+            slow = relay in failing or (
+                relay.attempts >= self.min_attempts
+                and fastest is not None
+                and relay.latency is not None
+                and relay.latency > self.slow_factor * fastest
+            )
+            if slow and relay.url not in self.demoted:
+                self.demoted.add(relay.url)
+                logging.warning(f"Demoted {relay.url}: {_stats(relay)}")
+            elif not slow and relay.url in self.demoted:
+                self.demoted.discard(relay.url)
+                logging.info(f"Promoted {relay.url}: {_stats(relay)}")
+            if not slow:
+                fast.append(relay)
+        return fast
+
+    async def publish(self, event: dict, timeout: float = 10) -> bool:
+        """Send ``event`` to every relay; whether a quorum accepted it."""
+        fast = self.fast() or self.relays
+        tasks = {
+            relay: asyncio.ensure_future(self._publish(relay, event, timeout))
+            for relay in self.relays
+        }
+        quorum = min(self.quorum, len(self.relays))
+        accepted = 0
+        for relays in (fast, [r for r in self.relays if r not in fast]):
+            pending = {tasks[relay] for relay in relays}
+            while pending and accepted < quorum:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                accepted += sum(task.result() for task in done)
+
+        # The rest keep going, so slow relays still get the event and their
+        # latency is still measured.
+        for task in tasks.values():
+            if not task.done():
+                self._stragglers.add(task)
+                task.add_done_callback(self._stragglers.discard)
+        return accepted >= quorum
+
+    async def _publish(self, relay: Relay, event: dict, timeout: float) -> bool:
+        try:
+            return await relay.publish(event, timeout)
+        except (asyncio.TimeoutError, ConnectionError) as exception:
+            logging.warning(f"Publishing to {relay.url} failed: {exception!r}")
+            return False
+
+
+def _stats(relay: Relay) -> str:
+    latency = "-" if relay.latency is None else f"{relay.latency * 1000:.0f}ms"
+    connect_time = (
+        "-" if relay.connect_time is None else f"{relay.connect_time * 1000:.0f}ms"
+    )
+    return (
+        f"connect {connect_time}, latency {latency}, "
+        f"{relay.failure_rate:.0%} of {relay.attempts} failed"
+    )
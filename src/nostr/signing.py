@@ -0,0 +1,63 @@
+import asyncio
+import concurrent.futures
+from typing import List, Optional, Tuple
+
+
+class Signer:
+    """Signs events in a worker thread instead of on the event loop.
+
+    Events that arrive while a batch is being signed wait for the next one,
+    so a burst of boosts is signed in a few executor calls rather than one
+    call per event.
+    """
+
+    def __init__(
+        self,
+        private_key: str,
+        max_batch: int = 50,
+        executor: Optional[concurrent.futures.Executor] = None,
+    ):
+        self.private_key = private_key
+        self.max_batch = max_batch
+        self.batches = 0
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="nostr-signer"
+        )
+        self._queue = asyncio.Queue()  # type: asyncio.Queue
+        self._worker = None  # type: Optional[asyncio.Future]
+
+    async def sign(self, event) -> None:
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((event, future))
+        await future
+
+    def start(self) -> None:
+        self._worker = asyncio.ensure_future(self._work())
+
+    def cancel(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+
+    async def _work(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]  # type: List[Tuple]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            events = [event for event, _ in batch]
+            try:
+                await loop.run_in_executor(self.executor, self._sign_all, events)
+            except Exception as exception:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exception)
+            else:
+                self.batches += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+    def _sign_all(self, events) -> None:
+        for event in events:
+            event.sign(self.private_key)
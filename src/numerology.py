@@ -1,123 +1,377 @@
+import bisect
+import functools
+import hashlib
+import json
 import math
+import mmap
+import os
 import re
+import struct
+from typing import Iterable, List, Optional
 
-PI = str(math.pi).replace(".", "")
-PI_REGEX_PATTERN = "|".join(PI[:x] for x in range(len(PI) + 1, 3 - 1, -1))
+import click
 
+PI = str(math.pi).replace(".", "")
 COUNTDOWN = "987654321"
-COUNTDOWN_REGEX_PATTEN = "|".join(
-    COUNTDOWN[-n:] for n in range(len(COUNTDOWN), 3 - 1, -1)
-)
-
 COUNTUP = "123456789"
-COUNTUP_REGEX_PATTEN = "|".join(
-    reversed(list(COUNTUP[:n] for n in range(3, len(COUNTDOWN) + 1)))
-)
-
-REGEX_PATTEN = "|".join(
-    (
-        COUNTDOWN_REGEX_PATTEN,
-        COUNTUP_REGEX_PATTEN,
-        r"(?:10)+|11|21|33|69|73|88|420|666|777|1776|1867|30057|9653|[68]00[68]",
-        PI_REGEX_PATTERN,
-    )
-)
-
-REGEX = re.compile(REGEX_PATTEN)
-
-
-def number_to_numerology(number: int) -> str:
-    results = []
-
-    number_str = str(number)
-
-    matches = REGEX.findall(number_str)
-
-    if re.match(r"^1+$", number_str):
-        for _ in range(len(number_str)):
-            results.append("🍆")
-
-    elif re.search(r"^2+$", number_str):
-        for _ in range(len(number_str)):
-            results.append("🦆")
 
+# Amounts are never longer than this (21M BTC is 16 digits of sats), which
+# bounds how far repeating patterns like "(10)+" are expanded.
+MAX_DIGITS = 20
+
+DEFAULT_RULES = {
+    "rules": [
+        {
+            "patterns": [{"suffixes": COUNTDOWN, "min_length": 3}],
+            "emoji": "💥",
+            "count": "len - 2",
+        },
+        {
+            "patterns": [{"prefixes": COUNTUP, "min_length": 3}],
+            "emoji": "🧛",
+            "count": "len - 2",
+        },
+        {
+            "patterns": ["(10)+"],
+            "template": [["🎳", "len // 2"], ["🦃", "len // 2 - 2"]],
+        },
+        {"patterns": ["11"], "emoji": "🎲"},
+        {"patterns": ["21"], "emoji": "🪙"},
+        {"patterns": ["33"], "emoji": "✨"},
+        {"patterns": ["69"], "emoji": "💋"},
+        {"patterns": ["73"], "emoji": "👋"},
+        {"patterns": ["88"], "emoji": "🥰"},
+        {"patterns": ["420"], "emoji": "✌👽💨"},
+        {"patterns": ["666"], "emoji": "😈"},
+        {"patterns": ["777"], "emoji": "😇"},
+        {"patterns": ["1776"], "emoji": "🇺🇸"},
+        {"patterns": ["1867"], "emoji": "🇨🇦"},
+        {"patterns": ["30057"], "emoji": "🔁"},
+        {"patterns": ["9653"], "emoji": "🐺"},
+        {"patterns": ["[68]00[68]"], "emoji": "🎱🎱"},
+        {
+            "patterns": [{"prefixes": PI, "min_length": 3}],
+            "emoji": "🥧",
+            "count": "len - 2",
+        },
+        {"patterns": ["(1)+"], "whole": True, "emoji": "🍆", "count": "len"},
+        {"patterns": ["(2)+"], "whole": True, "emoji": "🦆", "count": "len"},
+    ],
+    "thresholds": [
+        {"below": 10, "emoji": "💩"},
+        {"at_least": 10000, "emoji": "🔥"},
+        {"at_least": 50000, "emoji": "🔥🔥"},
+        {"at_least": 100000, "emoji": "🔥🔥🔥"},
+    ],
+}
+
+COUNT_REGEX = re.compile(r"len(?:\s*//\s*(\d+))?(?:\s*([+-])\s*(\d+))?|(\d+)")
+
+
+def _expand(pattern: str) -> List[str]:
+    """Expand digits, [..] classes and (..)+ groups into literal strings."""
+    literals = [""]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "[":
+            end = pattern.index("]", i)
+            options = list(pattern[i + 1 : end])
+            i = end + 1
+        elif char == "(":
+            end = pattern.index(")", i)
+            group = _expand(pattern[i + 1 : end])
+            i = end + 1
+            options = group
+            if pattern[i : i + 1] == "+":
+                i += 1
+                options, layer = [], group
+                while layer:
+                    options += layer
+                    layer = [a + b for a in layer for b in group]
+                    layer = [x for x in layer if len(x) <= MAX_DIGITS]
+        elif char.isdigit():
+            options = [char]
+            i += 1
+        else:
+            raise ValueError(f"unsupported numerology pattern {pattern!r}")
+
+        literals = [a + b for a in literals for b in options]
+        literals = [x for x in literals if len(x) <= MAX_DIGITS]
+    return literals
+
+
+def _literals(pattern) -> List[str]:
+    if isinstance(pattern, str):
+        return _expand(pattern)
+    min_length = pattern.get("min_length", 1)
+    if "prefixes" in pattern:
+        value = pattern["prefixes"]
+        return [value[:n] for n in range(len(value), min_length - 1, -1)]
+    if "suffixes" in pattern:
+        value = pattern["suffixes"]
+        return [value[-n:] for n in range(len(value), min_length - 1, -1)]
+    raise ValueError(f"unsupported numerology pattern {pattern!r}")
+
+
+def _count(spec: str, length: int) -> int:
+    match = COUNT_REGEX.fullmatch(str(spec).strip())
+    if match is None:
+        raise ValueError(f"unsupported numerology count {spec!r}")
+    divisor, sign, offset, constant = match.groups()
+    if constant is not None:
+        return int(constant)
+    count = length // int(divisor) if divisor else length
+    if offset:
+        count += int(offset) if sign == "+" else -int(offset)
+    return count
+
+
+def _render(rule, literal: str) -> str:
+    template = rule.get("template") or [[rule["emoji"], rule.get("count", "1")]]
+    return "".join(emoji * _count(count, len(literal)) for emoji, count in template)
+
+
+class RuleSet:
+    """A numerology rule set compiled into an Aho-Corasick automaton.
+
+    Every pattern is expanded to literal digit strings with their output
+    rendered up front, so matching costs one transition per digit no matter
+    how many rules there are. Overlapping matches resolve like the regex
+    alternation they replace: leftmost first, then earlier rule, then longest.
+    """
+
+    def __init__(self, config):
+        # Identifies the rules a precomputed table was built with.
+        self.fingerprint = hashlib.sha256(
+            json.dumps(config, sort_keys=True).encode("utf-8")
+        ).digest()[:8]
+        self._whole = {}
+        goto = [{}]
+        outputs = [[]]
+        for rank, rule in enumerate(config["rules"]):
+            for pattern in rule["patterns"]:
+                for literal in _literals(pattern):
+                    if rule.get("whole"):
+                        self._whole.setdefault(literal, _render(rule, literal))
+                        continue
+                    state = 0
+                    for char in literal:
+                        if char not in goto[state]:
+                            goto[state][char] = len(goto)
+                            goto.append({})
+                            outputs.append([])
+                        state = goto[state][char]
+                    if not outputs[state]:
+                        outputs[state].append(
+                            (len(literal), rank, _render(rule, literal))
+                        )
+
+        # Breadth-first fail links, folded into a complete transition table
+        # over the digits and merged outputs.
+        fail = [0] * len(goto)
+        self._delta = [None] * len(goto)
+        self._delta[0] = {digit: goto[0].get(digit, 0) for digit in "0123456789"}
+        queue = list(goto[0].values())
+        while queue:
+            state = queue.pop(0)
+            delta = self._delta[fail[state]]
+            self._delta[state] = {
+                digit: goto[state].get(digit, delta[digit]) for digit in "0123456789"
+            }
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            for char, child in goto[state].items():
+                fail[child] = delta[char]
+                queue.append(child)
+        self._outputs = outputs
+
+        self._thresholds, self._suffixes = self._compile_thresholds(
+            config.get("thresholds", [])
+        )
+        self._digits = functools.lru_cache(maxsize=4096)(self._digits_to_numerology)
+
+    @staticmethod
+    def _compile_thresholds(thresholds):
+        bounds = sorted({x.get("below", x.get("at_least")) for x in thresholds})
+        suffixes = []
+        for number in [bounds[0] - 1 if bounds else 0, *bounds]:
+            below = [x["emoji"] for x in thresholds if number < x.get("below", number)]
+            at_least = [
+                x for x in thresholds if number >= x.get("at_least", number + 1)
+            ]
+            if at_least:
+                below.append(max(at_least, key=lambda x: x["at_least"])["emoji"])
+            suffixes.append("".join(below))
+        return bounds, suffixes
+
+    def _digits_to_numerology(self, number_str: str) -> str:
+        whole = self._whole.get(number_str)
+        if whole is not None:
+            return whole
+
+        best = {}
+        state = 0
+        for end, char in enumerate(number_str, 1):
+            delta = self._delta[state]
+            if char not in delta:
+                state = 0
+                continue
+            state = delta[char]
+            for length, rank, output in self._outputs[state]:
+                start = end - length
+                key = (rank, -length)
+                if start not in best or key < best[start][0]:
+                    best[start] = (key, length, output)
+
+        results = []
+        i = 0
+        while i < len(number_str):
+            if i in best:
+                _, length, output = best[i]
+                results.append(output)
+                i += length
+            else:
+                i += 1
+        return "".join(results)
+
+    def suffix(self, number: int) -> str:
+        return self._suffixes[bisect.bisect_right(self._thresholds, number)]
+
+    def numerology(self, number: int) -> str:
+        return self._digits(str(number)) + self.suffix(number)
+
+    def numerology_many(self, amounts: Iterable[int]) -> List[str]:
+        amounts = [int(amount) for amount in amounts]
+        unique = sorted(set(amounts))
+
+        # unique is sorted, so each threshold splits it into contiguous runs
+        # that share a suffix.
+        bounds = [0]
+        bounds += [bisect.bisect_left(unique, x) for x in self._thresholds]
+        bounds.append(len(unique))
+        numerology = {}
+        for suffix, start, stop in zip(self._suffixes, bounds, bounds[1:]):
+            for number in unique[start:stop]:
+                numerology[number] = self._digits(str(number)) + suffix
+
+        return [numerology[amount] for amount in amounts]
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_rules(key: str) -> RuleSet:
+    return RuleSet(json.loads(key))
+
+
+def compile_rules(config) -> RuleSet:
+    # Identical rule sets share one compiled automaton.
+    return _compile_rules(json.dumps(config, sort_keys=True))
+
+
+def load_rules(path: Optional[str]) -> RuleSet:
+    global _rules
+    if path:
+        with open(path) as f:
+            _rules = compile_rules(json.load(f))
     else:
-        for match in matches:
-
-            if re.search(r"(?:10)+", match):
-                for _ in range(len(match) // 2):
-                    results.append("🎳")
-                for _ in range(len(match) // 2 - 3 + 1):
-                    results.append("🦃")
-
-            if match == "11":
-                results.append("🎲")
-
-            if match == "21":
-                results.append("🪙")
-
-            if match == "33":
-                results.append("✨")
-
-            if match == "69":
-                results.append("💋")
-
-            if match == "73":
-                results.append("👋")
-
-            if match == "88":
-                results.append("🥰")
-
-            if match == "420":
-                results.append("✌👽💨")
-
-            if match == "666":
-                results.append("😈")
-
-            if match == "777":
-                results.append("😇")
-
-            if match == "1776":
-                results.append("🇺🇸")
-
-            if match == "1867":
-                results.append("🇨🇦")
-
-            if match == "9653":
-                results.append("🐺")
-
-            if match == "30057":
-                results.append("🔁")
-
-            if re.search(r"[68]00[68]", match):
-                results.append("🎱")
-                results.append("🎱")
-
-            if re.search(PI_REGEX_PATTERN, match):
-                for _ in range(len(match) - 2):
-                    results.append("🥧")
-
-            if re.search(COUNTDOWN_REGEX_PATTEN, match):
-                for _ in range(len(match) - 2):
-                    results.append("💥")
-
-            if re.search(COUNTUP_REGEX_PATTEN, match):
-                for _ in range(len(match) - 2):
-                    results.append("🧛")
-
-    if number >= 100000:
-        results.append("🔥")
-
-    if number >= 50000:
-        results.append("🔥")
-
-    if number >= 10000:
-        results.append("🔥")
-
-    if number < 10:
-        results.append("💩")
-
-    if not results:
-        return ""
-
-    return "".join(results)
+        _rules = compile_rules(DEFAULT_RULES)
+    return _rules
+
+
+_rules = compile_rules(DEFAULT_RULES)
+
+
+def number_to_numerology(number: int, rules: Optional[RuleSet] = None) -> str:
+    if rules is not None:
+        return rules.numerology(number)
+    if _table is not None:
+        numerology = _table.get(number)
+        if numerology is not None:
+            return numerology
+    return _rules.numerology(number)
+
+
+def number_to_numerology_many(
+    amounts: Iterable[int], rules: Optional[RuleSet] = None
+) -> List[str]:
+    return (rules or _rules).numerology_many(amounts)
+
+
+# Precomputed table layout: a header, count + 1 little-endian uint32 offsets
+# into the blob, then the UTF-8 blob holding every result back to back. The
+# header holds the fingerprint of the rules the table was built with.
+TABLE_MAGIC = b"BBN2"
+TABLE_HEADER = struct.Struct("<4s8sqI")
+TABLE_OFFSETS = struct.Struct("<II")
+
+
+class NumerologyTable:
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.fingerprint, self.start, self.count = TABLE_HEADER.unpack_from(
+            self._mmap
+        )
+        if magic != TABLE_MAGIC:
+            raise ValueError(f"{path} is not a numerology table")
+        self._blob = TABLE_HEADER.size + 4 * (self.count + 1)
+
+    def get(self, number: int) -> Optional[str]:
+        index = number - self.start
+        if not 0 <= index < self.count:
+            return None
+        begin, end = TABLE_OFFSETS.unpack_from(
+            self._mmap, TABLE_HEADER.size + 4 * index
+        )
+        return self._mmap[self._blob + begin : self._blob + end].decode("utf-8")
+
+    def close(self):
+        self._mmap.close()
+
+
+_table = None  # type: Optional[NumerologyTable]
+
+
+def build_table(path: str, stop: int, start: int = 0) -> None:
+    if stop <= start:
+        raise ValueError("stop must be greater than start")
+
+    offsets = [0]
+    blob = bytearray()
+    for number in range(start, stop):
+        blob += _rules.numerology(number).encode("utf-8")
+        offsets.append(len(blob))
+
+    # Write next to the destination and rename so processes that already
+    # mapped the old table keep a consistent view.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(TABLE_HEADER.pack(TABLE_MAGIC, _rules.fingerprint, start, stop - start))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+
+def load_table(path: Optional[str]) -> Optional[NumerologyTable]:
+    global _table
+    if _table is not None:
+        _table.close()
+    _table = None
+    if path:
+        table = NumerologyTable(path)
+        # Otherwise lookups would quietly answer with the table's rules
+        # instead of the ones just loaded.
+        if table.fingerprint != _rules.fingerprint:
+            table.close()
+            raise ValueError(f"{path} was built with different numerology rules")
+        _table = table
+    return _table
+
+
+@click.command()
+@click.option("--start", type=click.IntRange(0), default=0)
+@click.option("--stop", type=click.IntRange(1), default=1000001)
+@click.option("--numerology-rules", type=click.Path(exists=True, dir_okay=False))
+@click.argument("path", type=click.Path(dir_okay=False))
+def table(start, stop, numerology_rules, path):
+    load_rules(numerology_rules)
+    build_table(path, stop, start=start)
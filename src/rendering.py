@@ -0,0 +1,270 @@
+import datetime
+import html
+import operator
+import string
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from .boosts import Boost
+from .numerology import number_to_numerology
+
+# Fields of a boost's data that hold text from the sender's app, and so are
+# escaped for the markup they're rendered into.
+TEXT_FIELDS = frozenset(
+    ("sender", "podcast", "episode", "message", "app", "url", "feed_id")
+)
+
+# One-line layout used by the chat bots. ``{b}``/``{/b}`` mark bold text and
+# ``{n}`` the start of a bold number; each kind of markup fills them in.
+ONE_LINE = (
+    ("numerology", "{numerology}", None),
+    ("podcast", "{b}[{podcast}]{/b}", None),
+    ("episode", "{b}[{episode}]{/b}", None),
+    ("sender", "{sender}", None),
+    (None, "boosted {n}{value}{/b} sats", None),
+    ("message", 'saying "{b}{message}{/b}"', None),
+    ("ts", "@{ts}", None),
+    ("app", "via {app}", None),
+)
+
+# Multi-paragraph layout for Mastodon and Nostr posts.
+STATUS = (
+    ("podcast", "{podcast}", None),
+    ("episode", " {episode}", None),
+    ("ts", "@ {ts}", None),
+    (None, "\n\n{numerology} {sender} boosted {value} sats\n\n", None),
+    ("message", '"{message}"\n\n', None),
+    ("app", "via {app}", "via Unknown"),
+    (("url", "feed_id"), "\n\n", None),
+    ("url", "{url}\n", None),
+    ("feed_id", "https://podcastindex.org/podcast/{feed_id}\n", None),
+)
+
+# A single line of a Mastodon digest.
+LINE = (
+    ("numerology", "{numerology} ", None),
+    (None, "{sender} boosted {value} sats", None),
+    ("podcast", " on {podcast}", None),
+    ("message", ': "{message}"', None),
+)
+
+IRC_MARKUP = {"b": "\x02", "/b": "\x02", "n": "\x02\u200b"}
+HTML_MARKUP = {"b": "<strong>", "/b": "</strong>", "n": "<strong>"}
+PLAIN_MARKUP = {"b": "", "/b": "", "n": ""}
+
+
+# Characters that end or cut short an IRC line.
+_IRC_BREAKS = dict.fromkeys(map(ord, "\r\n\0"))
+
+
+def _irc_text(text: str) -> str:
+    # Some apps send escapes like \u26a1 as literal text.
+    if "\\u" in text:
+        try:
+            text = (
+                text.encode("ascii")
+                .decode("unicode-escape")
+                .encode("utf-16", "surrogatepass")
+                .decode("utf-16")
+            )
+        except UnicodeError:
+            # Non-ASCII text next to the escapes; send it as it came.
+            pass
+    return text.translate(_IRC_BREAKS)
+
+
+class Template:
+    """A layout compiled for one kind of markup.
+
+    A layout is a sequence of ``(condition, template, fallback)`` parts. A
+    part is rendered when any of its condition fields is set (or always,
+    when the condition is None), and ``fallback`` is rendered otherwise.
+    The markup is substituted when the template is built, and the parts are
+    joined into one pattern for each set of fields a boost has, so rendering
+    a boost is a single %-format.
+    """
+
+    def __init__(
+        self,
+        layout: Tuple[Tuple, ...],
+        markup: Dict[str, str],
+        escape: Optional[Callable[[str], str]] = None,
+        joiner: str = "",
+    ):
+        self.escape = escape
+        self.joiner = joiner
+        self.parts = []
+        for condition, template, fallback in layout:
+            if isinstance(condition, str):
+                condition = (condition,)
+            self.parts.append(
+                (
+                    condition,
+                    _apply_markup(template, markup),
+                    fallback and _apply_markup(fallback, markup),
+                )
+            )
+        self._compiled = {}  # type: Dict[FrozenSet[str], Callable]
+
+    def compile(self, present: FrozenSet[str]) -> Callable[[Dict[str, str]], str]:
+        """The renderer for a boost with the ``present`` fields set."""
+        compiled = self._compiled.get(present)
+        if compiled is None:
+            rendered = []
+            for condition, template, fallback in self.parts:
+                if condition is None or not present.isdisjoint(condition):
+                    rendered.append(template)
+                elif fallback:
+                    rendered.append(fallback)
+            compiled = _compile(self.joiner.join(rendered))
+            self._compiled[present] = compiled
+        return compiled
+
+
+def _escaped(
+    fields: Dict[str, str], present: FrozenSet[str], escape: Callable[[str], str]
+) -> Dict[str, str]:
+    escaped = dict(fields)
+    for key in present & TEXT_FIELDS:
+        escaped[key] = escape(fields[key])
+    return escaped
+
+
+def _compile(template: str) -> Callable[[Dict[str, str]], str]:
+    # %-formatting a tuple from an itemgetter is about twice as fast as
+    # str.format_map, and this runs for every format of every boost.
+    pattern = ""
+    names = []
+    for literal, name, _, _ in string.Formatter().parse(template):
+        pattern += literal.replace("%", "%%")
+        if name is not None:
+            pattern += "%s"
+            names.append(name)
+    if not names:
+        text = pattern % ()
+        return lambda fields: text
+    getter = operator.itemgetter(*names)
+    if len(names) == 1:
+        return lambda fields: pattern % (getter(fields),)
+    return lambda fields: pattern % getter(fields)
+
+
+def _apply_markup(template: str, markup: Dict[str, str]) -> str:
+    for key, value in markup.items():
+        template = template.replace(f"{{{key}}}", value)
+    return template
+
+
+class Rendered(NamedTuple):
+    irc: str
+    matrix: str
+    matrix_html: str
+    status: str
+    line: str
+
+
+TEMPLATES = {
+    "irc": Template(ONE_LINE, IRC_MARKUP, _irc_text, joiner=" "),
+    "matrix": Template(ONE_LINE, PLAIN_MARKUP, joiner=" "),
+    "matrix_html": Template(ONE_LINE, HTML_MARKUP, html.escape, joiner=" "),
+    "status": Template(STATUS, PLAIN_MARKUP),
+    "line": Template(LINE, PLAIN_MARKUP),
+}
+
+
+def _get(data, key, format_found=None, default=None):
+    if key in data:
+        value = data[key]
+        if value:
+            if format_found is None:
+                return value
+            if callable(format_found):
+                return format_found(key, value)
+            return format_found.format(**{key: value})
+    return default
+
+
+def _fields(data: dict, value: int, numerology: str) -> Dict[str, str]:
+    """The parts of a boost that messages are built from, each worked out
+    once whatever the number of formats.
+
+    Apps don't always send text fields as strings, so every field is
+    formatted into one before it is escaped or stripped.
+    """
+    return {
+        "numerology": numerology,
+        "value": str(value),
+        "sender": _get(data, "sender_name", "{sender_name}", default="Anonymous"),
+        "podcast": _get(data, "podcast", "{podcast}", default=""),
+        "episode": _get(data, "episode", "{episode}", default=""),
+        "message": _get(data, "message", lambda _, v: str(v).strip(), default=""),
+        "ts": _get(
+            data,
+            "ts",
+            lambda _, v: str(datetime.timedelta(seconds=int(v))),
+            default="",
+        ),
+        "app": _get(data, "app_name", "{app_name}", default=""),
+        "url": _get(data, "url", "{url}", default=""),
+        "feed_id": _get(data, "feedID", "{feedID}", default=""),
+    }
+
+
+# Every format's renderer for each set of fields a boost can have.
+_compiled = {}  # type: Dict[FrozenSet[str], List[Tuple]]
+
+
+def render_data(
+    data: dict, value: int, numerology_func: Callable = number_to_numerology
+) -> Rendered:
+    boost_fields = _fields(data, value, numerology_func(value))
+    present = frozenset(filter(boost_fields.__getitem__, boost_fields))
+    compiled = _compiled.get(present)
+    if compiled is None:
+        compiled = _compiled[present] = [
+            (template.escape, template.compile(present))
+            for template in TEMPLATES.values()
+        ]
+    return Rendered._make(
+        [
+            renderer(
+                _escaped(boost_fields, present, escape) if escape else boost_fields
+            )
+            for escape, renderer in compiled
+        ]
+    )
+
+
+class Renderer:
+    """Renders each boost once for every sink.
+
+    The sinks are handed the same ``Boost``, so the latest ``cache_size``
+    are remembered by identity; the first sink to render a boost pays for
+    its numerology and every format, and the rest look it up.
+    """
+
+    def __init__(self, cache_size: int = 1024):
+        self.cache_size = cache_size
+        self.rendered = 0
+        self._cache = {}  # type: Dict[int, Tuple[Boost, Rendered]]
+
+    def render(self, boost: Boost) -> Rendered:
+        key = id(boost)
+        cached = self._cache.get(key)
+        # Holding on to the boost keeps its id from being reused.
+        if cached is not None and cached[0] is boost:
+            return cached[1]
+
+        rendered = render_data(boost.data, boost.value)
+        self.rendered += 1
+        self._cache[key] = (boost, rendered)
+        if len(self._cache) > self.cache_size:
+            # Boosts reach every sink in order, so the oldest goes first.
+            del self._cache[next(iter(self._cache))]
+        return rendered
+
+
+_renderer = Renderer()
+
+
+def render(boost: Boost) -> Rendered:
+    return _renderer.render(boost)
@@ -0,0 +1,155 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from lndgrpc import AsyncLNDClient
+from lndgrpc.aio.async_client import ln
+
+from .boosts import PODCAST_TLV
+
+
+def load_invoices(path: str) -> List[ln.Invoice]:
+    """Read recorded invoices, one JSON object per line.
+
+    Only the fields the bots use are needed: ``value``, ``settle_date`` and
+    ``htlcs[].custom_records`` (a record may be a JSON string or an object).
+    Missing indexes are numbered by line, and an invoice is settled unless
+    its ``state`` says otherwise (e.g. ``"OPEN"``).
+    """
+    invoices = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            fields = json.loads(line)
+            index = len(invoices) + 1
+
+            htlcs = []
+            for htlc in fields.get("htlcs", []):
+                custom_records = {}
+                for key, record in htlc.get("custom_records", {}).items():
+                    if not isinstance(record, str):
+                        record = json.dumps(record)
+                    custom_records[int(key)] = record.encode("utf-8")
+                htlcs.append(
+                    ln.InvoiceHTLC(
+                        state=htlc.get("state", ln.InvoiceHTLCState.Value("SETTLED")),
+                        amt_msat=htlc.get("amt_msat", fields.get("value", 0) * 1000),
+                        custom_records=custom_records,
+                    )
+                )
+
+            settled = fields.get("state", "SETTLED") == "SETTLED"
+            settle_date = fields.get("settle_date", 0)
+            invoices.append(
+                ln.Invoice(
+                    value=fields.get("value", 0),
+                    settled=settled,
+                    state=ln.Invoice.InvoiceState.Value(fields.get("state", "SETTLED")),
+                    creation_date=fields.get("creation_date", settle_date),
+                    settle_date=settle_date,
+                    add_index=fields.get("add_index", index),
+                    settle_index=fields.get("settle_index", index if settled else 0),
+                    htlcs=htlcs,
+                )
+            )
+    return invoices
+
+
+def boost_invoice(data: dict, value: int, settle_date: int = 0) -> dict:
+    """Build one line of a replay file for a boost with the given TLV data."""
+    return {
+        "value": value,
+        "settle_date": settle_date,
+        "htlcs": [{"custom_records": {str(PODCAST_TLV): data}}],
+    }
+
+
+class FakeLightningStub:
+    """In-memory stand-in for the ``Lightning`` gRPC stub.
+
+    Serves ``ListInvoices`` and ``SubscribeInvoices`` from a list of invoices.
+    The subscription is paced at ``rate`` invoices per second, delivered in
+    bursts of ``burst``; a rate of 0 replays as fast as possible.
+    """
+
+    def __init__(self, invoices: List[ln.Invoice], rate: float = 0, burst: int = 1):
+        self.invoices = sorted(invoices, key=lambda invoice: invoice.add_index)
+        self.rate = rate
+        self.burst = max(1, burst)
+
+    async def ListInvoices(self, request: ln.ListInvoiceRequest):
+        invoices = self.invoices
+        if request.pending_only:
+            invoices = [x for x in invoices if x.state != ln.Invoice.SETTLED]
+        if request.creation_date_start:
+            invoices = [
+                x for x in invoices if x.creation_date >= request.creation_date_start
+            ]
+        if request.creation_date_end:
+            invoices = [
+                x for x in invoices if x.creation_date <= request.creation_date_end
+            ]
+
+        limit = request.num_max_invoices or len(invoices)
+        if request.reversed:
+            if request.index_offset:
+                invoices = [x for x in invoices if x.add_index < request.index_offset]
+            invoices = invoices[-limit:] if limit else []
+        else:
+            invoices = [x for x in invoices if x.add_index > request.index_offset]
+            invoices = invoices[:limit]
+
+        return ln.ListInvoiceResponse(
+            invoices=invoices,
+            first_index_offset=invoices[0].add_index if invoices else 0,
+            last_index_offset=invoices[-1].add_index if invoices else 0,
+        )
+
+    async def SubscribeInvoices(self, request: ln.InvoiceSubscription):
+        invoices = [
+            x
+            for x in self.invoices
+            if (request.settle_index and x.settle_index > request.settle_index)
+            or (request.add_index and x.add_index > request.add_index)
+            or not (request.settle_index or request.add_index)
+        ]
+
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        interval = self.burst / self.rate if self.rate else 0
+        for index, invoice in enumerate(invoices):
+            if interval:
+                delay = start + (index // self.burst) * interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield invoice
+
+
+class ReplayLNDClient:
+    """Drop-in for AsyncLNDClient that talks to a FakeLightningStub."""
+
+    subscribe_invoices = AsyncLNDClient.subscribe_invoices
+    list_invoices = AsyncLNDClient.list_invoices
+
+    def __init__(self, path: str, rate: float = 0, burst: int = 1):
+        self._ln_stub = FakeLightningStub(load_invoices(path), rate=rate, burst=burst)
+
+
+def lnd_client(
+    lnd_host: str,
+    lnd_port: int,
+    lnd_macaroon: str,
+    lnd_tlscert: str,
+    lnd_replay: Optional[str] = None,
+    lnd_replay_rate: float = 0,
+    lnd_replay_burst: int = 1,
+):
+    if lnd_replay:
+        return ReplayLNDClient(lnd_replay, rate=lnd_replay_rate, burst=lnd_replay_burst)
+    return AsyncLNDClient(
+        f"{lnd_host}:{lnd_port}",
+        macaroon_filepath=lnd_macaroon,
+        cert_filepath=lnd_tlscert,
+    )
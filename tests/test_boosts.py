@@ -0,0 +1,406 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import grpc
+import pytest
+from lndgrpc.aio.async_client import ln
+
+from src import boosts
+from src.boosts import Boost, Overflow, SinkQueue, decode_boosts
+from src.checkpoint import Checkpoint
+from src.replay import FakeLightningStub
+
+INVOICE_OPEN = ln.Invoice.InvoiceState.Value("OPEN")
+HTLC_CANCELED = ln.InvoiceHTLCState.Value("CANCELED")
+
+
+def _htlc(data, state=boosts.HTLC_SETTLED):
+    if data is None:
+        return SimpleNamespace(custom_records={}, state=state)
+    return SimpleNamespace(
+        custom_records={boosts.PODCAST_TLV: json.dumps(data)}, state=state
+    )
+
+
+def _invoice(*records, value=100, settle_index=1, state=boosts.INVOICE_SETTLED):
+    return SimpleNamespace(
+        htlcs=[_htlc(data) for data in records],
+        value=value,
+        settle_index=settle_index,
+        state=state,
+    )
+
+
+def test_decode_boosts():
+    invoice = _invoice(
+        None,
+        dict(action="stream", value_msat_total=5000),
+        dict(action="Boost", value_msat_total=5000, sender_name="Ben"),
+        dict(action="boost"),
+    )
+    decoded = list(decode_boosts(invoice))
+    assert decoded == [
+        Boost(
+            dict(action="Boost", value_msat_total=5000, sender_name="Ben"), 5, invoice
+        ),
+        Boost(dict(action="boost"), 100, invoice),
+    ]
+
+
+def test_decode_boosts_invalid_json():
+    invoice = _invoice()
+    invoice.htlcs.append(
+        SimpleNamespace(
+            custom_records={boosts.PODCAST_TLV: "{"}, state=boosts.HTLC_SETTLED
+        )
+    )
+    assert list(decode_boosts(invoice)) == []
+
+
+def test_decode_boosts_filters():
+    invoice = _invoice(
+        dict(action="boost", name="BoostBot", value_msat_total=1000),
+        dict(action="boost", name="Other", value_msat_total=50000),
+        dict(action="boost", value_msat_total=50000),
+        dict(action="boost", name="boostbot", value_msat_total=50000),
+    )
+    decoded = list(decode_boosts(invoice, allowed_name=["BOOSTBOT"]))
+    assert [boost.value for boost in decoded] == [1, 50]
+    decoded = list(decode_boosts(invoice, minimum_donation=10))
+    assert [boost.value for boost in decoded] == [50, 50, 50]
+
+
+def test_decode_boosts_merges_multi_part_payments():
+    data = dict(action="boost", value_msat_total=30000)
+    invoice = _invoice(data, data, data)
+    invoice.htlcs.append(_htlc(dict(action="boost"), state=HTLC_CANCELED))
+    assert [boost.value for boost in decode_boosts(invoice)] == [30]
+
+
+def test_decode_boosts_ignores_unsettled_invoices():
+    invoice = _invoice(dict(action="boost"), state=INVOICE_OPEN)
+    assert list(decode_boosts(invoice)) == []
+
+
+def test_subscribe_boosts_skips_repeated_invoices():
+    first = _invoice(dict(action="boost", value_msat_total=1000), settle_index=1)
+    second = _invoice(dict(action="boost", value_msat_total=2000), settle_index=2)
+    pending = _invoice(dict(action="boost"), settle_index=0, state=INVOICE_OPEN)
+
+    class LND:
+        async def subscribe_invoices(self, add_index=None, settle_index=None):
+            for invoice in (pending, first, first, second, first):
+                yield invoice
+
+    async def collect():
+        return [boost.value async for boost in boosts.subscribe_boosts(LND())]
+
+    assert asyncio.run(collect()) == [1, 2]
+
+
+def test_dispatch_fans_out():
+    invoices = [
+        _invoice(dict(action="boost", value_msat_total=21000), settle_index=1),
+        _invoice(dict(action="boost", value_msat_total=69000), settle_index=2),
+    ]
+
+    class LND:
+        async def subscribe_invoices(self, add_index=None, settle_index=None):
+            for invoice in invoices:
+                yield invoice
+
+    received = []
+
+    async def sink(boost):
+        received.append(boost.value)
+
+    async def broken(boost):
+        raise RuntimeError("sink failed")
+
+    asyncio.run(boosts.dispatch(boosts.subscribe_boosts(LND()), [sink, broken, sink]))
+    assert sorted(received) == [21, 21, 69, 69]
+
+
+def test_checkpoint(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path)
+    assert checkpoint.settle_index == 0
+    checkpoint.save(5)
+    checkpoint.save(3)
+    assert Checkpoint(path).settle_index == 5
+
+
+def test_subscribe_boosts_resumes_from_checkpoint(tmp_path, monkeypatch):
+    invoices = [
+        _invoice(dict(action="boost", value_msat_total=1000 * n), settle_index=n)
+        for n in range(1, 6)
+    ]
+
+    class Dropped(grpc.RpcError):
+        pass
+
+    class LND:
+        calls = []
+
+        async def subscribe_invoices(self, add_index=None, settle_index=None):
+            self.calls.append(settle_index)
+            for invoice in invoices:
+                if invoice.settle_index <= (settle_index or 0):
+                    continue
+                if len(self.calls) == 1 and invoice.settle_index == 4:
+                    raise Dropped()
+                yield invoice
+
+    async def sleep(delay):
+        pass
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    checkpoint.save(1)
+
+    async def collect():
+        return [
+            boost.value
+            async for boost in boosts.subscribe_boosts(LND(), checkpoint=checkpoint)
+        ]
+
+    assert asyncio.run(collect()) == [2, 3, 4, 5]
+    assert LND.calls == [1, 3]
+    assert checkpoint.settle_index == 5
+
+    # Without a checkpoint it resumes from the last invoice it saw.
+    LND.calls.clear()
+
+    async def collect_all():
+        return [boost.value async for boost in boosts.subscribe_boosts(LND())]
+
+    assert asyncio.run(collect_all()) == [1, 2, 3, 4, 5]
+    assert LND.calls == [None, 3]
+
+
+def test_checkpoint_waits_for_every_sink(tmp_path):
+    invoices = [
+        _invoice(dict(action="boost", value_msat_total=21000), settle_index=1),
+        _invoice(dict(action="boost", value_msat_total=69000), settle_index=2),
+        _invoice(dict(action="stream"), settle_index=3),
+    ]
+
+    class LND:
+        async def subscribe_invoices(self, add_index=None, settle_index=None):
+            for invoice in invoices:
+                yield invoice
+
+    path = str(tmp_path / "checkpoint.json")
+    checkpoint = Checkpoint(path)
+
+    async def run():
+        delivered = asyncio.Event()
+
+        async def fast(boost):
+            pass
+
+        async def slow(boost):
+            await delivered.wait()
+
+        stream = boosts.subscribe_boosts(LND(), checkpoint=checkpoint)
+        task = asyncio.ensure_future(
+            boosts.dispatch(stream, [fast, slow], checkpoint=checkpoint)
+        )
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # Nothing is saved while the slow sink still has the first boost.
+        assert Checkpoint(path).settle_index == 0
+        delivered.set()
+        await task
+
+    asyncio.run(run())
+    assert Checkpoint(path).settle_index == 3
+
+
+def test_checkpoint_skips_dropped_boosts(tmp_path):
+    invoices = [
+        _invoice(dict(action="boost", value_msat_total=1000 * n), settle_index=n)
+        for n in range(1, 5)
+    ]
+
+    class LND:
+        async def subscribe_invoices(self, add_index=None, settle_index=None):
+            for invoice in invoices:
+                yield invoice
+
+    received = []
+
+    async def sink(boost):
+        received.append(boost.value)
+
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    stream = boosts.subscribe_boosts(LND(), checkpoint=checkpoint)
+    asyncio.run(boosts.dispatch(stream, [sink], 1, Overflow.DropOldest, checkpoint))
+    assert received == [4]
+    assert checkpoint.settle_index == 4
+
+
+def test_checkpoint_waits_for_pending_delivery(tmp_path):
+    invoices = [
+        _invoice(dict(action="boost", value_msat_total=1000 * n), settle_index=n)
+        for n in range(1, 4)
+    ]
+
+    class LND:
+        async def subscribe_invoices(self, add_index=None, settle_index=None):
+            for invoice in invoices:
+                yield invoice
+
+    async def run(drain):
+        digest = asyncio.get_event_loop().create_future()
+
+        async def sink(boost):
+            # The first boost goes out now, the rest wait on a digest.
+            return digest if boost.value > 1 else None
+
+        async def resolve():
+            digest.set_result(None)
+
+        if drain:
+            sink.drain = resolve
+        checkpoint = Checkpoint(str(tmp_path / f"{drain}.json"))
+        stream = boosts.subscribe_boosts(LND(), checkpoint=checkpoint)
+        await boosts.dispatch(stream, [sink], checkpoint=checkpoint)
+        return checkpoint.settle_index
+
+    assert asyncio.run(run(drain=False)) == 1
+    assert asyncio.run(run(drain=True)) == 3
+
+
+def _boost(value):
+    return Boost({}, value, None)
+
+
+def test_sink_queue_overflow():
+    async def run(overflow):
+        received = []
+        release = asyncio.Event()
+
+        async def sink(boost):
+            await release.wait()
+            received.append(boost.value)
+
+        queue = SinkQueue(sink, maxsize=2, overflow=overflow)
+        queue.start()
+        await queue.put(_boost(1))
+        await asyncio.sleep(0)  # the worker takes 1 and waits on release
+        for value in (2, 3, 4, 5):
+            await queue.put(_boost(value))
+        depth = queue.depth
+        release.set()
+        await queue.join()
+        queue.cancel()
+        return received, depth, queue
+
+    received, depth, queue = asyncio.run(run(Overflow.DropOldest))
+    assert received == [1, 4, 5]
+    assert (depth, queue.dropped) == (2, 2)
+
+    received, depth, queue = asyncio.run(run(Overflow.Coalesce))
+    assert received == [1, 2, 3, 4, 5]
+    assert (depth, queue.coalesced) == (4, 2)
+
+
+def test_sink_queue_blocks():
+    async def run():
+        received = []
+
+        async def sink(boost):
+            await asyncio.sleep(0)
+            received.append(boost.value)
+
+        queue = SinkQueue(sink, maxsize=1)
+        queue.start()
+        for value in range(5):
+            await queue.put(_boost(value))
+            assert queue.depth <= 1
+        await queue.join()
+        queue.cancel()
+        return received
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4]
+
+
+def test_sink_queue_send_many():
+    async def run():
+        batches = []
+        release = asyncio.Event()
+
+        async def sink(boost):
+            await release.wait()
+            batches.append([boost.value])
+
+        async def send_many(boosts):
+            batches.append([boost.value for boost in boosts])
+
+        sink.send_many = send_many
+
+        queue = SinkQueue(sink, maxsize=1, overflow=Overflow.Coalesce)
+        queue.start()
+        for value in range(4):
+            await queue.put(_boost(value))
+            await asyncio.sleep(0)
+        release.set()
+        await queue.join()
+        queue.cancel()
+        return batches
+
+    assert asyncio.run(run()) == [[0], [1, 2, 3]]
+
+
+def test_list_invoices():
+    invoices = [
+        ln.Invoice(add_index=index, creation_date=1000 + index * 10)
+        for index in range(1, 301)
+    ]
+    stub = FakeLightningStub(invoices)
+    in_flight, peak = 0, 0
+    list_page = stub.ListInvoices
+
+    async def ListInvoices(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return await list_page(request)
+
+    stub.ListInvoices = ListInvoices
+    lnd = SimpleNamespace(_ln_stub=stub)
+
+    async def collect(**kwargs):
+        return [x.add_index async for x in boosts.list_invoices(lnd, **kwargs)]
+
+    assert asyncio.run(collect(page_size=7)) == list(range(1, 301))
+    assert asyncio.run(
+        collect(creation_date_start=1500, creation_date_end=3000, page_size=9)
+    ) == list(range(50, 201))
+    assert 1 < peak <= 4
+    assert asyncio.run(
+        collect(
+            creation_date_start=1500,
+            creation_date_end=3000,
+            index_offset=150,
+            concurrency=3,
+        )
+    ) == list(range(151, 201))
+
+
+def test_list_invoices_error():
+    class Stub:
+        async def ListInvoices(self, request):
+            raise grpc.RpcError()
+
+    async def main():
+        async for _ in boosts.list_invoices(SimpleNamespace(_ln_stub=Stub())):
+            pass
+
+    with pytest.raises(grpc.RpcError):
+        asyncio.run(main())
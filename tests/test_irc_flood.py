@@ -0,0 +1,152 @@
+from src.irc import flood
+from src.irc.flood import FloodScheduler, TokenBucket, split_message
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Bot:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, command, **kwargs):
+        self.sent.append((command, kwargs.get("target"), kwargs.get("message")))
+
+
+def test_token_bucket():
+    clock = Clock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    assert bucket.delay() == 0
+    bucket.take()
+    bucket.take()
+    assert bucket.delay() == 0.5
+    clock.now = 0.25
+    assert bucket.delay() == 0.25
+    clock.now = 10
+    bucket.take()
+    bucket.take()
+    bucket.take()
+    assert bucket.delay() == 1
+
+
+def test_scheduler_global_limit():
+    clock, bot = Clock(), Bot()
+    scheduler = FloodScheduler(
+        bot, rate=1, burst=3, target_rate=10, target_burst=10, clock=clock
+    )
+    for n in range(5):
+        scheduler.privmsg("#a", str(n))
+    assert scheduler.depth == 5
+    assert scheduler.poll() == 1
+    assert [message for _, _, message in bot.sent] == ["0", "1", "2"]
+    assert scheduler.depth == 2
+    clock.now = 1
+    assert scheduler.poll() == 1
+    clock.now = 2
+    assert scheduler.poll() is None
+    assert len(bot.sent) == 5
+
+
+def test_scheduler_round_robin():
+    clock, bot = Clock(), Bot()
+    scheduler = FloodScheduler(
+        bot, rate=100, burst=100, target_rate=1, target_burst=2, clock=clock
+    )
+    for n in range(4):
+        scheduler.privmsg("#busy", str(n))
+    scheduler.privmsg("#quiet", "q")
+    assert scheduler.depths() == {"#busy": 4, "#quiet": 1}
+    assert scheduler.poll() == 1
+    assert bot.sent == [
+        ("PRIVMSG", "#busy", "0"),
+        ("PRIVMSG", "#quiet", "q"),
+        ("PRIVMSG", "#busy", "1"),
+    ]
+    assert scheduler.depths() == {"#busy": 2}
+
+
+def test_scheduler_send_charges_global_bucket():
+    clock, bot = Clock(), Bot()
+    scheduler = FloodScheduler(bot, rate=1, burst=2, clock=clock)
+    scheduler.send("JOIN", channel="#a")
+    scheduler.send("JOIN", channel="#b")
+    scheduler.privmsg("#a", "hello")
+    assert scheduler.poll() == 1
+    assert len(bot.sent) == 2
+
+
+def test_parse_max_targets():
+    assert flood.parse_max_targets(["CHANTYPES=#", "NICKLEN=30"]) is None
+    assert flood.parse_max_targets(["MAXTARGETS=4"]) == 4
+    assert flood.parse_max_targets(["TARGMAX=NAMES:1,PRIVMSG:3,NOTICE:3"]) == 3
+    assert flood.parse_max_targets(["MAXTARGETS=4", "TARGMAX=PRIVMSG:,NOTICE:"]) == 512
+
+
+def test_scheduler_batches_targets():
+    clock, bot = Clock(), Bot()
+    scheduler = FloodScheduler(bot, rate=100, burst=100, clock=clock)
+    scheduler.max_targets = 3
+    for channel in ("#a", "#b", "#c", "#d", "#e"):
+        scheduler.privmsg(channel, "boost")
+    scheduler.privmsg("#c", "second")
+    assert scheduler.poll() is None
+    assert bot.sent == [
+        ("PRIVMSG", "#a,#b,#c", "boost"),
+        ("PRIVMSG", "#d,#e", "boost"),
+        ("PRIVMSG", "#c", "second"),
+    ]
+
+
+def test_scheduler_batches_within_line_limit():
+    clock, bot = Clock(), Bot()
+    scheduler = FloodScheduler(bot, rate=100, burst=100, clock=clock)
+    scheduler.max_targets = 100
+    channels = [f"#channel{n:02}" for n in range(40)]
+    for channel in channels:
+        scheduler.privmsg(channel, "x" * 200)
+    scheduler.poll()
+    assert len(bot.sent) > 1
+    for _, targets, message in bot.sent:
+        line = f"PRIVMSG {targets} :{message}\r\n"
+        assert flood.MAX_PREFIX_BYTES + len(line.encode()) <= 512
+    assert sorted(",".join(t for _, t, _ in bot.sent).split(",")) == channels
+
+
+def test_split_message_fits_bytes():
+    message = "🦆🦆🦆 Ünïcödé boosted \x02​2222\x02 sats " + "word " * 80
+    lines = split_message(message, 100)
+    assert all(len(line.encode()) <= 100 for line in lines)
+    assert " ".join(lines) == message.strip()
+
+
+def test_split_message_word_boundaries():
+    assert split_message("one two three", 9) == ["one two", "three"]
+    assert split_message("one  two", 20) == ["one  two"]
+    assert split_message("abcdefghij", 4) == ["abcd", "efgh", "ij"]
+    assert split_message("", 10) == []
+
+
+def test_split_message_reopens_formatting():
+    lines = split_message('saying "\x02one two three\x02" via app', 15)
+    assert lines == ['saying "\x02one', '\x02two three\x02"', "via app"]
+    lines = split_message("\x0304,01red \x1dtext here\x0f plain", 12)
+    assert lines == [
+        "\x0304,01red",
+        "\x0304,01\x1dtext",
+        "\x0304,01\x1dhere\x0f",
+        "plain",
+    ]
+
+
+def test_scheduler_budget():
+    scheduler = FloodScheduler(Bot())
+    overhead = len("PRIVMSG #c :\r\n")
+    assert scheduler.budget("#c") == 512 - flood.MAX_PREFIX_BYTES - overhead
+    scheduler.prefix_bytes = flood.prefix_bytes("bot", "bot!~bot@example.com")
+    assert scheduler.budget("#c") == 512 - len(":bot!~bot@example.com PRIVMSG #c :\r\n")
+    assert flood.prefix_bytes("bot") == len(":bot!") + 10 + 1 + 63 + 1
@@ -0,0 +1,57 @@
+from src.irc.routing import ChannelMapType, ChannelRouter, normalize_url
+
+
+def test_normalize_url():
+    assert normalize_url("https://www.Example.com:443/feed.xml/") == (
+        "example.com/feed.xml"
+    )
+    assert normalize_url("http://example.com/feed?id=1") == "example.com/feed?id=1"
+    assert normalize_url("example.com/feed/") == "example.com/feed"
+
+
+def test_route_default_channels():
+    router = ChannelRouter(default=["#boosts"])
+    assert router.resolve({"podcast": "Show"}) == {"#boosts"}
+    assert router.channels == ("#boosts",)
+
+
+def test_route_exact_matches():
+    router = ChannelRouter(
+        [
+            ("#Show", ChannelMapType.Podcast, " The Show "),
+            ("#feed", "feedId", "920666"),
+            ("#guid", ChannelMapType.Guid, "ABC-123"),
+            ("#show", ChannelMapType.Guid, "abc-123"),
+        ],
+        default=["#boosts"],
+    )
+    assert router.channels == ("#boosts", "#show", "#feed", "#guid")
+    assert router.resolve({"podcast": "the show"}) == {"#boosts", "#show"}
+    assert router.resolve({"feedID": 920666, "guid": "abc-123"}) == {
+        "#boosts",
+        "#feed",
+        "#guid",
+        "#show",
+    }
+    assert router.resolve({"podcast": None, "feedID": ""}) == {"#boosts"}
+
+
+def test_route_url_and_prefix_matches():
+    router = ChannelRouter(
+        [
+            ("#feed", ChannelMapType.Url, "https://example.com/feed.xml"),
+            ("#network", ChannelMapType.Url, "https://example.com/shows/*"),
+            ("#nine", ChannelMapType.FeedId, "9*"),
+        ]
+    )
+    assert router.resolve({"url": "http://www.example.com/feed.xml/"}) == {"#feed"}
+    assert router.resolve({"url": "https://example.com/shows/one/rss"}) == {"#network"}
+    assert router.resolve({"url": "https://example.org/shows/one"}) == set()
+    assert router.resolve({"feedID": 920666}) == {"#nine"}
+    assert router.resolve({"feedID": 290666}) == set()
+
+
+def test_route_url_prefix_keeps_slash():
+    router = ChannelRouter([("#site", ChannelMapType.Url, "https://example.com/*")])
+    assert router.resolve({"url": "https://www.example.com/feed.xml"}) == {"#site"}
+    assert router.resolve({"url": "https://example.community/feed.xml"}) == set()
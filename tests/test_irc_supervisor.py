@@ -0,0 +1,145 @@
+import asyncio
+
+from src.irc.flood import FloodScheduler
+from src.irc.supervisor import Backoff, Supervisor
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Bot:
+    def __init__(self, failures=0):
+        self.sent = []
+        self.failures = failures
+        self.connects = 0
+
+    def send(self, command, **kwargs):
+        self.sent.append((command, kwargs.get("channel") or kwargs.get("target")))
+
+    async def connect(self):
+        self.connects += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionRefusedError("refused")
+
+
+def test_backoff():
+    backoff = Backoff(base=1, cap=10, random=lambda: 1)
+    assert [backoff.delay() for _ in range(6)] == [1, 2, 4, 8, 10, 10]
+    backoff.reset()
+    assert backoff.delay() == 1
+    assert Backoff(base=1, random=lambda: 0.5).delay() == 0.5
+
+
+def test_scheduler_pause_and_bounded_buffer():
+    async def main():
+        bot = Bot()
+        scheduler = FloodScheduler(bot, rate=100, burst=100, maxsize=3)
+        scheduler.pause()
+        for n in range(3):
+            scheduler.privmsg("#a", f"a{n}")
+        scheduler.privmsg("#b", "b0")
+        assert scheduler.poll() is None
+        assert bot.sent == []
+        assert (scheduler.depth, scheduler.dropped) == (3, 1)
+
+        scheduler.resume()
+        scheduler.poll()
+        assert bot.sent == [("PRIVMSG", "#a"), ("PRIVMSG", "#b"), ("PRIVMSG", "#a")]
+        assert scheduler.depth == 0
+
+    asyncio.run(main())
+
+
+def test_supervisor_reconnects_and_replays():
+    async def main():
+        clock, bot = Clock(), Bot(failures=2)
+        scheduler = FloodScheduler(bot, rate=100, burst=100, clock=clock)
+        supervisor = Supervisor(
+            bot,
+            scheduler,
+            ["#a", "#b"],
+            backoff=Backoff(base=0.001, random=lambda: 1),
+            clock=clock,
+        )
+
+        await supervisor.reconnect()
+        assert (bot.connects, supervisor.reconnects) == (3, 1)
+        assert supervisor.backoff.attempts == 3
+
+        scheduler.privmsg("#a", "held")
+        assert scheduler.poll() is None
+
+        join = asyncio.ensure_future(supervisor.join())
+        await asyncio.sleep(0)
+        assert bot.sent == [("JOIN", "#a,#b")]
+        supervisor.joined("#A")
+        assert not join.done()
+        clock.now = 12.5
+        supervisor.joined("#b")
+        await join
+
+        assert supervisor.last_rejoin == 12.5
+        assert supervisor.backoff.attempts == 0
+        scheduler.poll()
+        assert bot.sent[-1] == ("PRIVMSG", "#a")
+
+    asyncio.run(main())
+
+
+def test_supervisor_retries_first_connect_in_background():
+    async def main():
+        bot = Bot(failures=2)
+        scheduler = FloodScheduler(bot)
+        scheduler.pause()
+        supervisor = Supervisor(
+            bot, scheduler, ["#a"], backoff=Backoff(base=0.001, random=lambda: 1)
+        )
+
+        await supervisor.connect()
+        assert (bot.connects, supervisor.reconnects) == (1, 0)
+        await asyncio.sleep(0.05)
+        assert (bot.connects, supervisor.reconnects) == (3, 1)
+        assert scheduler.paused
+
+        await Supervisor(Bot(), scheduler, ["#a"]).connect()
+
+    asyncio.run(main())
+
+
+def test_supervisor_joins_in_paced_lines():
+    async def main():
+        bot = Bot()
+        scheduler = FloodScheduler(bot, rate=100, burst=1)
+        channels = [f"#channel{n:03}" for n in range(100)]
+        supervisor = Supervisor(bot, scheduler, channels, join_timeout=0.01)
+        loop = asyncio.get_event_loop()
+        started = loop.time()
+        await supervisor.join()
+        # Each line waited for a token after the first.
+        assert loop.time() - started >= 0.015
+
+        lines = [channel for command, channel in bot.sent]
+        assert len(lines) == 3
+        assert all(len(f"JOIN {line}\r\n") <= 512 for line in lines)
+        assert ",".join(lines).split(",") == channels
+
+    asyncio.run(main())
+
+
+def test_supervisor_join_timeout():
+    async def main():
+        bot = Bot()
+        scheduler = FloodScheduler(bot)
+        scheduler.pause()
+        supervisor = Supervisor(bot, scheduler, ["#a"], join_timeout=0.01)
+        await supervisor.join()
+        assert not scheduler.paused
+        assert supervisor.last_rejoin is None
+
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from src.boosts import Boost, dispatch
+from src.leaderboard import DAY, LeaderboardStore, Standing, crawl
+from src.replay import ReplayLNDClient, boost_invoice
+
+
+def _boost(sender, value, settle_date, index, app_name="Fountain", **data):
+    data = dict(dict(name="BoostBot", sender_name=sender, app_name=app_name), **data)
+    invoice = SimpleNamespace(
+        settle_index=index, add_index=index, settle_date=settle_date
+    )
+    return Boost(data, value, invoice)
+
+
+def test_standings(tmp_path):
+    store = LeaderboardStore(str(tmp_path / "leaderboard.db"))
+    boosts = [
+        _boost("ben", 100, 10 * DAY, 1),
+        _boost("ben", 50, 10 * DAY + 1, 2),
+        _boost("ann", 120, 11 * DAY, 3, podcast="Show"),
+        _boost("ann", 10, 2 * DAY, 4),
+        _boost("cat", 5000, 12 * DAY, 5, app_name="Breez", name="other"),
+    ]
+    assert store.add_many(boosts) == 5
+    assert store.add_many(boosts[:2]) == 0
+    assert not store.add(_boost("", 1, 10 * DAY, 6))
+
+    assert store.standings(9 * DAY, ["boostbot"]) == [
+        Standing(("Fountain", "ben"), 2, 150, 100),
+        Standing(("Fountain", "ann"), 1, 120, 120),
+    ]
+    assert store.standings(0, ["BoostBot"], order_by="biggest", limit=1) == [
+        Standing(("Fountain", "ann"), 2, 130, 120)
+    ]
+    assert store.standings(0)[0] == Standing(("Breez", "cat"), 1, 5000, 5000)
+    store.close()
+
+    store = LeaderboardStore(str(tmp_path / "leaderboard.db"))
+    assert len(store.standings(0)) == 3
+
+
+def test_store_as_sink(tmp_path):
+    store = LeaderboardStore(str(tmp_path / "leaderboard.db"))
+
+    async def boosts():
+        for index in range(1, 4):
+            yield _boost("ben", 10, DAY, index)
+
+    asyncio.run(dispatch(boosts(), [store]))
+    assert store.standings(0) == [Standing(("Fountain", "ben"), 3, 30, 10)]
+
+
+def test_crawl(tmp_path):
+    path = tmp_path / "invoices.jsonl"
+    with open(path, "w") as f:
+        for n in range(1, 6):
+            data = dict(
+                action="boost",
+                name="BoostBot",
+                sender_name="ben",
+                app_name="Fountain",
+                value_msat_total=n * 1000,
+            )
+            f.write(json.dumps(boost_invoice(data, n, settle_date=DAY + n)) + "\n")
+    lnd = ReplayLNDClient(str(path))
+
+    store = LeaderboardStore(str(tmp_path / "leaderboard.db"))
+    # A boost the live bot added must not hide the older ones from the crawl.
+    store.add(_boost("ann", 10, DAY + 10, 10))
+    assert store.crawled(DAY) == 0
+    assert asyncio.run(crawl(store, lnd, DAY, 2 * DAY, ["boostbot"])) == 5
+    assert store.crawled(DAY) == 5
+    assert asyncio.run(crawl(store, lnd, DAY, 2 * DAY, ["boostbot"])) == 0
+    assert store.standings(0)[0] == Standing(("Fountain", "ben"), 5, 15, 5)
+
+    # A crawl reaching further back starts over.
+    assert store.crawled(DAY - 1) == 0
+
+
+def test_crawl_rereads_unsettled_invoices(tmp_path):
+    path = tmp_path / "invoices.jsonl"
+
+    def write(state):
+        with open(path, "w") as f:
+            for n in range(1, 4):
+                data = dict(action="boost", sender_name="ben", app_name="Fountain")
+                invoice = boost_invoice(data, 1, settle_date=DAY + n)
+                invoice["creation_date"] = DAY
+                if n == 2:
+                    invoice["state"] = state
+                f.write(json.dumps(invoice) + "\n")
+        return ReplayLNDClient(str(path))
+
+    store = LeaderboardStore(str(tmp_path / "leaderboard.db"))
+    assert asyncio.run(crawl(store, write("OPEN"), DAY, 2 * DAY)) == 2
+    assert store.crawled(DAY) == 1
+
+    # The invoice settles before the next crawl, which picks it up.
+    assert asyncio.run(crawl(store, write("SETTLED"), DAY, 2 * DAY)) == 1
+    assert store.crawled(DAY) == 3
+    assert store.standings(0)[0].count == 3
+
+
+def test_boards(tmp_path):
+    store = LeaderboardStore(str(tmp_path / "leaderboard.db"))
+    store.add_many(
+        [
+            _boost("ben", 100, 40 * DAY, 1, podcast="A", episode="1"),
+            _boost("ann", 300, 45 * DAY, 2, podcast="A", episode="2"),
+            _boost("ann", 200, 49 * DAY + 1, 3, podcast="B", episode="1"),
+            _boost("ben", 50, 49 * DAY + 2, 4, podcast="A", episode="2"),
+            _boost("ben", 75, 49 * DAY + 3, 5, podcast="A", episode="2"),
+        ]
+    )
+    windows = {"day": 49 * DAY, "week": 43 * DAY, "all": None}
+
+    boards = store.boards(windows, limit=1)
+    assert boards["day"]["total"] == [Standing(("Fountain", "ann"), 1, 200, 200)]
+    assert boards["day"]["count"] == [Standing(("Fountain", "ben"), 2, 125, 75)]
+    assert boards["week"]["biggest"] == [Standing(("Fountain", "ann"), 2, 500, 300)]
+    assert boards["all"]["count"] == [Standing(("Fountain", "ben"), 3, 225, 100)]
+
+    boards = store.boards(windows, group_by="podcast")
+    assert boards["day"]["total"] == [
+        Standing(("B",), 1, 200, 200),
+        Standing(("A",), 2, 125, 75),
+    ]
+    assert boards["all"]["total"][0] == Standing(("A",), 4, 525, 300)
+
+    boards = store.boards({"week": 43 * DAY}, group_by="episode", names=["boostbot"])
+    assert [x.group for x in boards["week"]["total"]] == [("A", "2"), ("B", "1")]
+    assert store.boards({"day": 50 * DAY})["day"]["total"] == []
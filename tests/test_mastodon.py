@@ -0,0 +1,166 @@
+import asyncio
+
+import atoot
+
+from src.leaderboard import Standing
+from src.mastodon import _board_message, posting
+from src.mastodon.posting import Poster, digest, reset_in
+
+
+def test_board_message():
+    standings = [
+        Standing(("Fountain", "ben"), 2, 150, 100),
+        Standing(("Breez", "ann"), 1, 120, 120),
+        Standing(("Fountain", "cat"), 1, 20, 20),
+        Standing(("Castamatic", "dan"), 1, 10, 10),
+    ]
+    assert _board_message("week", "total", "sender", standings) == "\n".join(
+        [
+            " 🏆🏆🏆 Leaderboard ~ Last 7 days 🏆🏆🏆",
+            "",
+            "      💰 Most Amount Boosted 💰",
+            "",
+            " 🥇 ben from Fountain: 150",
+            " 🥈 ann from Breez: 120",
+            " 🥉 cat from Fountain: 20",
+            " 4 dan from Castamatic: 10",
+        ]
+    )
+
+
+def test_board_message_groups():
+    message = _board_message(
+        "all",
+        "biggest",
+        "episode",
+        [Standing(("Show", "Ep 1"), 1, 5, 5), Standing(("", ""), 1, 1, 1)],
+    )
+    assert message.splitlines()[0] == " 🏆🏆🏆 Leaderboard ~ All time 🏆🏆🏆"
+    assert message.splitlines()[2] == "      🔥 Biggest Amount Boosted 🔥"
+    assert message.splitlines()[4:] == [" 🥇 Ep 1 (Show): 5", " 🥈 Unknown: 1"]
+    message = _board_message("day", "total", "podcast", [Standing(("Show",), 1, 5, 5)])
+    assert message.splitlines()[4] == " 🥇 Show: 5"
+
+
+class Api:
+    def __init__(self, remaining=300, fail=0):
+        self.ratelimit_remaining = str(remaining)
+        self.ratelimit_reset = "2023-01-01T12:00:30.000Z"
+        self.ratelimit_server_date = "Sun, 01 Jan 2023 12:00:00 GMT"
+        self.statuses = []
+        self.fail = fail
+
+    async def create_status(self, status):
+        if self.fail:
+            self.fail -= 1
+            raise atoot.RatelimitError("429")
+        self.statuses.append(status)
+
+
+def test_reset_in():
+    api = Api()
+    assert reset_in(api.ratelimit_reset, api.ratelimit_server_date) == 30
+    assert reset_in(None, api.ratelimit_server_date) is None
+    assert reset_in("garbage", None) is None
+
+
+def test_poster_posts_each_boost_with_budget():
+    async def main():
+        api = Api(remaining=100)
+        poster = Poster(api, reserve=30)
+        await poster.send("status one", "line one", 10)
+        await poster.send("status two", "line two", 10)
+        assert api.statuses == ["status one", "status two"]
+
+    asyncio.run(main())
+
+
+def test_poster_digests_small_boosts_when_low():
+    async def main():
+        api = Api(remaining=5)
+        poster = Poster(api, reserve=30, digest_below=1000, digest_delay=60)
+        await poster.send("big status", "big line", 5000)
+        for n in range(30):
+            await poster.send(f"status {n}", f"🦆 boost number {n:02} " * 2, 10)
+        assert api.statuses[0] == "big status"
+        assert all(len(status) <= posting.STATUS_CHARS for status in api.statuses)
+        assert len(api.statuses) == 3
+
+        await poster.flush()
+        assert len(api.statuses) == 4
+        assert api.statuses[-1].startswith(posting.DIGEST_HEADER)
+        assert sum(status.count("boost number") for status in api.statuses) == 60
+        assert poster.digested == 30
+
+        await poster.send("s", "x" * 600, 10)
+        await poster.flush()
+        assert len(api.statuses[-1]) == posting.STATUS_CHARS
+        await poster.send("s", "behind", 10, behind=True)
+        api.ratelimit_remaining = "299"
+        await poster.send("s", "behind", 10, behind=True)
+        await poster.flush()
+        assert api.statuses[-1] == digest(["behind", "behind"])
+
+    asyncio.run(main())
+
+
+def test_poster_flushes_after_delay():
+    async def main():
+        api = Api(remaining=0)
+        poster = Poster(api, digest_delay=0.01)
+        await poster.send("status", "line", 1)
+        assert api.statuses == []
+        await asyncio.sleep(0.05)
+        assert api.statuses == [digest(["line"])]
+
+    asyncio.run(main())
+
+
+def test_poster_resolves_digested_lines_once_posted():
+    async def main():
+        api = Api(remaining=0)
+        poster = Poster(api)
+        assert await poster.send("big status", "big line", 5000) is None
+        first = await poster.send("status", "one", 1)
+        assert await poster.send("status", "two", 1) is first
+        assert not first.done()
+        await poster.flush()
+        assert first.done()
+
+        second = await poster.send("status", "three", 1)
+        assert second is not first
+        await poster.drain()
+        assert second.done()
+        assert api.statuses[-1] == digest(["three"])
+
+        # Closing doesn't wait out a rate limit, and leaves the line pending.
+        api.fail = 1
+        third = await poster.send("status", "four", 1)
+        await poster.drain()
+        assert not third.done()
+        assert api.statuses[-1] == digest(["three"])
+
+    asyncio.run(main())
+
+
+def test_poster_retries_rate_limit():
+    async def main():
+        delays = []
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        api = Api(fail=2)
+        poster = Poster(api, sleep=sleep)
+        await poster.send("status", "line", 1)
+        assert api.statuses == ["status"]
+        assert delays == [30, 30]
+
+        api = Api(fail=3)
+        api.ratelimit_reset = None
+        poster = Poster(api, sleep=sleep)
+        delays.clear()
+        await poster.send("status", "line", 1)
+        assert delays == [1, 2, 4]
+
+    asyncio.run(main())
@@ -1,54 +1,137 @@
-from unittest.mock import sentinel
-
-from src.matrix import _get, _new_message
-
-
-def test_get():
-    data = {"a": sentinel.value}
-    assert _get(data, "a") is sentinel.value
-    assert _get(data, "a", "={a}=") == f"={sentinel.value}="
-    assert _get(data, "a", lambda k, v: f"{k}={v}") == f"a={sentinel.value}"
-    assert _get(data, "b") is None
-    assert _get(data, "b", "={a}=") is None
-    assert _get(data, "b", lambda k, v: f"{k}={v}") is None
-    assert _get(data, "b", default=sentinel.default) is sentinel.default
-    assert _get(data, "b", "={a}=", default=sentinel.default) is sentinel.default
-    assert (
-        _get(data, "b", lambda k, v: f"{k}={v}", default=sentinel.default)
-        is sentinel.default
-    )
+import asyncio
+import os
+import stat
+
+from nio import RoomSendError, RoomSendResponse, WhoamiError, WhoamiResponse
+
+from src.matrix import _restore
+from src.matrix.rooms import RoomSender
+from src.matrix.session import Session, sync_filter
+
+
+class Client:
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.sent = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def room_send(self, room_id, message_type, content, tx_id):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(0)
+        self.in_flight -= 1
+        if self.responses:
+            return self.responses.pop(0)
+        self.sent.append((room_id, content["body"], tx_id))
+        return RoomSendResponse("$event", room_id)
+
+
+def test_room_sender_sends_rooms_concurrently():
+    async def main():
+        client = Client()
+        sender = RoomSender(client, ["!a", "!b", "!c"], maxsize=2)
+        sender.start()
+        for n in range(10):
+            await sender.send({"msgtype": "m.text", "body": str(n)})
+        await sender.join()
+        sender.cancel()
+
+        assert client.peak == 3
+        assert sender.sent == 30
+        for room_id in ("!a", "!b", "!c"):
+            bodies = [body for room, body, _ in client.sent if room == room_id]
+            assert bodies == [str(n) for n in range(10)]
+
+    asyncio.run(main())
+
+
+def test_room_sender_retries_rate_limit():
+    async def main():
+        delays = []
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        limited = RoomSendError("Too many requests", "M_LIMIT_EXCEEDED", 1500)
+        client = Client([limited, limited])
+        sender = RoomSender(client, ["!a"], sleep=sleep)
+        sender.start()
+        await sender.send({"msgtype": "m.text", "body": "boost"})
+        await sender.join()
+        sender.cancel()
 
+        assert delays == [1.5, 1.5]
+        assert [body for _, body, _ in client.sent] == ["boost"]
+        assert (sender.sent, sender.failed) == (1, 0)
 
-def test_new_message_all():
-    data = dict(
-        sender_name="Ben",
-        podcast="Boost Bots",
-        episode="#0 Hello World",
-        message="That was amazing",
-        app_name="BoostCLI",
-        ts="1000",
+        client = Client([RoomSendError("Forbidden", "M_FORBIDDEN")])
+        sender = RoomSender(client, ["!a"], sleep=sleep)
+        sender.start()
+        await sender.send({"msgtype": "m.text", "body": "boost"})
+        await sender.join()
+        sender.cancel()
+        assert (sender.sent, sender.failed, client.sent) == (0, 1, [])
+
+    asyncio.run(main())
+
+
+def test_session(tmp_path):
+    path = str(tmp_path / "session.json")
+    session = Session(path)
+    assert session.access_token is None
+    assert not session.matches("https://matrix.org", "bot")
+
+    session.save(
+        homeserver="https://matrix.org",
+        user_id="@bot:matrix.org",
+        device_id="DEVICE",
+        access_token="token",
     )
-    m = _new_message(data, 1234)
-    assert (
-        m
-        == '🧛🧛 [Boost Bots] [#0 Hello World] Ben boosted 1234 sats saying "That was amazing" @0:16:40 via BoostCLI'
+    session.save(next_batch="s1_2_3")
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    session = Session(path)
+    assert (session.device_id, session.next_batch) == ("DEVICE", "s1_2_3")
+    assert session.matches("https://matrix.org", "bot")
+    assert session.matches("https://matrix.org", "@bot:matrix.org")
+    assert not session.matches("https://matrix.org", "other")
+    assert not session.matches("https://example.org", "bot")
+
+
+def test_sync_filter():
+    room = sync_filter(["!a:matrix.org"])["room"]
+    assert room["rooms"] == ["!a:matrix.org"]
+    assert room["timeline"] == {"limit": 1}
+
+
+def test_restore_session(tmp_path):
+    class Matrix:
+        def __init__(self, response):
+            self.response = response
+            self.restored = None
+
+        def restore_login(self, user_id, device_id, access_token):
+            self.restored = (user_id, device_id, access_token)
+
+        async def whoami(self):
+            return self.response
+
+    session = Session(str(tmp_path / "session.json"))
+    session.save(
+        homeserver="https://matrix.org",
+        user_id="@bot:matrix.org",
+        device_id="DEVICE",
+        access_token="token",
     )
 
+    matrix = Matrix(WhoamiResponse("@bot:matrix.org", "DEVICE", False))
+    assert asyncio.run(_restore(matrix, session, "https://matrix.org", "bot"))
+    assert matrix.restored == ("@bot:matrix.org", "DEVICE", "token")
+
+    matrix = Matrix(WhoamiError("Unknown token", "M_UNKNOWN_TOKEN"))
+    assert not asyncio.run(_restore(matrix, session, "https://matrix.org", "bot"))
 
-def test_new_message_parts():
-    m = _new_message(dict(), 1234)
-    assert m == "🧛🧛 Anonymous boosted 1234 sats"
-    m = _new_message(dict(sender_name="Ben"), 1234)
-    assert m == "🧛🧛 Ben boosted 1234 sats"
-    m = _new_message(dict(podcast="Boost Bots"), 1234)
-    assert m == "🧛🧛 [Boost Bots] Anonymous boosted 1234 sats"
-    m = _new_message(dict(episode="#0 Hello World"), 1234)
-    assert m == "🧛🧛 [#0 Hello World] Anonymous boosted 1234 sats"
-    m = _new_message(dict(episode="#0 Hello World"), 1234)
-    assert m == "🧛🧛 [#0 Hello World] Anonymous boosted 1234 sats"
-    m = _new_message(dict(message="That was amazing!!!"), 1234)
-    assert m == '🧛🧛 Anonymous boosted 1234 sats saying "That was amazing!!!"'
-    m = _new_message(dict(app_name="BoostCLI"), 1234)
-    assert m == "🧛🧛 Anonymous boosted 1234 sats via BoostCLI"
-    m = _new_message(dict(ts="1000"), 1234)
-    assert m == "🧛🧛 Anonymous boosted 1234 sats @0:16:40"
+    matrix = Matrix(None)
+    assert not asyncio.run(_restore(matrix, session, "https://matrix.org", "other"))
+    assert matrix.restored is None
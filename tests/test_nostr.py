@@ -0,0 +1,202 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from aiohttp import web
+
+from src.nostr.relays import RelayPool
+from src.nostr.signing import Signer
+
+
+class LocalRelay:
+    """A stand-in relay that acks every EVENT after ``delay`` seconds,
+    optionally dropping the first connection without an answer."""
+
+    def __init__(self, accept=True, delay=0, drop_first=False):
+        self.accept = accept
+        self.delay = delay
+        self.drop_first = drop_first
+        self.received = []
+        self.connections = 0
+        self.url = None
+        self._runner = None
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/", self._handler)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        (port,) = [s.getsockname()[1] for s in site._server.sockets]
+        self.url = f"ws://127.0.0.1:{port}/"
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._runner.cleanup()
+
+    async def _handler(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        async for message in ws:
+            kind, event = json.loads(message.data)
+            self.received.append(event["id"])
+            if self.drop_first and self.connections == 1:
+                await ws.close()
+                break
+            asyncio.ensure_future(self._ack(ws, event))
+        return ws
+
+    async def _ack(self, ws, event):
+        await asyncio.sleep(self.delay)
+        await ws.send_str(json.dumps(["OK", event["id"], self.accept, ""]))
+
+
+def test_pool_publish_waits_for_ok():
+    async def run():
+        async with LocalRelay() as relay, LocalRelay(accept=False) as rejecting:
+            pool = RelayPool([relay.url, rejecting.url], quorum=1)
+            pool.start()
+            try:
+                for index in range(3):
+                    assert await pool.publish({"id": str(index)}, timeout=5)
+                pool.quorum = 2
+                assert not await pool.publish({"id": "3"}, timeout=5)
+                # Let the acks that came after a quorum arrive.
+                await asyncio.sleep(0.1)
+            finally:
+                await pool.close()
+        assert relay.received == ["0", "1", "2", "3"]
+        # One connection for every event.
+        assert relay.connections == 1
+        accepting, rejecting = pool.relays
+        assert (accepting.accepted, accepting.rejected, accepting.failed) == (4, 0, 0)
+        assert (rejecting.accepted, rejecting.rejected, rejecting.failed) == (0, 4, 0)
+        assert rejecting.failure_rate == 1
+        assert accepting.connect_time is not None
+        assert accepting.latency is not None
+
+    asyncio.run(run())
+
+
+def test_relay_reconnects():
+    async def run():
+        async with LocalRelay(drop_first=True) as relay:
+            pool = RelayPool([relay.url], quorum=1)
+            pool.start()
+            try:
+                assert not await pool.publish({"id": "lost"}, timeout=5)
+                assert await pool.publish({"id": "sent"}, timeout=5)
+            finally:
+                await pool.close()
+        assert pool.relays[0].connects == 2
+        assert relay.received == ["lost", "sent"]
+
+    asyncio.run(run())
+
+
+def test_relay_unreachable():
+    async def run():
+        pool = RelayPool(["ws://127.0.0.1:9/"])
+        (relay,) = pool.relays
+        pool.start()
+        try:
+            assert not await pool.publish({"id": "x"}, timeout=0.2)
+        finally:
+            await pool.close()
+        assert not relay.connected
+        assert relay.failed == 1
+
+    asyncio.run(run())
+
+
+def test_slow_relay_demoted():
+    async def run():
+        async with LocalRelay() as fast, LocalRelay(delay=0.3) as slow:
+            pool = RelayPool([fast.url, slow.url], quorum=1, min_attempts=2)
+            pool.start()
+            try:
+                loop = asyncio.get_event_loop()
+                for index in range(3):
+                    started = loop.time()
+                    assert await pool.publish({"id": str(index)}, timeout=5)
+                    # Delivered on the fast relay's ack alone.
+                    assert loop.time() - started < 0.3
+                await asyncio.sleep(0.4)
+                assert pool.fast() == [pool.relays[0]]
+                assert pool.demoted == {slow.url}
+            finally:
+                await pool.close()
+        # Demoted relays still get every event.
+        assert slow.received == ["0", "1", "2"]
+
+    asyncio.run(run())
+
+
+def test_demoted_relays_make_up_quorum():
+    async def run():
+        async with LocalRelay(accept=False) as demoted, LocalRelay() as fast:
+            pool = RelayPool([demoted.url, fast.url], quorum=1, min_attempts=1)
+            pool.start()
+            try:
+                assert await pool.publish({"id": "0"}, timeout=5)
+                demoted.accept, fast.accept = True, False
+                assert pool.fast() == [pool.relays[1]]
+                assert await pool.publish({"id": "1"}, timeout=5)
+                # Both have failed once in two attempts now.
+                assert len(pool.fast()) == 2
+            finally:
+                await pool.close()
+
+    asyncio.run(run())
+
+
+class FakeEvent:
+    def __init__(self):
+        self.signature = None
+        self.thread = None
+
+    def sign(self, private_key):
+        self.signature = f"signed by {private_key}"
+        self.thread = threading.current_thread()
+
+
+def test_signer_signs_off_the_loop_in_batches():
+    async def run():
+        signer = Signer("key", max_batch=3)
+        signer.start()
+        try:
+            events = [FakeEvent() for _ in range(5)]
+            await asyncio.gather(*(signer.sign(event) for event in events))
+            await signer.sign(FakeEvent())
+        finally:
+            signer.cancel()
+        for event in events:
+            assert event.signature == "signed by key"
+            assert event.thread is not threading.current_thread()
+        # The burst of five in batches of up to three, then the last alone.
+        assert signer.batches == 3
+
+    asyncio.run(run())
+
+
+def test_signer_error():
+    class BrokenEvent:
+        def sign(self, private_key):
+            raise ValueError("bad key")
+
+    async def run():
+        signer = Signer("key")
+        signer.start()
+        try:
+            with pytest.raises(ValueError):
+                await signer.sign(BrokenEvent())
+            event = FakeEvent()
+            await signer.sign(event)
+        finally:
+            signer.cancel()
+        assert event.signature == "signed by key"
+
+    asyncio.run(run())
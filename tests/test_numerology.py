@@ -1,6 +1,7 @@
 import pytest
 
-from src.numerology import number_to_numerology
+from src import numerology
+from src.numerology import build_table, compile_rules, number_to_numerology
 
 
 def test_bowler_donations():
@@ -143,3 +144,81 @@ def test_combinations():
     assert number_to_numerology(10321) == "🎳💥🔥"
     assert number_to_numerology(32121) == "💥🪙🔥"
     assert number_to_numerology(2130057) == "🪙🔁🔥🔥🔥"
+
+
+def test_number_to_numerology_many():
+    amounts = [1, 2, 9, 10, 69, 69, 9999, 10000, 49999, 50000, 99999, 100000, 696969]
+    assert numerology.number_to_numerology_many(amounts) == [
+        number_to_numerology(amount) for amount in amounts
+    ]
+    assert numerology.number_to_numerology_many(iter([21, 21])) == ["🪙", "🪙"]
+    assert numerology.number_to_numerology_many([]) == []
+
+
+def test_numerology_table(tmp_path, monkeypatch):
+    path = str(tmp_path / "numerology.table")
+    build_table(path, 1000, start=5)
+    table = numerology.NumerologyTable(path)
+    try:
+        assert table.get(4) is None
+        assert table.get(1000) is None
+        for number in (5, 9, 10, 69, 420, 999):
+            assert table.get(number) == number_to_numerology(number)
+
+        monkeypatch.setattr(numerology, "_table", table)
+        assert number_to_numerology(420) == "✌👽💨"
+        assert number_to_numerology(696969) == "💋💋💋🔥🔥🔥"
+    finally:
+        table.close()
+
+
+def test_table_built_with_other_rules(tmp_path, monkeypatch):
+    path = str(tmp_path / "numerology.table")
+    build_table(path, 100)
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text('{"rules": [{"patterns": ["42"], "emoji": "🐟"}]}')
+
+    monkeypatch.setattr(numerology, "_table", None)
+    monkeypatch.setattr(numerology, "_rules", numerology._rules)
+    assert numerology.load_table(path) is not None
+    numerology.load_rules(str(rules_path))
+    with pytest.raises(ValueError):
+        numerology.load_table(path)
+    assert number_to_numerology(42) == "🐟"
+
+
+def test_build_table_empty_range(tmp_path):
+    with pytest.raises(ValueError):
+        build_table(str(tmp_path / "numerology.table"), 10, start=10)
+
+
+def test_custom_rules():
+    rules = compile_rules(
+        {
+            "rules": [
+                {"patterns": ["42"], "emoji": "🐟"},
+                {"patterns": ["4[12]"], "emoji": "🚫"},
+                {"patterns": ["(13)+"], "template": [["🐈", "len // 2"], ["⬛", "1"]]},
+                {"patterns": [{"prefixes": "2718", "min_length": 3}], "emoji": "e"},
+                {"patterns": ["(7)+"], "whole": True, "emoji": "🍀", "count": "len"},
+            ],
+            "thresholds": [{"at_least": 1000, "emoji": "💰"}],
+        }
+    )
+    assert number_to_numerology(42, rules) == "🐟"
+    assert number_to_numerology(4142, rules) == "🚫🐟💰"
+    assert number_to_numerology(131313, rules) == "🐈🐈🐈⬛💰"
+    assert number_to_numerology(27182, rules) == "e💰"
+    assert number_to_numerology(777, rules) == "🍀🍀🍀"
+    assert number_to_numerology(5, rules) == ""
+    many = numerology.number_to_numerology_many([42, 7, 42], rules)
+    assert many == ["🐟", "🍀", "🐟"]
+    config = numerology.DEFAULT_RULES
+    assert compile_rules(config) is compile_rules(config)
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError):
+        compile_rules({"rules": [{"patterns": ["4?"], "emoji": "🚫"}]})
+    with pytest.raises(ValueError):
+        compile_rules({"rules": [{"patterns": ["4"], "emoji": "🚫", "count": "x"}]})
@@ -0,0 +1,160 @@
+from unittest.mock import sentinel
+
+from src.boosts import Boost
+from src.rendering import Renderer, _get, render_data
+
+ALL = dict(
+    sender_name="Ben",
+    podcast="Boost Bots",
+    episode="#0 Hello World",
+    message="That was amazing",
+    app_name="BoostCLI",
+    ts="1000",
+)
+
+# Boosts with one field each, shared with benchmarks/rendering.py.
+PARTS = [
+    dict(),
+    dict(sender_name="Ben"),
+    dict(podcast="Boost Bots"),
+    dict(episode="#0 Hello World"),
+    dict(message="That was amazing!!!"),
+    dict(app_name="BoostCLI"),
+    dict(ts="1000"),
+]
+
+
+def test_get():
+    data = {"a": sentinel.value}
+    assert _get(data, "a") is sentinel.value
+    assert _get(data, "a", "={a}=") == f"={sentinel.value}="
+    assert _get(data, "a", lambda k, v: f"{k}={v}") == f"a={sentinel.value}"
+    assert _get(data, "b") is None
+    assert _get(data, "b", "={a}=") is None
+    assert _get(data, "b", lambda k, v: f"{k}={v}") is None
+    assert _get(data, "b", default=sentinel.default) is sentinel.default
+    assert _get(data, "b", "={a}=", default=sentinel.default) is sentinel.default
+    assert (
+        _get(data, "b", lambda k, v: f"{k}={v}", default=sentinel.default)
+        is sentinel.default
+    )
+
+
+def test_irc_all():
+    m = render_data(ALL, 1234).irc
+    assert (
+        m
+        == '🧛🧛 \x02[Boost Bots]\x02 \x02[#0 Hello World]\x02 Ben boosted \x02\u200b1234\x02 sats saying "\x02That was amazing\x02" @0:16:40 via BoostCLI'
+    )
+
+
+def test_irc_parts():
+    assert [render_data(data, 1234).irc for data in PARTS] == [
+        "🧛🧛 Anonymous boosted \x02\u200b1234\x02 sats",
+        "🧛🧛 Ben boosted \x02\u200b1234\x02 sats",
+        "🧛🧛 \x02[Boost Bots]\x02 Anonymous boosted \x02\u200b1234\x02 sats",
+        "🧛🧛 \x02[#0 Hello World]\x02 Anonymous boosted \x02\u200b1234\x02 sats",
+        '🧛🧛 Anonymous boosted \x02\u200b1234\x02 sats saying "\x02That was amazing!!!\x02"',
+        "🧛🧛 Anonymous boosted \x02\u200b1234\x02 sats via BoostCLI",
+        "🧛🧛 Anonymous boosted \x02\u200b1234\x02 sats @0:16:40",
+    ]
+
+
+def test_irc_sanitized():
+    m = render_data(dict(message="Two\nlines"), 1234).irc
+    assert (
+        m == '🧛🧛 Anonymous boosted \x02\u200b1234\x02 sats saying "\x02Twolines\x02"'
+    )
+    m = render_data(dict(message="Two\r\nli\0nes"), 1234).irc
+    assert (
+        m == '🧛🧛 Anonymous boosted \x02\u200b1234\x02 sats saying "\x02Twolines\x02"'
+    )
+    m = render_data(dict(sender_name="Zap \\u26a1"), 1234).irc
+    assert m == "🧛🧛 Zap ⚡ boosted \x02\u200b1234\x02 sats"
+
+    # Escapes next to non-ASCII text are left alone, in IRC and elsewhere.
+    rendered = render_data(dict(sender_name="Zoë \\u26a1"), 1234)
+    assert rendered.irc == "🧛🧛 Zoë \\u26a1 boosted \x02\u200b1234\x02 sats"
+    assert rendered.matrix == "🧛🧛 Zoë \\u26a1 boosted 1234 sats"
+    assert rendered.status == "\n\n🧛🧛 Zoë \\u26a1 boosted 1234 sats\n\nvia Unknown"
+
+
+def test_numeric_fields():
+    data = dict(podcast=123, episode=7, message=5, app_name=1, sender_name=2)
+    rendered = render_data(data, 10, lambda value: "")
+    assert rendered.irc == (
+        '\x02[123]\x02 \x02[7]\x02 2 boosted \x02\u200b10\x02 sats saying "\x025\x02" via 1'
+    )
+    assert rendered.matrix == '[123] [7] 2 boosted 10 sats saying "5" via 1'
+    assert rendered.matrix_html == (
+        "<strong>[123]</strong> <strong>[7]</strong> 2 boosted "
+        '<strong>10</strong> sats saying "<strong>5</strong>" via 1'
+    )
+    assert rendered.status == '123 7\n\n 2 boosted 10 sats\n\n"5"\n\nvia 1'
+    assert rendered.line == '2 boosted 10 sats on 123: "5"'
+
+
+def test_matrix_all():
+    m = render_data(ALL, 1234).matrix
+    assert (
+        m
+        == '🧛🧛 [Boost Bots] [#0 Hello World] Ben boosted 1234 sats saying "That was amazing" @0:16:40 via BoostCLI'
+    )
+
+
+def test_matrix_parts():
+    assert [render_data(data, 1234).matrix for data in PARTS] == [
+        "🧛🧛 Anonymous boosted 1234 sats",
+        "🧛🧛 Ben boosted 1234 sats",
+        "🧛🧛 [Boost Bots] Anonymous boosted 1234 sats",
+        "🧛🧛 [#0 Hello World] Anonymous boosted 1234 sats",
+        '🧛🧛 Anonymous boosted 1234 sats saying "That was amazing!!!"',
+        "🧛🧛 Anonymous boosted 1234 sats via BoostCLI",
+        "🧛🧛 Anonymous boosted 1234 sats @0:16:40",
+    ]
+
+
+def test_matrix_html():
+    m = render_data(dict(ALL, sender_name="<Ben & Co>"), 1234).matrix_html
+    assert (
+        m
+        == '🧛🧛 <strong>[Boost Bots]</strong> <strong>[#0 Hello World]</strong> &lt;Ben &amp; Co&gt; boosted <strong>1234</strong> sats saying "<strong>That was amazing</strong>" @0:16:40 via BoostCLI'
+    )
+
+
+def test_status():
+    data = dict(ALL, message=" That was amazing\n", url="https://example.com")
+    data["feedID"] = 920666
+    m = render_data(data, 1234).status
+    assert m == (
+        "Boost Bots #0 Hello World@ 0:16:40\n\n"
+        "🧛🧛 Ben boosted 1234 sats\n\n"
+        '"That was amazing"\n\n'
+        "via BoostCLI\n\n"
+        "https://example.com\n"
+        "https://podcastindex.org/podcast/920666\n"
+    )
+    m = render_data(dict(), 1234).status
+    assert m == "\n\n🧛🧛 Anonymous boosted 1234 sats\n\nvia Unknown"
+
+
+def test_line():
+    m = render_data(ALL, 1234).line
+    assert m == '🧛🧛 Ben boosted 1234 sats on Boost Bots: "That was amazing"'
+    m = render_data(dict(), 1234, lambda value: "").line
+    assert m == "Anonymous boosted 1234 sats"
+
+
+def test_rendered_once_per_boost():
+    renderer = Renderer(cache_size=1)
+    boost = Boost(ALL, 1234, None)
+    first = renderer.render(boost)
+    assert renderer.render(boost) is first
+    assert renderer.rendered == 1
+
+    # An equal boost is a different boost.
+    other = Boost(dict(ALL), 1234, None)
+    assert renderer.render(other) == first
+    assert renderer.rendered == 2
+    renderer.render(boost)
+    assert renderer.rendered == 3
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from lndgrpc.aio.async_client import ln
+
+from src.boosts import subscribe_boosts
+from src.checkpoint import Checkpoint
+from src.replay import ReplayLNDClient, boost_invoice, load_invoices
+
+
+def _write(tmp_path, count):
+    path = tmp_path / "invoices.jsonl"
+    with open(path, "w") as f:
+        for n in range(1, count + 1):
+            data = dict(
+                action="boost", sender_name=f"Ben{n}", value_msat_total=n * 1000
+            )
+            f.write(json.dumps(boost_invoice(data, n, settle_date=1000 + n)) + "\n")
+        f.write("\n")
+    return str(path)
+
+
+def test_load_invoices(tmp_path):
+    invoices = load_invoices(_write(tmp_path, 2))
+    assert [x.settle_index for x in invoices] == [1, 2]
+    assert [x.settle_date for x in invoices] == [1001, 1002]
+    assert invoices[0].state == ln.Invoice.SETTLED
+    record = json.loads(invoices[1].htlcs[0].custom_records[7629169])
+    assert record["sender_name"] == "Ben2"
+
+
+def test_replay_subscription_resumes(tmp_path):
+    lnd = ReplayLNDClient(_write(tmp_path, 5))
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    checkpoint.save(3)
+
+    async def collect():
+        return [
+            boost.data["sender_name"]
+            async for boost in subscribe_boosts(lnd, checkpoint=checkpoint)
+        ]
+
+    assert asyncio.run(collect()) == ["Ben4", "Ben5"]
+    assert checkpoint.settle_index == 5
+
+
+def test_replay_rate(tmp_path, monkeypatch):
+    lnd = ReplayLNDClient(_write(tmp_path, 6), rate=100, burst=2)
+    delays = []
+
+    async def sleep(delay):
+        delays.append(round(delay, 2))
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+
+    async def collect():
+        return [invoice async for invoice in lnd.subscribe_invoices()]
+
+    assert len(asyncio.run(collect())) == 6
+    # Bursts of two, 20ms apart; the fake sleep never advances the clock.
+    assert delays == [0.02, 0.02, 0.04, 0.04]
+
+
+def test_list_invoices(tmp_path):
+    lnd = ReplayLNDClient(_write(tmp_path, 5))
+
+    async def page(**kwargs):
+        return await lnd._ln_stub.ListInvoices(ln.ListInvoiceRequest(**kwargs))
+
+    response = asyncio.run(page(reversed=True, num_max_invoices=2))
+    assert [x.add_index for x in response.invoices] == [4, 5]
+    assert response.first_index_offset == 4
+    response = asyncio.run(page(reversed=True, num_max_invoices=2, index_offset=4))
+    assert [x.add_index for x in response.invoices] == [2, 3]
+    response = asyncio.run(page(index_offset=3))
+    assert [x.add_index for x in response.invoices] == [4, 5]
+    response = asyncio.run(page(creation_date_start=1002, creation_date_end=1003))
+    assert [x.add_index for x in response.invoices] == [2, 3]